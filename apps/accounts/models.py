@@ -16,6 +16,7 @@ import requests
 
 from adwords.adapter import Adapter
 from adwords.exceptions import TooEarlyError
+from adwords.registry import registry
 from billing.models import Payment
 from billing.utils import get_pricing
 from reports.utils import decimal_to_micro_amount, micro_amount_to_decimal
@@ -90,11 +91,17 @@ class User(AbstractBaseUser, PermissionsMixin):
         verbose_name_plural = _('users')
 
     def set_adwords_fields(self, refresh_token, client_customer_id):
+        if self.refresh_token is not None:
+            registry.invalidate(self.refresh_token)
+
         self.refresh_token = refresh_token
         self.client_customer_id = client_customer_id
         self.save()        
 
     def reset_adwords_fields(self):
+        if self.refresh_token is not None:
+            registry.invalidate(self.refresh_token)
+
         self.refresh_token = None
         self.client_customer_id = ''
         self.save()
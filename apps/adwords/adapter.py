@@ -1,27 +1,31 @@
-# TODO:  Loading services in serial has poor performance, especially
-# when doing it more than once.  Can we cache them globally somehow?
-# They won't change per user without the server resetting, so
-# repeatedly loading the endpoint info is wasteful.
-
 from collections import defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 import csv
 import datetime
+import gzip
+import io
 import logging
 from decimal import Decimal
 from functools import wraps
+from itertools import islice
 from urllib.error import HTTPError
 from xml.etree import ElementTree
 
 from django.conf import settings
-from django.db import connection
-from django.db.utils import OperationalError
+from django.db.models import OuterRef, Subquery, Sum
 
 from campaign_modifiers.models import KeywordEvent
-from reports.models import Campaign
+from reports.models import Campaign, DailyCampaignStats, MetricsSync
 from reports.utils import decimal_to_micro_amount
-from website.utils import get_adwords_client
 
+from .columnar import KeywordColumns
 from .exceptions import NonManagerAccountSelected, UserNotLinkedError
+from .instrumentation import CountingReader, instrumentation
+from .mutations import KeywordMutationBuffer
+from .registry import registry
+from .report_cache import get_report_expiry, report_cache
+from .scheduler import scheduler
 
 
 ALL_TIME = 'ALL_TIME'
@@ -32,8 +36,28 @@ CAMPAIGNS_ALL = 'CAMPAIGNS_ALL'
 CAMPAIGNS_MANAGED = 'CAMPAIGNS_MANAGED'
 CAMPAIGNS_UNMANAGED = 'CAMPAIGNS_UNMANAGED'
 
+# Where report data comes from: the AdWords API, the daily stats copied
+# into the database by the `reports.sync_metrics` task, or those for the
+# days they hold and the API for the rest.
+BACKEND_API = 'api'
+BACKEND_LOCAL = 'local'
+BACKEND_SYNCED = 'synced'
+
 logger = logging.getLogger('adwords.adapter')
 
+# A report for `fetch_reports_concurrently` to download with
+# `adapter.get_report`.  `key` is anything that tells the caller which
+# report a result is for.
+ReportRequest = namedtuple(
+    'ReportRequest',
+    ('key', 'adapter', 'name', 'report_type', 'date_range_type', 'selector', 'options'),
+)
+ReportRequest.__new__.__defaults__ = (None, )
+
+# A downloaded report's rows, or the exception raised downloading it.
+ReportResult = namedtuple('ReportResult', ('request', 'rows', 'error'))
+
+
 def _require_linked_account(func):
     @wraps(func)
     def inner(self, *args, **kwargs):
@@ -72,6 +96,7 @@ class Adapter:
     def __init__(self, user):
         self._user = user
         self._cached_values = {}
+        self._mutation_buffer = None
         self.is_dry_run = user.is_adwords_dry_run
 
     @property
@@ -149,21 +174,29 @@ class Adapter:
         }
 
         try:
-            self._cached_values['conversion_trackers'] = adwords_service.get(selector).entries
+            self._cached_values['conversion_trackers'] = self.call_api(
+                adwords_service.get, selector).entries
         except AttributeError:
             self._cached_values['conversion_trackers'] = []
 
         return self._cached_values['conversion_trackers']
 
-    def get_adwords_service(self, service_name):
-        adwords_client = self.get_adwords_client()
+    def call_api(self, func, *args, **kwargs):
+        """
+        Call `func`, an AdWords API method, through the scheduler that
+        keeps every worker within the API's rate limits.
+        """
+        return scheduler.call(self._user.client_customer_id, func, *args, **kwargs)
+
+    def get_adwords_service(self, service_name, partial_failure=False):
+        adwords_client = self.get_adwords_client(partial_failure)
 
-        return adwords_client.GetService(service_name, version=self.adwords_api_version)
+        return registry.get_service(adwords_client, service_name, self.adwords_api_version)
 
     def get_report_downloader(self):
-        report_downloader = self.get_adwords_client()
+        adwords_client = self.get_adwords_client()
 
-        return report_downloader.GetReportDownloader(version=self.adwords_api_version)
+        return registry.get_report_downloader(adwords_client, self.adwords_api_version)
 
     def get_report(
             self,
@@ -177,33 +210,155 @@ class Adapter:
             'reportName': name,
             'reportType': report_type,
             'dateRangeType': date_range_type,
-            'downloadFormat': 'CSV',
+            'downloadFormat': 'GZIPPED_CSV',
             'selector': selector,
         }
+
+        call = instrumentation.start('report', report_type, self._user.client_customer_id)
+
+        if settings.ADWORDS_REPORT_CACHE_ENABLED:
+            response, is_cached = self._get_cached_report(parameters, include_zero_impressions)
+            if call is not None and is_cached:
+                # Read from the report cache, not the API.
+                call.kind = 'cache'
+        else:
+            response = self._download_report(parameters, include_zero_impressions)
+
+        if call is not None:
+            response = CountingReader(response)
+
+        # Decompress and decode incrementally as `csv` reads, so only a
+        # buffer's worth of the report is held in memory at once.
+        report = csv.reader(io.TextIOWrapper(
+            gzip.GzipFile(fileobj=response, mode='rb'),
+            encoding='utf-8',
+            newline='',
+        ))
+
+        if skip_headers:
+            next(report)
+
+        if call is None:
+            return (row for row in report if row)
+
+        return self._measure_report(report, response, call)
+
+    @staticmethod
+    def _measure_report(report, response, call):
+        try:
+            for row in report:
+                if row:
+                    call.rows += 1
+                    yield row
+        finally:
+            call.bytes = response.bytes_read
+            instrumentation.finish(call)
+
+    @staticmethod
+    def fetch_reports_concurrently(requests, max_workers=None):
+        """
+        Download the reports for `requests`, which may be for different
+        users' adapters, with up to `max_workers` (by default
+        `ADWORDS_REPORT_CONCURRENCY`) at once.  Yield a `ReportResult`
+        for each as soon as it has been read in, in the order they
+        finish.  `requests` is consumed only as workers free up.
+
+        Downloads are still made through the API call scheduler, so
+        this can't exceed the rate limits.
+        """
+        if max_workers is None:
+            max_workers = settings.ADWORDS_REPORT_CONCURRENCY
+
+        def fetch(request):
+            rows = list(request.adapter.get_report(
+                request.name,
+                request.report_type,
+                request.date_range_type,
+                request.selector,
+                **(request.options or {})
+            ))
+            return ReportResult(request, rows, None)
+
+        requests = iter(requests)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {}
+            while True:
+                for request in islice(requests, max_workers - len(pending)):
+                    pending[executor.submit(fetch, request)] = request
+
+                if not pending:
+                    break
+
+                done, _not_done = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    request = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = ReportResult(request, None, e)
+                    yield result
+
+    def _download_report(self, parameters, include_zero_impressions):
         report_downloader = self.get_report_downloader()
-        response = report_downloader.DownloadReportAsStream(
+        return self.call_api(
+            report_downloader.DownloadReportAsStream,
             parameters,
             skip_report_header=True,
             skip_report_summary=True,
             include_zero_impressions=include_zero_impressions
         )
 
+    def _get_cached_report(self, parameters, include_zero_impressions):
+        """
+        Return the compressed report for `parameters` from the report
+        cache, downloading and caching it if it isn't there, and whether
+        it was cached.
+        """
+        client_customer_id = self._user.client_customer_id
+        key = report_cache.get_key(
+            client_customer_id,
+            parameters['reportType'],
+            self.normalise_selector(parameters['selector']),
+            parameters['dateRangeType'],
+            include_zero_impressions,
+        )
 
-        report = csv.reader((line.decode() for line in response))
-        
-        if skip_headers:
-            next(report)
+        payload = report_cache.get(key)
+        if payload is not None:
+            return io.BytesIO(payload), True
+
+        payload, response = report_cache.read(
+            self._download_report(parameters, include_zero_impressions))
+        if payload is None:
+            # Too large to cache, so read as it downloads.
+            return response, False
+
+        report_cache.set(
+            client_customer_id,
+            key,
+            payload,
+            get_report_expiry(parameters['dateRangeType'], parameters['selector']),
+        )
 
-        return (row for row in report if row)
+        return io.BytesIO(payload), False
+
+    def invalidate_report_cache(self):
+        """
+        Forget the user's cached reports.  Call this after changing
+        anything in their account.
+        """
+        if settings.ADWORDS_REPORT_CACHE_ENABLED:
+            report_cache.invalidate(self._user.client_customer_id)
 
     @classmethod
     def get_customers(cls, refresh_token):
         # Will be called outside of a view with no reasonable access to
         # a `User` instance.  Provide a `refresh_token` manually.
-        client = get_adwords_client(refresh_token)
-        customer_service = client.GetService('CustomerService')
+        client = registry.get_client(refresh_token)
+        customer_service = registry.get_service(
+            client, 'CustomerService', cls.adwords_api_version)
         try:
-            customers = customer_service.getCustomers()
+            customers = scheduler.call(None, customer_service.getCustomers)
         except HTTPError as e:
             if not hasattr(e, 'fp'):
                 raise
@@ -223,8 +378,9 @@ class Adapter:
                 customer_id = customer.customerId
 
                 # Get a new client with all the data we need.
-                client = get_adwords_client(refresh_token, customer_id)
-                managed_customer_service = client.GetService('ManagedCustomerService')
+                client = registry.get_client(refresh_token, customer_id)
+                managed_customer_service = registry.get_service(
+                    client, 'ManagedCustomerService', cls.adwords_api_version)
                 selector = {
                     'fields': [
                         'CustomerId',
@@ -234,7 +390,8 @@ class Adapter:
                     # No pagination; we will always want all customers.
                 }
                 try:
-                    managed_customers.extend(managed_customer_service.get(selector).entries)
+                    managed_customers.extend(
+                        scheduler.call(customer_id, managed_customer_service.get, selector).entries)
                 except:
                     pass
         except:
@@ -249,10 +406,11 @@ class Adapter:
         # CustomerService.get() method no longer exists, 
         # getting list of customers and checking if there's only one.
         # This method should only be run in the event of a failure to get a manager account.
-        client = get_adwords_client(refresh_token)
-        customer_service = client.GetService('CustomerService')
+        client = registry.get_client(refresh_token)
+        customer_service = registry.get_service(
+            client, 'CustomerService', Adapter.adwords_api_version)
         try:
-            customers = customer_service.getCustomers()
+            customers = scheduler.call(None, customer_service.getCustomers)
             if len(customers) == 1:
                 for customer in customers:
                     return customer
@@ -266,25 +424,81 @@ class Adapter:
         return customer
 
     @_require_linked_account
-    def get_adwords_client(self):
-        print("%s : : %s" %(self._user.refresh_token, self._user.client_customer_id))
-        return get_adwords_client(self._user.refresh_token, self._user.client_customer_id)
-
-    def _get_campaign_instance(self, campaign):
-        campaign = campaign.copy()
-        adwords_campaign_id = campaign.pop('id')
-        title = campaign.pop('title')
-        instance, _ = Campaign.objects.update_or_create(
-            adwords_campaign_id=adwords_campaign_id,
-            defaults={'owner': self._user, 'title': title},
-        )
+    def get_adwords_client(self, partial_failure=False):
+        return registry.get_client(
+            self._user.refresh_token, self._user.client_customer_id, partial_failure)
+
+    # The API's data on a campaign kept on its `Campaign`.
+    campaign_fields = ('title', 'status', 'budget', 'budget_name', 'click_assisted_conversions')
 
-        for key, value in campaign.items():
-            # Set attributes on the campaign for the leftover keys; the
-            # API-only data.
-            setattr(instance, key, value)
+    @staticmethod
+    def _get_campaign_fields(campaign):
+        return {
+            'title': campaign['title'],
+            'status': campaign['status'],
+            'budget': campaign['budget'],
+            'budget_name': campaign['budget_name'] or '',
+            'click_assisted_conversions': campaign['click_assisted_conversions'],
+        }
+
+    def _get_campaign_instances(self, campaigns):
+        """
+        Return a `Campaign` for each of the API's `campaigns`, with
+        budgets joined, creating and updating the stored ones in bulk.
+        The leftover API-only data is set as attributes on each
+        instance.
+        """
+        campaigns_by_id = {str(campaign['id']): campaign for campaign in campaigns}
+        # Other users may have the same campaigns, as their own.
+        user_campaigns = Campaign.objects.filter(owner=self._user)
+        instances = {
+            instance.adwords_campaign_id: instance
+            for instance in user_campaigns.filter(adwords_campaign_id__in=campaigns_by_id)
+        }
 
-        return instance
+        to_create = []
+        to_update = []
+        for adwords_campaign_id, campaign in campaigns_by_id.items():
+            fields = self._get_campaign_fields(campaign)
+            try:
+                instance = instances[adwords_campaign_id]
+            except KeyError:
+                to_create.append(Campaign(
+                    adwords_campaign_id=adwords_campaign_id,
+                    owner=self._user,
+                    **fields
+                ))
+            else:  # noexcept
+                if any(getattr(instance, name) != value for name, value in fields.items()):
+                    for name, value in fields.items():
+                        setattr(instance, name, value)
+                    to_update.append(instance)
+
+        if to_update:
+            Campaign.objects.bulk_update(to_update, self.campaign_fields)
+
+        if to_create:
+            # Another request may have created some of them meanwhile,
+            # so read back what was stored rather than trusting ours.
+            Campaign.objects.bulk_create(to_create, ignore_conflicts=True)
+            instances.update(
+                (instance.adwords_campaign_id, instance)
+                for instance in user_campaigns.filter(
+                    adwords_campaign_id__in=[instance.adwords_campaign_id for instance in to_create])
+            )
+
+        mapped = []
+        for campaign in campaigns:
+            instance = instances[str(campaign['id'])]
+            fields = self._get_campaign_fields(campaign)
+            for key, value in campaign.items():
+                if key != 'id' and key not in fields:
+                    # Set attributes on the campaign for the leftover
+                    # keys; the API-only data.
+                    setattr(instance, key, value)
+            mapped.append(instance)
+
+        return mapped
 
     def _inject_campaign_predicates(self, selector, campaigns_to_get):
         """
@@ -383,12 +597,31 @@ class Adapter:
         try:
             spend = self.get_spend_for_period(date_from, date_to)
         except:
-            print("Error Occured!")
+            logger.exception('Could not get the monthly spend for {}'.format(
+                self._user.client_customer_id))
             spend = 0
         return spend
 
     @_require_linked_account
-    def get_campaigns(self, campaigns_to_get=CAMPAIGNS_ALL, date_range=ALL_TIME, get_budgets=True):
+    def get_campaigns(
+            self,
+            campaigns_to_get=CAMPAIGNS_ALL,
+            date_range=ALL_TIME,
+            get_budgets=True,
+            parallel=None):
+        """
+        Return the campaigns as dicts.  With `get_budgets`, each also
+        has its budget's `budget` amount and `budget_name`, or
+        `budget_missing` set if the API returned no such budget.
+
+        With `parallel` (by default `ADWORDS_FETCH_BUDGETS_IN_PARALLEL`)
+        every budget in the account is downloaded in another thread
+        while the campaigns report is, rather than only the campaigns'
+        budgets afterwards.
+        """
+        if parallel is None:
+            parallel = settings.ADWORDS_FETCH_BUDGETS_IN_PARALLEL
+
         campaign_selector = {
             'fields': [
                 'BaseCampaignId',
@@ -413,67 +646,72 @@ class Adapter:
             campaign_selector['dateRange'] = date_range
             date_range = 'CUSTOM_DATE'
 
-        report = self.get_report(
-            'Campaigns report',
-            'CAMPAIGN_PERFORMANCE_REPORT',
-            date_range,
-            campaign_selector,
-        )
-
-        campaigns = [
-            {
-                'id': int(id_),
-                'title': title,
-                'status': status,
-                'budget_id': int(budget_id),
-                'click_assisted_conversions': int(click_assisted_conversions)
-            }
-            for (
-                id_,
-                title,
-                status,
-                budget_id,
-                click_assisted_conversions,
-            ) in report
-        ]
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            if get_budgets and parallel:
+                all_budgets = executor.submit(lambda: list(self.get_budgets()))
+
+            report = self.get_report(
+                'Campaigns report',
+                'CAMPAIGN_PERFORMANCE_REPORT',
+                date_range,
+                campaign_selector,
+            )
+
+            campaigns = [
+                {
+                    'id': int(id_),
+                    'title': title,
+                    'status': status,
+                    'budget_id': int(budget_id),
+                    'click_assisted_conversions': int(click_assisted_conversions)
+                }
+                for (
+                    id_,
+                    title,
+                    status,
+                    budget_id,
+                    click_assisted_conversions,
+                ) in report
+            ]
+
+            if get_budgets and parallel:
+                budgets = all_budgets.result()
 
         if get_budgets and campaigns:
-            # Add the budget amounts in.
-            budget_ids = (campaign['budget_id'] for campaign in campaigns)
-            budgets = self.get_budgets(budget_ids)
-
-            for budget in budgets:
-                campaigns_to_mutate = [
-                    campaign for campaign in campaigns
-                    if campaign['budget_id'] == budget['id']
-                ]
-
-                for campaign in campaigns_to_mutate:
-                    campaign['budget'] = budget['amount']
-                    campaign['budget_name'] = budget['name']
+            if not parallel:
+                budgets = self.get_budgets({campaign['budget_id'] for campaign in campaigns})
 
-            # TODO:  If the API returns no budgets for an ID that a
-            # campaign has, at this point, the campaign will be missing the
-            # `'budget'` key.  Is this a possibility on the API side?
+            self.join_budgets(campaigns, budgets)
 
         return campaigns
 
-    def get_mapped_campaigns(self, filter_by=None):
-        campaigns_to_show = CAMPAIGNS_ALL
-        if isinstance(filter_by, str):
-            filter_by = filter_by.lower()
-            if filter_by == 'managed':
-                campaigns_to_show = CAMPAIGNS_MANAGED
-            elif filter_by == 'unmanaged':
-                campaigns_to_show = CAMPAIGNS_UNMANAGED
+    @staticmethod
+    def join_budgets(campaigns, budgets):
+        """
+        Add each budget's amount and name to the campaigns using it,
+        setting `budget_missing` on those whose budget isn't in
+        `budgets`.
+        """
+        budgets_by_id = {budget['id']: budget for budget in budgets}
 
-        data = self.get_campaigns(campaigns_to_show)
+        for campaign in campaigns:
+            try:
+                budget = budgets_by_id[campaign['budget_id']]
+            except KeyError:
+                campaign['budget'] = None
+                campaign['budget_name'] = None
+                campaign['budget_missing'] = True
+            else:  # noexcept
+                campaign['budget'] = budget['amount']
+                campaign['budget_name'] = budget['name']
+                campaign['budget_missing'] = False
 
-        return [
-            self._get_campaign_instance(campaign)
-            for campaign
-            in data
-        ]
+    def save_campaigns(self):
+        """
+        Copy every campaign in the account, with its budget, to its
+        `Campaign`, and return them.
+        """
+        return self._get_campaign_instances(self.get_campaigns())
 
     @staticmethod
     def get_metrics_shape(metrics):
@@ -539,7 +777,19 @@ class Adapter:
             self,
             date_range=ALL_TIME,
             campaign_id=CAMPAIGNS_ALL,
-            cast_dates=True):
+            cast_dates=True,
+            backend=BACKEND_API):
+        if backend == BACKEND_SYNCED:
+            by_date = {}
+            for part_backend, part_range in self.split_synced_date_range(date_range):
+                by_date.update(
+                    self.get_campaign_metrics(part_range, campaign_id, cast_dates, part_backend))
+
+            return by_date
+
+        if backend == BACKEND_LOCAL:
+            return self._get_local_campaign_metrics(date_range, campaign_id, cast_dates)
+
         campaign_selector = {
             'fields': [
                 'Conversions',
@@ -574,14 +824,94 @@ class Adapter:
 
         return by_date
 
-    def get_keywords(
-            self,
-            predicates=None,
-            enabled_only=False,
-            date_range=ALL_TIME):
-        if enabled_only:
-            filters = {'Status':'ENABLED'}
+    @staticmethod
+    def _filter_date_range(queryset, date_range):
+        if date_range == ALL_TIME:
+            return queryset
+
+        return queryset.filter(date__range=(
+            datetime.datetime.strptime(date_range['min'], '%Y%m%d').date(),
+            datetime.datetime.strptime(date_range['max'], '%Y%m%d').date(),
+        ))
+
+    def _get_local_campaign_metrics(self, date_range, campaign_id, cast_dates):
+        stats = DailyCampaignStats.objects.filter(
+            client_customer_id=self._user.client_customer_id)
+        stats = self._filter_date_range(stats, date_range)
+
+        if campaign_id != CAMPAIGNS_ALL:
+            stats = stats.filter(adwords_campaign_id=campaign_id)
+
+        stats = stats \
+            .values('date') \
+            .annotate(total_conversions=Sum('conversions'), total_cost=Sum('cost')) \
+            .order_by()
+
+        by_date = defaultdict(
+            lambda: {'conversions': Decimal(), 'cpc': Decimal(), 'cost': Decimal()})
+        for day in stats:
+            date = day['date'] if cast_dates else day['date'].strftime('%Y-%m-%d')
+            by_date[date]['conversions'] += day['total_conversions']
+            by_date[date]['cost'] += day['total_cost']
+            if by_date[date]['conversions']:
+                by_date[date]['cpc'] = by_date[date]['cost'] / by_date[date]['conversions']
+
+        return by_date
+
+    def split_synced_date_range(self, date_range):
+        """
+        Split `date_range` into the days the daily stats copied to the
+        database hold and the days after them, returning a list of
+        `(backend, date_range)` covering it.  A range starting before
+        the copied days is downloaded whole, in one report.
+        """
+        if date_range == ALL_TIME:
+            return [(BACKEND_API, date_range)]
+
+        synced_through = MetricsSync.objects \
+            .filter(client_customer_id=self._user.client_customer_id) \
+            .values_list('synced_through', flat=True) \
+            .first()
+        if synced_through is None:
+            return [(BACKEND_API, date_range)]
+
+        # The first sync copied `ADWORDS_METRICS_SYNC_INITIAL_DAYS` and
+        # each since has added to the end, so at least that many days up
+        # to `synced_through` are held.
+        synced_from = synced_through - datetime.timedelta(
+            days=settings.ADWORDS_METRICS_SYNC_INITIAL_DAYS - 1)
+        date_from = datetime.datetime.strptime(date_range['min'], '%Y%m%d').date()
+        date_to = datetime.datetime.strptime(date_range['max'], '%Y%m%d').date()
+        if date_from < synced_from or date_from > synced_through:
+            return [(BACKEND_API, date_range)]
+        if date_to <= synced_through:
+            return [(BACKEND_LOCAL, date_range)]
+
+        return [
+            (BACKEND_LOCAL, self.format_date_range(date_from, synced_through)),
+            (BACKEND_API, self.format_date_range(
+                synced_through + datetime.timedelta(days=1), date_to)),
+        ]
 
+    @classmethod
+    def normalise_selector(cls, selector):
+        """
+        Return a hashable, order-independent copy of `selector`, for
+        use as a cache key.
+        """
+        if isinstance(selector, dict):
+            return tuple(sorted(
+                (key, cls.normalise_selector(value)) for key, value in selector.items()))
+        elif isinstance(selector, (list, tuple, set, frozenset)):
+            return tuple(cls.normalise_selector(value) for value in selector)
+
+        return selector
+
+    def get_keyword_selector(self, predicates=None, date_range=ALL_TIME):
+        """
+        Return the selector and date range type used to request a
+        keywords report.
+        """
         keyword_selector = {
             'fields': [
                 'BaseCampaignId',
@@ -609,14 +939,11 @@ class Adapter:
         if date_range != ALL_TIME:
             keyword_selector['dateRange'] = date_range
             date_range = 'CUSTOM_DATE'
-        
-        report = self.get_report(
-            'Keywords report',
-            'KEYWORDS_PERFORMANCE_REPORT',
-            date_range,
-            keyword_selector,
-        )
 
+        return keyword_selector, date_range
+
+    @staticmethod
+    def parse_keywords(report):
         def percentage(value):
             return Decimal(value[:-1])  # Cut off the '%'.
 
@@ -666,59 +993,219 @@ class Adapter:
             ) in report
         )
 
-    def get_keywords_for_campaign(
+    def get_keywords(
             self,
-            adwords_campaign_id,
+            predicates=None,
             enabled_only=False,
             date_range=ALL_TIME):
-        return self.get_keywords({'BaseCampaignId': adwords_campaign_id}, enabled_only, date_range)
+        if enabled_only:
+            filters = {'Status':'ENABLED'}
 
-    def get_mapped_keywords(self, campaign):
-        data = self.get_keywords_for_campaign(campaign.adwords_campaign_id)
-        # We'll iterate over the data twice for database query reasons,
-        # so evaluate it.
-        data = list(data)
-
-        # Avoid hitting the database for every keyword.
-        keyword_ids = [keyword['id'] for keyword in data]
-        # `DISTINCT ON` doesn't exist in MySQL, so replace
-        # `.order_by('-created_at').distinct('adwords_keyword_id')`
-        if keyword_ids:
-            with connection.cursor() as cursor:
-                query = (
-                    'SELECT MAX(created_at), {{id_col}} '
-                    'FROM {table} '
-                    'WHERE adwords_keyword_id IN %s '
-                    'GROUP BY adwords_keyword_id').format(table=KeywordEvent._meta.db_table)
-                try:
-                    cursor.execute(query.format(id_col='ANY_VALUE(id)'), (keyword_ids,))
-                except OperationalError:  # MySQL < v5.7
-                    cursor.execute(query.format(id_col='id'), (keyword_ids,))
+        keyword_selector, date_range = self.get_keyword_selector(predicates, date_range)
 
-                rows = cursor.fetchall()
-                ids = [id_ for _created_at, id_ in rows]
-        else:
-            ids = keyword_ids
+        report = self.get_report(
+            'Keywords report',
+            'KEYWORDS_PERFORMANCE_REPORT',
+            date_range,
+            keyword_selector,
+        )
+
+        return self.parse_keywords(report)
 
-        keyword_events = KeywordEvent.objects.filter(pk__in=ids)
-        list(keyword_events)
+    def get_keywords_columnar(self, predicates=None, date_range=ALL_TIME):
+        """
+        As `get_keywords`, but parsed straight into a `KeywordColumns`
+        table rather than a dict per keyword.
+        """
 
-        keywords = []
-        for keyword in data:
-            keyword = keyword.copy()
+        keyword_selector, date_range = self.get_keyword_selector(predicates, date_range)
 
+        report = self.get_report(
+            'Keywords report',
+            'KEYWORDS_PERFORMANCE_REPORT',
+            date_range,
+            keyword_selector,
+        )
+
+        return KeywordColumns.from_report(report)
+
+    @_require_linked_account
+    def get_daily_campaign_stats(self, date_from, date_to):
+        """
+        Yield each campaign's stats for each day from `date_from` to
+        `date_to`, for `DailyCampaignStats`.
+        """
+        selector = {
+            'fields': [
+                'Date',
+                'BaseCampaignId',
+                'Impressions',
+                'Clicks',
+                'Cost',
+                'Conversions',
+                'ClickAssistedConversions',
+            ],
+            'dateRange': self.format_date_range(date_from, date_to),
+        }
+        report = self.get_report(
+            'Daily campaign report',
+            'CAMPAIGN_PERFORMANCE_REPORT',
+            'CUSTOM_DATE',
+            selector,
+            include_zero_impressions=False,
+        )
+
+        return (
+            {
+                'date': datetime.datetime.strptime(date, '%Y-%m-%d').date(),
+                'adwords_campaign_id': int(campaign_id),
+                'impressions': int(impressions),
+                'clicks': int(clicks),
+                'cost': int(cost),
+                'conversions': Decimal(conversions),
+                'click_assisted_conversions': int(click_assisted_conversions),
+            }
+            for (
+                date,
+                campaign_id,
+                impressions,
+                clicks,
+                cost,
+                conversions,
+                click_assisted_conversions,
+            ) in report
+        )
+
+    @_require_linked_account
+    def get_daily_keyword_stats(self, date_from, date_to):
+        """
+        Yield each keyword's stats for each day from `date_from` to
+        `date_to`, for `DailyKeywordStats`.
+        """
+        selector = {
+            'fields': [
+                'Date',
+                'BaseCampaignId',
+                'AdGroupId',
+                'AdGroupName',
+                'Id',
+                'Criteria',
+                'Status',
+                'CpcBid',
+                'Impressions',
+                'Clicks',
+                'Cost',
+                'Conversions',
+                'ClickAssistedConversions',
+                'ConversionValue',
+                'AveragePosition',
+            ],
+            'dateRange': self.format_date_range(date_from, date_to),
+        }
+        report = self.get_report(
+            'Daily keywords report',
+            'KEYWORDS_PERFORMANCE_REPORT',
+            'CUSTOM_DATE',
+            selector,
+            include_zero_impressions=False,
+        )
+
+        def optional_int(value):
             try:
-                previous_max_cpc = keyword_events.get(adwords_keyword_id=keyword['id'])
-            except KeywordEvent.DoesNotExist:
-                keyword['previous_max_cpc'] = None
-                keyword['max_cpc_modified_at'] = None
-            else:  # noexcept
-                keyword['previous_max_cpc'] = previous_max_cpc.previous_max_cpc
-                keyword['max_cpc_modified_at'] = previous_max_cpc.created_at
+                return int(value)
+            except ValueError:
+                return None
+
+        return (
+            {
+                'date': datetime.datetime.strptime(date, '%Y-%m-%d').date(),
+                'adwords_campaign_id': int(campaign_id),
+                'ad_group_id': int(ad_group_id),
+                'ad_group_name': ad_group_name,
+                'keyword_id': int(id_),
+                'keyword': keyword,
+                'status': status,
+                'max_cpc': optional_int(max_cpc),
+                'impressions': int(impressions),
+                'clicks': int(clicks),
+                'cost': int(cost),
+                'conversions': Decimal(conversions),
+                'click_assisted_conversions': int(click_assisted_conversions),
+                'conversion_value': Decimal(conversion_value),
+                'weighted_position': float(average_position) * int(impressions),
+            }
+            for (
+                date,
+                campaign_id,
+                ad_group_id,
+                ad_group_name,
+                id_,
+                keyword,
+                status,
+                max_cpc,
+                impressions,
+                clicks,
+                cost,
+                conversions,
+                click_assisted_conversions,
+                conversion_value,
+                average_position,
+            ) in report
+        )
 
-            keywords.append(keyword)
+    def get_keywords_for_campaigns(self, adwords_campaign_ids, date_range=ALL_TIME):
+        """
+        Download a single keywords report covering every campaign in
+        `adwords_campaign_ids` and return it as `KeywordColumns`
+        partitioned by campaign id.  Every requested campaign has an
+        entry, even if it has no keywords.
+        """
+        adwords_campaign_ids = [int(id_) for id_ in adwords_campaign_ids]
+        keywords = self.get_keywords_columnar(
+            {'BaseCampaignId__in': adwords_campaign_ids}, date_range=date_range)
+
+        partitions = {
+            adwords_campaign_id: KeywordColumns()
+            for adwords_campaign_id in adwords_campaign_ids
+        }
+        partitions.update(keywords.partition('campaign_id'))
 
-        return keywords
+        return partitions
+
+    def get_keywords_for_campaign(
+            self,
+            adwords_campaign_id,
+            enabled_only=False,
+            date_range=ALL_TIME):
+        return self.get_keywords({'BaseCampaignId': adwords_campaign_id}, enabled_only, date_range)
+
+    def get_keyword_columns_for_campaign(self, adwords_campaign_id, date_range=ALL_TIME):
+        return self.get_keywords_columnar({'BaseCampaignId': adwords_campaign_id}, date_range)
+
+    @staticmethod
+    def get_latest_keyword_events(keyword_ids):
+        """
+        Return a dict of keyword id, as a string, to the keyword's
+        latest `KeywordEvent`, in one query.  Events made at the same
+        time are told apart by id, so the result is always the same.
+        """
+        keyword_ids = [str(keyword_id) for keyword_id in keyword_ids]
+        if not keyword_ids:
+            return {}
+
+        # `DISTINCT ON` doesn't exist in MySQL, so pick each keyword's
+        # latest event with a subquery, which the
+        # (adwords_keyword_id, created_at) index answers.
+        latest_event = KeywordEvent.objects \
+            .filter(adwords_keyword_id=OuterRef('adwords_keyword_id')) \
+            .order_by('-created_at', '-pk') \
+            .values('pk')[:1]
+        events = KeywordEvent.objects.filter(
+            adwords_keyword_id__in=keyword_ids,
+            pk=Subquery(latest_event),
+        )
+
+        return {event.adwords_keyword_id: event for event in events}
 
     def get_adgroups_for_campaign(self, adwords_campaign_id):
         filters = {'BaseCampaignId': adwords_campaign_id, 'AdGroupStatus': 'ENABLED'}
@@ -745,48 +1232,74 @@ class Adapter:
             ) in report
         )
 
-    def set_keyword_max_cpc(self, ad_group_id, keyword_id, max_cpc):
+    @contextmanager
+    def keyword_mutations(self):
+        """
+        Queue keyword mutations made within this context and send them
+        in batches when it exits.  Yields the `KeywordMutationBuffer`,
+        whose `failures` lists the keywords the API rejected.  Nested
+        contexts share the outermost buffer.
+        """
+        if self._mutation_buffer is not None:
+            yield self._mutation_buffer
+            return
+
+        self._mutation_buffer = KeywordMutationBuffer(self, settings.ADWORDS_MUTATE_BATCH_SIZE)
+        try:
+            yield self._mutation_buffer
+        finally:
+            mutation_buffer, self._mutation_buffer = self._mutation_buffer, None
+            mutation_buffer.flush()
+
+    def _mutate_keyword(self, operand):
+        if self._mutation_buffer is not None:
+            self._mutation_buffer.add(operand)
+            return None
+
         ad_group_criterion_service = self.get_adwords_service('AdGroupCriterionService')
         operations = [{
             'operator': 'SET',
-            'operand': {
-                'xsi_type': 'BiddableAdGroupCriterion',
-                'adGroupId': ad_group_id,
-                'criterion': {
-                    'id': keyword_id,
-                },
-                'biddingStrategyConfiguration': {
-                    'bids': [
-                        {
-                            'xsi_type': 'CpcBid',
-                            'bid': {
-                                'microAmount': max_cpc,
-                            },
-                        },
-                    ],
-                },
-            },
+            'operand': operand,
         }]
 
         if self.should_mutate:
-            return ad_group_criterion_service.mutate(operations)
+            with instrumentation.measure(
+                    'mutate',
+                    'AdGroupCriterionService',
+                    self._user.client_customer_id,
+                    operations=len(operations)):
+                result = self.call_api(ad_group_criterion_service.mutate, operations)
+            self.invalidate_report_cache()
+            return result
 
-    def set_keyword_paused(self, ad_group_id, keyword_id):
-        ad_group_criterion_service = self.get_adwords_service('AdGroupCriterionService')
-        operations = [{
-            'operator': 'SET',
-            'operand': {
-                'xsi_type': 'BiddableAdGroupCriterion',
-                'adGroupId': ad_group_id,
-                'criterion': {
-                    'id': keyword_id,
-                },
-                'userStatus': 'PAUSED',
+    def set_keyword_max_cpc(self, ad_group_id, keyword_id, max_cpc):
+        return self._mutate_keyword({
+            'xsi_type': 'BiddableAdGroupCriterion',
+            'adGroupId': ad_group_id,
+            'criterion': {
+                'id': keyword_id,
             },
-        }]
+            'biddingStrategyConfiguration': {
+                'bids': [
+                    {
+                        'xsi_type': 'CpcBid',
+                        'bid': {
+                            'microAmount': max_cpc,
+                        },
+                    },
+                ],
+            },
+        })
 
-        if self.should_mutate:
-            return ad_group_criterion_service.mutate(operations)
+    def set_keyword_paused(self, ad_group_id, keyword_id):
+        return self._mutate_keyword({
+            'xsi_type': 'BiddableAdGroupCriterion',
+            'adGroupId': ad_group_id,
+            'criterion': {
+                'id': keyword_id,
+            },
+            'userStatus': 'PAUSED',
+        })
 
     def set_ad_groups_paused(self, ad_group_ids):
         ad_group_service = self.get_adwords_service('AdGroupService')
@@ -799,4 +1312,11 @@ class Adapter:
         } for ad_group_id in set(ad_group_ids)]
 
         if self.should_mutate:
-            return ad_group_service.mutate(operations)
+            with instrumentation.measure(
+                    'mutate',
+                    'AdGroupService',
+                    self._user.client_customer_id,
+                    operations=len(operations)):
+                result = self.call_api(ad_group_service.mutate, operations)
+            self.invalidate_report_cache()
+            return result
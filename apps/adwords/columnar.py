@@ -0,0 +1,250 @@
+from array import array
+from decimal import Decimal
+from itertools import compress, islice
+
+
+MISSING = -1
+
+CHUNK_SIZE = 10000
+
+
+def _percentage(value):
+    return float(value[:-1])  # Cut off the '%'.
+
+
+def _optional_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return MISSING
+
+
+def _micro_amount(value):
+    """
+    What `decimal_to_micro_amount(Decimal(value))` returns, skipping
+    `Decimal` for the common case of a whole number.
+    """
+    try:
+        return int(value) * 10 ** 6
+    except ValueError:
+        pass
+
+    try:
+        return int(Decimal(value) * 10 ** 6)
+    except ArithmeticError:
+        return MISSING
+
+
+class KeywordColumns:
+    """
+    A keywords report held as one typed array per column rather than a
+    dict per keyword.  Money is in micros (`array('q')`), rates and
+    positions are floats (`array('d')`) and `status` is stored as codes
+    into `status_categories`.  Micro amount columns hold `MISSING`
+    where the report had no usable value.
+
+    Use `rows()` for the dicts `Adapter.get_keywords` returns.
+    """
+    INT_COLUMNS = (
+        'campaign_id',
+        'ad_group_id',
+        'id',
+        'clicks',
+        'max_cpc',
+        'click_assisted_conversions',
+        'cost',
+        'impressions',
+        'cpa',
+        'value_per_conversion',
+    )
+    FLOAT_COLUMNS = (
+        'average_position',
+        'conversion_rate',
+        'click_through_rate',
+    )
+    TEXT_COLUMNS = (
+        'ad_group_name',
+        'keyword',
+    )
+
+    # Report column order, and how each column is parsed.
+    REPORT_COLUMNS = (
+        ('campaign_id', int),
+        ('ad_group_name', None),
+        ('ad_group_id', int),
+        ('id', int),
+        ('keyword', None),
+        ('average_position', float),
+        ('clicks', int),
+        ('max_cpc', _optional_int),
+        ('click_assisted_conversions', int),
+        ('conversion_rate', _percentage),
+        ('cost', int),
+        ('impressions', int),
+        ('click_through_rate', _percentage),
+        ('cpa', int),
+        ('status', None),
+        ('value_per_conversion', _micro_amount),
+    )
+
+    def __init__(self):
+        for name in self.INT_COLUMNS:
+            setattr(self, name, array('q'))
+        for name in self.FLOAT_COLUMNS:
+            setattr(self, name, array('d'))
+        for name in self.TEXT_COLUMNS:
+            setattr(self, name, [])
+        self.status = array('B')
+        self.status_categories = []
+        self._status_codes = {}
+
+    def __len__(self):
+        return len(self.id)
+
+    def encode_status(self, status):
+        """
+        Return the code for `status`, adding it to `status_categories`
+        if it isn't there yet.
+        """
+        try:
+            return self._status_codes[status]
+        except KeyError:
+            code = self._status_codes[status] = len(self.status_categories)
+            self.status_categories.append(status)
+            return code
+
+    def status_code(self, status):
+        """
+        Return the code `status` is stored as, or `None` if no keyword
+        has that status.
+        """
+        return self._status_codes.get(status)
+
+    def _extend(self, name, values):
+        if name == 'status':
+            self.status.extend(map(self.encode_status, values))
+        else:
+            getattr(self, name).extend(values)
+
+    @classmethod
+    def from_report(cls, report):
+        """
+        Parse the rows of a keywords report, a chunk of rows at a time.
+        """
+        columns = cls()
+        report = iter(report)
+
+        while True:
+            chunk = list(islice(report, CHUNK_SIZE))
+            if not chunk:
+                break
+
+            for (name, parse), values in zip(cls.REPORT_COLUMNS, zip(*chunk)):
+                if parse is not None:
+                    values = map(parse, values)
+                columns._extend(name, values)
+
+        return columns
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build columns from the dicts `Adapter.get_keywords` returns.
+        """
+        columns = cls()
+        for row in rows:
+            for name in cls.INT_COLUMNS:
+                value = row[name]
+                getattr(columns, name).append(MISSING if value is None else value)
+            for name in cls.FLOAT_COLUMNS:
+                getattr(columns, name).append(row[name])
+            for name in cls.TEXT_COLUMNS:
+                getattr(columns, name).append(row[name])
+            columns.status.append(columns.encode_status(row['status']))
+
+        return columns
+
+    def take(self, indexes):
+        """
+        Return a new `KeywordColumns` holding the rows at `indexes`.
+        """
+        indexes = list(indexes)
+        columns = self.__class__()
+        for name in self.INT_COLUMNS + self.FLOAT_COLUMNS + self.TEXT_COLUMNS + ('status', ):
+            getattr(columns, name).extend(map(getattr(self, name).__getitem__, indexes))
+        columns.status_categories = list(self.status_categories)
+        columns._status_codes = dict(self._status_codes)
+
+        return columns
+
+    def partition(self, name):
+        """
+        Split the rows by the value of column `name`, returning a dict
+        of value to `KeywordColumns`.
+        """
+        indexes = {}
+        for index, value in enumerate(getattr(self, name)):
+            indexes.setdefault(value, []).append(index)
+
+        return {value: self.take(value_indexes) for value, value_indexes in indexes.items()}
+
+    def where(self, mask):
+        """
+        Return a new `KeywordColumns` holding the rows for which `mask`
+        is truthy.
+        """
+        return self.take(compress(range(len(self)), mask))
+
+    def sum(self, name):
+        return sum(getattr(self, name))
+
+    def mean(self, name):
+        return self.sum(name) / len(self)
+
+    def rows(self):
+        """
+        Yield each keyword as `Adapter.get_keywords` would.
+        """
+        def optional(value):
+            return None if value == MISSING else value
+
+        def percentage(value):
+            return Decimal(repr(value))
+
+        statuses = self.status_categories
+        for (
+                campaign_id,
+                ad_group_name,
+                ad_group_id,
+                id_,
+                keyword,
+                average_position,
+                clicks,
+                max_cpc,
+                click_assisted_conversions,
+                conversion_rate,
+                cost,
+                impressions,
+                click_through_rate,
+                cpa,
+                status,
+                value_per_conversion,
+        ) in zip(*(getattr(self, name) for name, _parse in self.REPORT_COLUMNS)):
+            yield {
+                'campaign_id': campaign_id,
+                'ad_group_name': ad_group_name,
+                'ad_group_id': ad_group_id,
+                'id': id_,
+                'keyword': keyword,
+                'average_position': average_position,
+                'clicks': clicks,
+                'max_cpc': optional(max_cpc),
+                'click_assisted_conversions': click_assisted_conversions,
+                'conversion_rate': percentage(conversion_rate),
+                'cost': cost,
+                'impressions': impressions,
+                'click_through_rate': percentage(click_through_rate),
+                'cpa': cpa,
+                'status': statuses[status],
+                'value_per_conversion': optional(value_per_conversion),
+            }
@@ -0,0 +1,201 @@
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger('adwords.adapter')
+
+
+class CallRecord:
+    """
+    One call to the AdWords API:
+
+        * `kind` - `'report'`, `'mutate'`, `'service'` (building a
+        service with `GetService`) or `'cache'` (a report read from the
+        report cache rather than the API).
+        * `name` - The report type or service name.
+        * `client_customer_id` - Who the call was for, if anyone.
+        * `modifier` - The modifier running when the call was made, if
+        any.
+        * `seconds` - Wall time.  For a report, from requesting it until
+        its last row was read.
+        * `bytes` - Compressed bytes downloaded.
+        * `rows` - Report rows parsed.
+        * `operations` - Operations sent to `mutate`.
+    """
+
+    def __init__(self, kind, name, client_customer_id=None, modifier=None):
+        self.kind = kind
+        self.name = name
+        self.client_customer_id = client_customer_id
+        self.modifier = modifier
+        self.seconds = 0.0
+        self.bytes = 0
+        self.rows = 0
+        self.operations = 0
+
+    def __str__(self):
+        return (
+            '{kind} {name} for {client_customer_id} ({modifier}): {seconds:.3f}s,'
+            ' {bytes} bytes, {rows} rows, {operations} operations'
+        ).format(**vars(self))
+
+
+class NullSink:
+    """
+    Drops every record.  The default, at no cost to the calls.
+    """
+    enabled = False
+
+    def record(self, call):
+        pass
+
+
+class LoggingSink:
+    """
+    Logs every record at `INFO`.
+    """
+    enabled = True
+
+    def record(self, call):
+        logger.info('AdWords call: %s', call)
+
+
+class AggregatorSink:
+    """
+    Totals the records by kind, name and modifier.  Use `summary` for
+    the totals, slowest first.
+    """
+    enabled = True
+
+    def __init__(self):
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, call):
+        key = (call.kind, call.name, call.modifier)
+        with self._lock:
+            totals = self._totals.setdefault(key, {
+                'kind': call.kind,
+                'name': call.name,
+                'modifier': call.modifier,
+                'calls': 0,
+                'seconds': 0.0,
+                'bytes': 0,
+                'rows': 0,
+                'operations': 0,
+            })
+            totals['calls'] += 1
+            totals['seconds'] += call.seconds
+            totals['bytes'] += call.bytes
+            totals['rows'] += call.rows
+            totals['operations'] += call.operations
+
+    def summary(self):
+        with self._lock:
+            totals = [dict(totals) for totals in self._totals.values()]
+
+        for call_totals in totals:
+            call_totals['seconds'] = round(call_totals['seconds'], 3)
+        return sorted(totals, key=lambda call_totals: call_totals['seconds'], reverse=True)
+
+
+class Instrumentation:
+    """
+    Sends a `CallRecord` for each AdWords API call to the configured
+    sink, and to any collecting with `collect`.
+
+    Collectors are shared by the whole process, so run one task at a
+    time per process (as Celery's prefork pool does) for a collector to
+    see only its own task's calls.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self._collectors = []
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        return self.sink.enabled or bool(self._collectors)
+
+    def start(self, kind, name, client_customer_id=None):
+        """
+        Return a `CallRecord` for a call starting now, to pass to
+        `finish` once it is done, or `None` if nothing is listening.
+        """
+        if not self.enabled:
+            return None
+
+        call = CallRecord(
+            kind, name, client_customer_id, getattr(self._local, 'modifier', None))
+        call.seconds = time.monotonic()
+        return call
+
+    def finish(self, call):
+        if call is None:
+            return
+
+        call.seconds = time.monotonic() - call.seconds
+        for sink in [self.sink] + self._collectors:
+            sink.record(call)
+
+    @contextmanager
+    def measure(self, kind, name, client_customer_id=None, operations=0):
+        call = self.start(kind, name, client_customer_id)
+        if call is not None:
+            call.operations = operations
+        try:
+            yield call
+        finally:
+            self.finish(call)
+
+    @contextmanager
+    def collect(self):
+        """
+        Total the calls made within the block in an `AggregatorSink`.
+        """
+        collector = AggregatorSink()
+        self._collectors.append(collector)
+        try:
+            yield collector
+        finally:
+            self._collectors.remove(collector)
+
+    @contextmanager
+    def modifier(self, name):
+        """
+        Attribute the calls made by this thread within the block to
+        modifier `name`.
+        """
+        previous = getattr(self._local, 'modifier', None)
+        self._local.modifier = name
+        try:
+            yield
+        finally:
+            self._local.modifier = previous
+
+
+class CountingReader:
+    """
+    Wraps a binary file object, counting the bytes read from it.
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.bytes_read = 0
+
+    def read(self, *args):
+        data = self._fileobj.read(*args)
+        self.bytes_read += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._fileobj, name)
+
+
+instrumentation = Instrumentation(import_string(settings.ADWORDS_INSTRUMENTATION_SINK)())
@@ -0,0 +1,100 @@
+from collections import OrderedDict, namedtuple
+import logging
+import re
+
+from .instrumentation import instrumentation
+
+
+logger = logging.getLogger('adwords.adapter')
+
+KeywordMutationFailure = namedtuple(
+    'KeywordMutationFailure', ('ad_group_id', 'keyword_id', 'field_path', 'reason'))
+
+_OPERATION_INDEX_RE = re.compile(r'operations\[(\d+)\]')
+
+
+class KeywordMutationBuffer:
+    """
+    Collects `AdGroupCriterionService` operations and sends them in
+    chunks of `batch_size` rather than one request per keyword.
+
+    Operations for the same keyword are merged, so a keyword is only
+    sent once per flush.  Chunks are sent with partial failure
+    enabled; operations the API rejects are returned from `flush` as
+    `KeywordMutationFailure`s rather than failing the whole chunk.
+    """
+
+    def __init__(self, adapter, batch_size):
+        self._adapter = adapter
+        self.batch_size = batch_size
+        self._operands = OrderedDict()
+        self.failures = []
+        self.operation_count = 0
+        self.request_count = 0
+
+    def __len__(self):
+        return len(self._operands)
+
+    def add(self, operand):
+        key = (operand['adGroupId'], operand['criterion']['id'])
+        try:
+            self._operands[key].update(operand)
+        except KeyError:
+            self._operands[key] = dict(operand)
+
+    def flush(self):
+        operands = list(self._operands.values())
+        self._operands.clear()
+
+        if not operands or not self._adapter.should_mutate:
+            return []
+
+        failures = []
+        for start in range(0, len(operands), self.batch_size):
+            failures.extend(self._mutate(operands[start:start + self.batch_size]))
+
+        self.failures.extend(failures)
+        self._adapter.invalidate_report_cache()
+        return failures
+
+    def _mutate(self, operands):
+        operations = [{'operator': 'SET', 'operand': operand} for operand in operands]
+
+        adwords_client = self._adapter.get_adwords_client(partial_failure=True)
+        service = self._adapter.get_adwords_service(
+            'AdGroupCriterionService', partial_failure=True)
+
+        with instrumentation.measure(
+                'mutate',
+                'AdGroupCriterionService',
+                getattr(adwords_client, 'client_customer_id', None),
+                operations=len(operations)):
+            result = self._adapter.call_api(service.mutate, operations)
+
+        self.operation_count += len(operations)
+        self.request_count += 1
+
+        return self._get_failures(result, operands)
+
+    @staticmethod
+    def _get_failures(result, operands):
+        failures = []
+        for error in getattr(result, 'partialFailureErrors', None) or ():
+            field_path = getattr(error, 'fieldPath', '') or ''
+            match = _OPERATION_INDEX_RE.match(field_path)
+            if match is None:
+                continue
+
+            operand = operands[int(match.group(1))]
+            failure = KeywordMutationFailure(
+                operand['adGroupId'],
+                operand['criterion']['id'],
+                field_path,
+                getattr(error, 'errorString', None) or str(error),
+            )
+            logger.warning(
+                'Mutating keyword {keyword_id} in ad group {ad_group_id} failed:'
+                ' {reason}'.format(**failure._asdict()))
+            failures.append(failure)
+
+        return failures
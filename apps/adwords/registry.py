@@ -0,0 +1,176 @@
+from collections import OrderedDict
+import threading
+
+from django.conf import settings
+
+from website.utils import get_adwords_client
+
+from .instrumentation import instrumentation
+
+
+class ClientRegistry:
+    """
+    Per-process cache of `AdWordsClient` instances and the services
+    built from them.  Creating a client and loading a service's WSDL is
+    slow, and neither changes for a given user without the server
+    restarting, so both are kept in least recently used order and
+    evicted once the registry is full.
+    """
+
+    def __init__(self, max_clients, max_services, client_factory=get_adwords_client):
+        self.max_clients = max_clients
+        self.max_services = max_services
+        self._client_factory = client_factory
+        self._clients = OrderedDict()
+        self._services = OrderedDict()
+        self._lock = threading.RLock()
+        self._key_locks = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            'client_hits': 0,
+            'client_misses': 0,
+            'service_hits': 0,
+            'service_misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    @staticmethod
+    def _hit_rate(hits, misses):
+        total = hits + misses
+        if not total:
+            return 0.0
+
+        return hits / total
+
+    @property
+    def client_hit_rate(self):
+        return self._hit_rate(self.stats['client_hits'], self.stats['client_misses'])
+
+    @property
+    def service_hit_rate(self):
+        return self._hit_rate(self.stats['service_hits'], self.stats['service_misses'])
+
+    def _get(self, cache, key, kind, build, trim):
+        """
+        Return `cache[key]`, calling `build` for it if it isn't there.
+        Building is slow, so it happens outside the registry's lock,
+        under a lock for `key` alone: other keys are served meanwhile,
+        and threads after the same key wait for the one building it.
+        """
+        with self._lock:
+            try:
+                value = cache[key]
+            except KeyError:
+                key_lock = self._key_locks.setdefault(key, threading.Lock())
+            else:  # noexcept
+                self.stats[kind + '_hits'] += 1
+                cache.move_to_end(key)
+                return value
+
+        with key_lock:
+            with self._lock:
+                if key in cache:
+                    # Built by another thread while this one waited.
+                    self.stats[kind + '_hits'] += 1
+                    cache.move_to_end(key)
+                    return cache[key]
+
+            try:
+                value = build()
+            except Exception:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+                raise
+
+            with self._lock:
+                self.stats[kind + '_misses'] += 1
+                cache[key] = value
+                trim()
+                # Only once `value` is cached, so a thread arriving now
+                # finds it rather than a fresh lock to build another.
+                self._key_locks.pop(key, None)
+
+            return value
+
+    def get_client(self, refresh_token, client_customer_id=None, partial_failure=False):
+        """
+        Clients are shared by every thread, so `partial_failure` is
+        fixed when a client is created, and clients with it on are kept
+        apart from those without.
+        """
+        return self._get(
+            self._clients,
+            (refresh_token, client_customer_id, partial_failure),
+            'client',
+            lambda: self._client_factory(
+                refresh_token, client_customer_id, partial_failure=partial_failure),
+            self._trim_clients,
+        )
+
+    def _trim_clients(self):
+        while len(self._clients) > self.max_clients:
+            _evicted_key, evicted_client = self._clients.popitem(last=False)
+            self._drop_services_for(evicted_client)
+            self.stats['evictions'] += 1
+
+    def get_service(self, client, service_name, version):
+        return self._get_service(
+            (client, service_name, version),
+            lambda: client.GetService(service_name, version=version),
+        )
+
+    def get_report_downloader(self, client, version):
+        return self._get_service(
+            (client, 'ReportDownloader', version),
+            lambda: client.GetReportDownloader(version=version),
+        )
+
+    @staticmethod
+    def _build_service(key, build):
+        client, service_name, _version = key
+        with instrumentation.measure(
+                'service', service_name, getattr(client, 'client_customer_id', None)):
+            return build()
+
+    def _get_service(self, key, build):
+        return self._get(
+            self._services,
+            key,
+            'service',
+            lambda: self._build_service(key, build),
+            self._trim_services,
+        )
+
+    def _trim_services(self):
+        while len(self._services) > self.max_services:
+            self._services.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _drop_services_for(self, client):
+        for key in [key for key in self._services if key[0] is client]:
+            del self._services[key]
+
+    def invalidate(self, refresh_token):
+        """
+        Forget every client (and its services) created for
+        `refresh_token`, whatever customer it was created for.  Call
+        this whenever a user's AdWords credentials change.
+        """
+        with self._lock:
+            for key in [key for key in self._clients if key[0] == refresh_token]:
+                self._drop_services_for(self._clients.pop(key))
+                self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._services.clear()
+
+
+registry = ClientRegistry(
+    max_clients=settings.ADWORDS_CLIENT_REGISTRY_MAX_CLIENTS,
+    max_services=settings.ADWORDS_CLIENT_REGISTRY_MAX_SERVICES,
+)
@@ -0,0 +1,192 @@
+import datetime
+import hashlib
+import io
+import json
+import logging
+import math
+
+from django.conf import settings
+from django.utils import timezone
+
+import redis
+
+from website.utils import get_redis_connection
+
+
+logger = logging.getLogger('adwords.adapter')
+
+
+def get_report_expiry(date_range_type, selector, now=None):
+    """
+    Return the seconds until a report's data may next change, or `None`
+    if it never will.
+
+    AdWords makes a day's data available from
+    `ADWORDS_REPORT_DATA_AVAILABLE_HOUR` the following day, so a report
+    whose range ended before yesterday is final, and any other changes
+    at most once a day, at that hour.
+    """
+    now = timezone.localtime(now).replace(tzinfo=None)
+    available_at = datetime.time(settings.ADWORDS_REPORT_DATA_AVAILABLE_HOUR)
+
+    if date_range_type == 'CUSTOM_DATE':
+        last_day = datetime.datetime.strptime(selector['dateRange']['max'], '%Y%m%d').date()
+        final_at = datetime.datetime.combine(last_day + datetime.timedelta(days=1), available_at)
+        if now >= final_at:
+            return None
+
+    next_change = datetime.datetime.combine(now.date(), available_at)
+    if next_change <= now:
+        next_change += datetime.timedelta(days=1)
+
+    return max(math.ceil((next_change - now).total_seconds()), 1)
+
+
+class PrefixedReader:
+    """
+    Reads the bytes of `prefix`, then the rest of the binary file
+    object `fileobj`.
+    """
+
+    def __init__(self, prefix, fileobj):
+        self._prefix = io.BytesIO(prefix)
+        self._fileobj = fileobj
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self._prefix.read() + self._fileobj.read()
+
+        data = self._prefix.read(size)
+        if len(data) < size:
+            data += self._fileobj.read(size - len(data))
+        return data
+
+
+class ReportResultCache:
+    """
+    Downloaded reports, as the compressed payload the API returned,
+    shared through Redis by every process.
+
+    Entries are keyed by customer, report type, selector and date
+    range, and expire when AdWords may next have new data for them (see
+    `get_report_expiry`), or after `max_age` seconds if sooner.
+    `invalidate` drops every entry for a customer, for use after
+    changing their account.  If Redis can't be reached reports are
+    simply not cached.
+    """
+    key_prefix = 'adwords:report:'
+    customer_key_prefix = 'adwords:report-keys:'
+    stats_key = 'adwords:report-cache-stats'
+
+    def __init__(self, max_bytes, max_age, connection=None):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._connection = connection
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = get_redis_connection()
+
+        return self._connection
+
+    def get_key(self, client_customer_id, report_type, selector, date_range_type, *args):
+        """
+        `selector` should be normalised, so that equal selectors give
+        the same key.  Anything else that changes the report's content
+        goes in `args`.
+        """
+        parts = json.dumps(
+            [client_customer_id, report_type, selector, date_range_type] + list(args),
+            default=str,
+        )
+        return self.key_prefix + hashlib.sha1(parts.encode()).hexdigest()
+
+    def _get_customer_key(self, client_customer_id):
+        return '{prefix}{client_customer_id}'.format(
+            prefix=self.customer_key_prefix, client_customer_id=client_customer_id)
+
+    def _count(self, stat, amount=1):
+        self.connection.hincrby(self.stats_key, stat, amount)
+
+    def get(self, key):
+        try:
+            payload = self.connection.get(key)
+            self._count('misses' if payload is None else 'hits')
+        except redis.RedisError:
+            logger.warning('Could not read report from the cache', exc_info=True)
+            return None
+
+        return payload
+
+    def read(self, fileobj):
+        """
+        Read the payload to cache from the binary file object `fileobj`,
+        holding no more than `max_bytes` of it.  Return the payload, or
+        `None` and a file object reading the whole of it if it is too
+        large to cache.
+        """
+        payload = fileobj.read(self.max_bytes + 1)
+        if len(payload) <= self.max_bytes:
+            return payload, None
+
+        try:
+            self._count('too_large')
+        except redis.RedisError:
+            logger.warning('Could not count report as too large', exc_info=True)
+
+        return None, PrefixedReader(payload, fileobj)
+
+    def set(self, client_customer_id, key, payload, expiry):
+        """
+        Cache `payload` for `expiry` seconds, or for `max_age` if
+        `expiry` is `None` or longer.  Payloads over `max_bytes` are not
+        cached.
+        """
+        if expiry is None or expiry > self.max_age:
+            expiry = self.max_age
+
+        customer_key = self._get_customer_key(client_customer_id)
+        try:
+            if len(payload) > self.max_bytes:
+                self._count('too_large')
+                return
+
+            self.connection.set(key, payload, ex=expiry)
+            self.connection.sadd(customer_key, key)
+            # Outlives every entry added to it, none of which is kept
+            # longer than `max_age`.
+            self.connection.expire(customer_key, self.max_age)
+            self._count('stores')
+        except redis.RedisError:
+            logger.warning('Could not write report to the cache', exc_info=True)
+
+    def invalidate(self, client_customer_id):
+        customer_key = self._get_customer_key(client_customer_id)
+
+        try:
+            keys = self.connection.smembers(customer_key)
+            self.connection.delete(customer_key, *keys)
+            self._count('invalidations')
+        except redis.RedisError:
+            logger.warning('Could not invalidate cached reports', exc_info=True)
+
+    def get_stats(self):
+        stats = {'hits': 0, 'misses': 0, 'stores': 0, 'too_large': 0, 'invalidations': 0}
+        stats.update(
+            (stat.decode(), int(value))
+            for stat, value in self.connection.hgetall(self.stats_key).items()
+        )
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        self.connection.delete(self.stats_key)
+
+
+report_cache = ReportResultCache(
+    max_bytes=settings.ADWORDS_REPORT_CACHE_MAX_BYTES,
+    max_age=settings.ADWORDS_REPORT_CACHE_MAX_AGE,
+)
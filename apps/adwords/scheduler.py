@@ -0,0 +1,375 @@
+import logging
+import random
+import re
+import time
+import uuid
+
+from django.conf import settings
+
+import redis
+
+from website.utils import get_redis_connection
+
+
+logger = logging.getLogger('adwords.adapter')
+
+
+# Refill the bucket for the time since it was last used, then take a
+# token if there is one.  Returns 0 if a token was taken, otherwise the
+# seconds until one will be available.
+TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at', 'blocked_until')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+local blocked_until = tonumber(bucket[3]) or 0
+if blocked_until > now then
+    return tostring(blocked_until - now)
+end
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+# Stop the bucket handing out tokens until `ARGV[1]`, unless it is
+# already blocked for longer.
+BLOCK_SCRIPT = """
+local until_ = tonumber(ARGV[1])
+local blocked_until = tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0
+if until_ > blocked_until then
+    redis.call('HSET', KEYS[1], 'blocked_until', tostring(until_))
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2])) + 60)
+end
+return 0
+"""
+
+# API errors worth trying again, as named in the SOAP fault or report
+# download error.
+TRANSIENT_ERRORS = ('RateExceededError', 'InternalApiError')
+
+_RETRY_AFTER_RE = re.compile(r'retryAfterSeconds\W*(\d+)')
+_DEVELOPER_SCOPE_RE = re.compile(r'rateScope\W*DEVELOPER')
+
+
+class TokenBucket:
+    """
+    A token bucket kept in Redis, so that every worker draws on the
+    same `rate` (tokens a second) and `capacity`.
+    """
+
+    def __init__(self, key, rate, capacity, connection):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.connection = connection
+
+    def take(self):
+        """
+        Take a token, returning 0, or return the seconds to wait before
+        trying again.
+        """
+        wait = self.connection.eval(
+            TAKE_SCRIPT, 1, self.key, time.time(), self.rate, self.capacity)
+        return float(wait)
+
+    def block(self, seconds):
+        """
+        Hand out no tokens for `seconds`, as when the API has said to
+        back off.
+        """
+        self.connection.eval(BLOCK_SCRIPT, 1, self.key, time.time() + seconds, seconds)
+
+
+class RetryableError:
+    """
+    Why a failed call may be tried again: `retry_after` is the seconds
+    the API asked for, if it did, and `is_developer_scope` whether the
+    limit hit was the developer token's rather than the customer's.
+    """
+
+    def __init__(self, retry_after=None, is_rate_exceeded=False, is_developer_scope=False):
+        self.retry_after = retry_after
+        self.is_rate_exceeded = is_rate_exceeded
+        self.is_developer_scope = is_developer_scope
+
+
+def _get_error_text(error):
+    content = getattr(error, 'content', None)
+    if content is None and hasattr(error, 'fp') and error.fp is not None:
+        # Keep the body readable for whoever handles the error next.
+        content = error.fp.read()
+        error.fp = _ReplayedBody(content)
+    if content is None and hasattr(error, 'fault'):
+        content = error.fault
+
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', 'replace')
+    return '{}\n{}'.format(content or '', error)
+
+
+class _ReplayedBody:
+
+    def __init__(self, content):
+        self._content = content
+
+    def read(self, *args):
+        content, self._content = self._content, b''
+        return content
+
+
+def classify_error(error):
+    """
+    Return a `RetryableError` if `error`, raised by an AdWords call,
+    is worth retrying, or `None` if it isn't.
+
+    Errors are recognised by what they say rather than their class, as
+    the SOAP and report download clients raise different exceptions.
+    SOAP faults for requests the API rejected come with a 5xx status
+    too, so only server errors that aren't an API error are retried on
+    status alone.
+    """
+    status = getattr(error, 'code', None)
+    if not isinstance(status, int) and not hasattr(error, 'fault') \
+            and not hasattr(error, 'content'):
+        return None
+
+    text = _get_error_text(error)
+    if any(error_type in text for error_type in TRANSIENT_ERRORS):
+        retry_after = _RETRY_AFTER_RE.search(text)
+        return RetryableError(
+            retry_after=int(retry_after.group(1)) if retry_after else None,
+            is_rate_exceeded='RateExceededError' in text,
+            is_developer_scope=bool(_DEVELOPER_SCOPE_RE.search(text)),
+        )
+
+    if isinstance(status, int) and status >= 500 and 'ApiError' not in text:
+        return RetryableError()
+
+    return None
+
+
+class CallScheduler:
+    """
+    The one way calls to the AdWords API are made, so that every worker
+    keeps to the same limits.
+
+    A call waits for a token from the developer token's bucket and then
+    from its customer's, each refilled at a steady rate.  A call that
+    fails with a rate limit or server error is retried after an
+    exponential backoff with jitter, or after `retryAfterSeconds` if the
+    API gave one.  A rate limit also blocks its bucket for that long, so
+    other workers wait too.  If Redis can't be reached calls are made
+    without throttling, as they are when `ADWORDS_RATE_LIMIT_ENABLED` is
+    off; failed calls are still retried.
+
+    `get_stats` returns how many calls were made and retried, how long
+    calls spent throttled and backing off, and how many are waiting for
+    a token now (`queue_depth`).  Stats are best effort: if Redis can't
+    be reached they go uncounted.
+
+    Waiting calls are kept in a Redis sorted set, scored by when they
+    last woke, so one whose worker died stops being counted once it is
+    `queue_lease` seconds old.
+    """
+    key_prefix = 'adwords:rate:'
+    stats_key = 'adwords:scheduler-stats'
+    queue_key = 'adwords:scheduler-queue'
+    queue_lease = 10 * 60
+    # Seconds between warnings that Redis can't be reached, which would
+    # otherwise be logged for every call.
+    warning_interval = 60
+
+    def __init__(
+            self,
+            developer_rate,
+            developer_capacity,
+            customer_rate,
+            customer_capacity,
+            max_retries,
+            base_delay,
+            max_delay,
+            connection=None,
+            sleep=time.sleep):
+        self.developer_rate = developer_rate
+        self.developer_capacity = developer_capacity
+        self.customer_rate = customer_rate
+        self.customer_capacity = customer_capacity
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._connection = connection
+        self._sleep = sleep
+        self._warned_at = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = get_redis_connection()
+
+        return self._connection
+
+    def get_developer_bucket(self):
+        return TokenBucket(
+            self.key_prefix + 'developer',
+            self.developer_rate,
+            self.developer_capacity,
+            self.connection,
+        )
+
+    def get_customer_bucket(self, client_customer_id):
+        return TokenBucket(
+            '{prefix}customer:{client_customer_id}'.format(
+                prefix=self.key_prefix, client_customer_id=client_customer_id),
+            self.customer_rate,
+            self.customer_capacity,
+            self.connection,
+        )
+
+    def _get_buckets(self, client_customer_id):
+        buckets = [self.get_developer_bucket()]
+        if client_customer_id:
+            buckets.append(self.get_customer_bucket(client_customer_id))
+
+        return buckets
+
+    def _warn(self, message, error):
+        now = time.monotonic()
+        if self._warned_at is not None and now - self._warned_at < self.warning_interval:
+            return
+
+        self._warned_at = now
+        logger.warning('{message}: {error}'.format(message=message, error=error))
+
+    def _count(self, stat, amount=1):
+        try:
+            if isinstance(amount, float):
+                self.connection.hincrbyfloat(self.stats_key, stat, amount)
+            else:
+                self.connection.hincrby(self.stats_key, stat, amount)
+        except redis.RedisError as e:
+            self._warn('Could not count AdWords calls', e)
+
+    def _note_waiting(self, waiter):
+        self.connection.zadd(self.queue_key, time.time(), waiter)
+        self.connection.expire(self.queue_key, self.queue_lease)
+
+    def _wait_for_tokens(self, buckets):
+        throttled = 0.0
+        waiter = None
+        try:
+            for bucket in buckets:
+                wait = bucket.take()
+                while wait:
+                    # Only calls that have to wait are queued.
+                    waiter = waiter or uuid.uuid4().hex
+                    self._note_waiting(waiter)
+                    self._sleep(wait)
+                    throttled += wait
+                    wait = bucket.take()
+        finally:
+            if waiter is not None:
+                self.connection.zrem(self.queue_key, waiter)
+
+        if throttled:
+            self._count('throttled_seconds', throttled)
+
+    def get_backoff(self, attempt, retry_after=None):
+        """
+        Return the seconds to wait before retry number `attempt` (from
+        0): an exponential backoff with jitter, but never less than
+        `retry_after`.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+
+        return max(delay, retry_after or 0)
+
+    def call(self, client_customer_id, func, *args, **kwargs):
+        """
+        Call `func` with `args` and `kwargs` once the limits for
+        `client_customer_id` allow, retrying it if it fails in a way
+        that is worth retrying.  `client_customer_id` may be `None` for
+        calls not made for a customer.
+        """
+        buckets = None
+        if settings.ADWORDS_RATE_LIMIT_ENABLED:
+            self._count('calls')
+            buckets = self._get_buckets(client_customer_id)
+
+        attempt = 0
+        while True:
+            if buckets is not None:
+                try:
+                    self._wait_for_tokens(buckets)
+                except redis.RedisError as e:
+                    self._warn('Could not reach Redis, calling the API unthrottled', e)
+                    buckets = None
+
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                retryable = classify_error(e)
+                if retryable is None or attempt >= self.max_retries:
+                    raise
+
+                delay = self.get_backoff(attempt, retryable.retry_after)
+                logger.warning(
+                    'AdWords call failed, retrying in {delay:.1f}s (attempt {attempt})'.format(
+                        delay=delay, attempt=attempt + 1),
+                    exc_info=True,
+                )
+                if buckets is not None:
+                    self._note_retry(buckets, retryable, delay)
+
+            self._sleep(delay)
+            attempt += 1
+
+    def _note_retry(self, buckets, retryable, delay):
+        self._count('retries')
+        self._count('backoff_seconds', float(delay))
+        if retryable.is_rate_exceeded:
+            self._count('rate_exceeded')
+            bucket = buckets[0] if retryable.is_developer_scope else buckets[-1]
+            try:
+                bucket.block(delay)
+            except redis.RedisError as e:
+                self._warn('Could not block a rate limited AdWords bucket', e)
+
+    def get_stats(self):
+        stats = {
+            'calls': 0,
+            'retries': 0,
+            'rate_exceeded': 0,
+            'throttled_seconds': 0.0,
+            'backoff_seconds': 0.0,
+        }
+        for stat, value in self.connection.hgetall(self.stats_key).items():
+            stat = stat.decode()
+            stats[stat] = float(value) if stat.endswith('_seconds') else int(value)
+
+        stats['queue_depth'] = self.connection.zcount(
+            self.queue_key, time.time() - self.queue_lease, '+inf')
+        return stats
+
+    def reset_stats(self):
+        self.connection.delete(self.stats_key)
+
+
+scheduler = CallScheduler(
+    developer_rate=settings.ADWORDS_RATE_LIMIT_DEVELOPER_RATE,
+    developer_capacity=settings.ADWORDS_RATE_LIMIT_DEVELOPER_BURST,
+    customer_rate=settings.ADWORDS_RATE_LIMIT_CUSTOMER_RATE,
+    customer_capacity=settings.ADWORDS_RATE_LIMIT_CUSTOMER_BURST,
+    max_retries=settings.ADWORDS_RETRY_MAX_ATTEMPTS,
+    base_delay=settings.ADWORDS_RETRY_BASE_DELAY,
+    max_delay=settings.ADWORDS_RETRY_MAX_DELAY,
+)
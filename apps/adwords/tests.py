@@ -1,8 +1,43 @@
-from datetime import date
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import gzip
+import io
+import os
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+from urllib.error import HTTPError
 
-from django.test import SimpleTestCase
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
 
-from adwords.adapter import Adapter
+import redis
+
+from adwords.adapter import (
+    ALL_TIME,
+    BACKEND_API,
+    BACKEND_LOCAL,
+    BACKEND_SYNCED,
+    BUDGETS_ALL,
+    Adapter,
+    ReportRequest,
+)
+from adwords.columnar import MISSING, KeywordColumns, _micro_amount
+from adwords.instrumentation import AggregatorSink, CallRecord, Instrumentation, NullSink
+from adwords.mutations import KeywordMutationBuffer
+from adwords.registry import ClientRegistry
+from adwords.report_cache import ReportResultCache, get_report_expiry
+from adwords.scheduler import CallScheduler, classify_error
+from campaign_modifiers.models import KeywordEvent, ModifierProcessLog
+from reports.models import Campaign, CampaignSync, DailyCampaignStats, KeywordSnapshot, MetricsSync
+from reports.sync import (
+    _save_keyword_snapshots,
+    claim_campaign_refresh,
+    get_campaign_sync,
+    get_sync_range,
+)
 
 
 class AdapterTests(SimpleTestCase):
@@ -128,3 +163,1111 @@ class AdapterTests(SimpleTestCase):
             Adapter.get_metrics_shape(empty_metrics),
             {}
         )
+
+
+class FakeClient:
+
+    def __init__(self, refresh_token, client_customer_id, partial_failure=False):
+        self.refresh_token = refresh_token
+        self.client_customer_id = client_customer_id
+        self.partial_failure = partial_failure
+
+    def GetService(self, service_name, version=None):
+        return (service_name, version)
+
+
+class ClientRegistryTests(SimpleTestCase):
+
+    def test_clients_are_reused_per_token_and_customer(self):
+        registry = ClientRegistry(max_clients=4, max_services=4, client_factory=FakeClient)
+
+        client = registry.get_client('token', '123')
+
+        self.assertIs(registry.get_client('token', '123'), client)
+        self.assertIsNot(registry.get_client('token', '456'), client)
+        self.assertEqual(registry.stats['client_hits'], 1)
+        self.assertEqual(registry.stats['client_misses'], 2)
+        self.assertEqual(registry.client_hit_rate, 1 / 3)
+
+    def test_partial_failure_clients_are_kept_apart(self):
+        registry = ClientRegistry(max_clients=4, max_services=4, client_factory=FakeClient)
+
+        client = registry.get_client('token', '123')
+        partial_failure_client = registry.get_client('token', '123', partial_failure=True)
+
+        self.assertIsNot(partial_failure_client, client)
+        self.assertTrue(partial_failure_client.partial_failure)
+        self.assertFalse(client.partial_failure)
+
+    def test_least_recently_used_client_is_evicted_with_its_services(self):
+        registry = ClientRegistry(max_clients=2, max_services=4, client_factory=FakeClient)
+
+        first = registry.get_client('first')
+        registry.get_service(first, 'AdGroupService', 'v1')
+        second = registry.get_client('second')
+        registry.get_client('first')
+        registry.get_client('third')
+
+        self.assertIs(registry.get_client('first'), first)
+        self.assertIsNot(registry.get_client('second'), second)
+        self.assertEqual(registry.stats['service_misses'], 1)
+
+        registry.get_client('fourth')
+        registry.get_client('second')
+        registry.get_service(registry.get_client('first'), 'AdGroupService', 'v1')
+
+        self.assertEqual(registry.stats['service_misses'], 2)
+
+    def test_invalidate_drops_every_client_for_the_token(self):
+        registry = ClientRegistry(max_clients=4, max_services=4, client_factory=FakeClient)
+
+        client = registry.get_client('token', '123')
+        registry.get_client('token', '456')
+        registry.get_client('other', '123')
+        registry.invalidate('token')
+
+        self.assertIsNot(registry.get_client('token', '123'), client)
+        self.assertEqual(registry.stats['invalidations'], 2)
+        self.assertEqual(registry.stats['client_misses'], 4)
+
+    def test_a_slow_build_does_not_hold_up_other_clients(self):
+        building = threading.Event()
+        release = threading.Event()
+
+        def client_factory(refresh_token, client_customer_id=None, partial_failure=False):
+            if refresh_token == 'slow':
+                building.set()
+                release.wait(5)
+            return FakeClient(refresh_token, client_customer_id, partial_failure)
+
+        registry = ClientRegistry(max_clients=4, max_services=4, client_factory=client_factory)
+        slow = threading.Thread(target=registry.get_client, args=('slow', ))
+        slow.start()
+        building.wait(5)
+
+        try:
+            self.assertIsNotNone(registry.get_client('fast'))
+        finally:
+            release.set()
+            slow.join()
+
+    def test_a_client_is_built_once_by_concurrent_callers(self):
+        built = []
+
+        def client_factory(refresh_token, client_customer_id=None, partial_failure=False):
+            built.append(refresh_token)
+            time.sleep(0.05)
+            return FakeClient(refresh_token, client_customer_id, partial_failure)
+
+        registry = ClientRegistry(max_clients=4, max_services=4, client_factory=client_factory)
+        threads = [
+            threading.Thread(target=registry.get_client, args=('token', ))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(built, ['token'])
+        self.assertEqual(registry.stats['client_hits'], 3)
+
+    def test_clients_are_cached_before_their_build_lock_is_dropped(self):
+        registry = ClientRegistry(max_clients=4, max_services=4, client_factory=FakeClient)
+        cached_when_dropped = []
+
+        class KeyLocks(dict):
+
+            def pop(self, key, *default):
+                # A thread arriving now must find the client, not build
+                # another under a new lock.
+                cached_when_dropped.append(key in registry._clients)
+                return super().pop(key, *default)
+
+        registry._key_locks = KeyLocks()
+        registry.get_client('token')
+
+        self.assertEqual(cached_when_dropped, [True])
+
+
+class FakeMutateService:
+
+    def __init__(self, failing_keyword_ids=()):
+        self.failing_keyword_ids = failing_keyword_ids
+        self.calls = []
+
+    def mutate(self, operations):
+        self.calls.append(operations)
+        errors = [
+            SimpleNamespace(
+                fieldPath='operations[{}].operand.userStatus'.format(index),
+                errorString='CriterionError.INVALID_KEYWORD',
+            )
+            for index, operation in enumerate(operations)
+            if operation['operand']['criterion']['id'] in self.failing_keyword_ids
+        ]
+        return SimpleNamespace(partialFailureErrors=errors)
+
+
+class FakeMutateAdapter:
+    should_mutate = True
+
+    def __init__(self, service):
+        self.service = service
+        self.invalidations = 0
+        self.partial_failure_requests = []
+
+    def get_adwords_client(self, partial_failure=False):
+        return SimpleNamespace(client_customer_id='123', partial_failure=partial_failure)
+
+    def get_adwords_service(self, service_name, partial_failure=False):
+        self.partial_failure_requests.append(partial_failure)
+        return self.service
+
+    def invalidate_report_cache(self):
+        self.invalidations += 1
+
+    def call_api(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+
+class KeywordMutationBufferTests(SimpleTestCase):
+
+    @staticmethod
+    def operand(keyword_id, **changes):
+        operand = {'adGroupId': 1, 'criterion': {'id': keyword_id}}
+        operand.update(changes)
+        return operand
+
+    def test_operations_are_sent_in_batches(self):
+        service = FakeMutateService()
+        adapter = FakeMutateAdapter(service)
+        mutation_buffer = KeywordMutationBuffer(adapter, batch_size=2)
+
+        for keyword_id in range(5):
+            mutation_buffer.add(self.operand(keyword_id, userStatus='PAUSED'))
+        mutation_buffer.flush()
+        mutation_buffer.flush()
+
+        self.assertEqual([len(operations) for operations in service.calls], [2, 2, 1])
+        self.assertEqual(mutation_buffer.operation_count, 5)
+        self.assertEqual(len(mutation_buffer), 0)
+        self.assertEqual(adapter.invalidations, 1)
+
+    def test_operations_for_the_same_keyword_are_merged(self):
+        service = FakeMutateService()
+        mutation_buffer = KeywordMutationBuffer(FakeMutateAdapter(service), batch_size=10)
+
+        mutation_buffer.add(self.operand(1, biddingStrategyConfiguration={}))
+        mutation_buffer.add(self.operand(1, userStatus='PAUSED'))
+        mutation_buffer.flush()
+
+        (operation, ), = service.calls
+        self.assertEqual(
+            operation['operand'],
+            self.operand(1, biddingStrategyConfiguration={}, userStatus='PAUSED'),
+        )
+
+    def test_partial_failures_are_mapped_to_keywords(self):
+        adapter = FakeMutateAdapter(FakeMutateService(failing_keyword_ids=(3, )))
+        mutation_buffer = KeywordMutationBuffer(adapter, batch_size=2)
+
+        for keyword_id in range(5):
+            mutation_buffer.add(self.operand(keyword_id, userStatus='PAUSED'))
+        with self.assertLogs('adwords.adapter', 'WARNING'):
+            failures = mutation_buffer.flush()
+
+        self.assertEqual([(failure.ad_group_id, failure.keyword_id) for failure in failures], [(1, 3)])
+        self.assertEqual(mutation_buffer.failures, failures)
+        self.assertEqual(adapter.partial_failure_requests, [True] * 3)
+
+    def test_nothing_is_sent_when_not_mutating(self):
+        service = FakeMutateService()
+        adapter = FakeMutateAdapter(service)
+        adapter.should_mutate = False
+        mutation_buffer = KeywordMutationBuffer(adapter, batch_size=2)
+
+        mutation_buffer.add(self.operand(1, userStatus='PAUSED'))
+        mutation_buffer.flush()
+
+        self.assertEqual(service.calls, [])
+
+
+def make_user(**values):
+    """
+    Create a user without queueing the alert that they registered,
+    which would need the Celery broker.
+    """
+    with mock.patch('accounts.tasks.alert_user_registered.apply_async'):
+        return get_user_model().objects.create(**values)
+
+
+def make_keyword(**values):
+    keyword = {
+        'campaign_id': 1,
+        'ad_group_name': 'Group',
+        'ad_group_id': 10,
+        'id': 100,
+        'keyword': 'shoes',
+        'average_position': 1.5,
+        'clicks': 20,
+        'max_cpc': 250000,
+        'click_assisted_conversions': 3,
+        'conversion_rate': Decimal('12.35'),
+        'cost': 5000000,
+        'impressions': 400,
+        'click_through_rate': Decimal('5'),
+        'cpa': 1666666,
+        'status': 'enabled',
+        'value_per_conversion': 12345678,
+    }
+    keyword.update(values)
+    return keyword
+
+
+class CampaignBudgetsAdapter(Adapter):
+
+    def __init__(self, campaigns, budgets):
+        self._user = SimpleNamespace(has_adwords_account=True)
+        self.campaigns = campaigns
+        self.budgets = budgets
+        self.budget_requests = []
+
+    def get_report(self, name, report_type, date_range_type, selector, **kwargs):
+        return iter(self.campaigns)
+
+    def get_budgets(self, budgets_to_get_ids=BUDGETS_ALL, date_range=None):
+        self.budget_requests.append(budgets_to_get_ids)
+        return iter(self.budgets)
+
+
+class CampaignBudgetsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.adapter = CampaignBudgetsAdapter(
+            [
+                ['1', 'First', 'enabled', '100', '0'],
+                ['2', 'Second', 'enabled', '100', '0'],
+                ['3', 'Third', 'paused', '300', '0'],
+            ],
+            [
+                {'id': 100, 'amount': 5000000, 'name': 'Shared'},
+                {'id': 200, 'amount': 7000000, 'name': 'Unused'},
+            ],
+        )
+
+    def test_budgets_are_joined_to_their_campaigns(self):
+        campaigns = self.adapter.get_campaigns(parallel=False)
+
+        self.assertEqual([campaign['budget'] for campaign in campaigns], [5000000, 5000000, None])
+        self.assertEqual(
+            [campaign['budget_name'] for campaign in campaigns], ['Shared', 'Shared', None])
+
+    def test_campaigns_without_a_budget_are_flagged(self):
+        campaigns = self.adapter.get_campaigns(parallel=False)
+
+        self.assertEqual(
+            [campaign['budget_missing'] for campaign in campaigns], [False, False, True])
+
+    def test_only_the_campaigns_budgets_are_requested(self):
+        self.adapter.get_campaigns(parallel=False)
+
+        self.assertEqual(self.adapter.budget_requests, [{100, 300}])
+
+    def test_every_budget_is_requested_in_parallel(self):
+        campaigns = self.adapter.get_campaigns(parallel=True)
+
+        self.assertEqual(self.adapter.budget_requests, [BUDGETS_ALL])
+        self.assertEqual(
+            [campaign['budget_missing'] for campaign in campaigns], [False, False, True])
+
+    def test_budgets_can_be_left_out(self):
+        campaigns = self.adapter.get_campaigns(get_budgets=False, parallel=True)
+
+        self.assertNotIn('budget', campaigns[0])
+        self.assertEqual(self.adapter.budget_requests, [])
+
+
+class CampaignSyncTests(SimpleTestCase):
+
+    def test_campaigns_never_copied_are_copied_first(self):
+        campaign_sync = CampaignSync(synced_at=None)
+
+        with mock.patch.object(
+                CampaignSync.objects, 'get_or_create', return_value=(campaign_sync, True)), \
+                mock.patch.object(CampaignSync, 'refresh_from_db'), \
+                mock.patch('reports.sync.sync_campaigns') as sync_campaigns:
+            get_campaign_sync(mock.sentinel.user)
+
+        sync_campaigns.assert_called_once_with(mock.sentinel.user)
+
+    def claim_campaign_refresh(self, synced_at, is_queued=1):
+        with mock.patch.object(CampaignSync.objects, 'filter') as filter_:
+            filter_.return_value.filter.return_value.update.return_value = is_queued
+            return claim_campaign_refresh(CampaignSync(pk=1, synced_at=synced_at))
+
+    def test_fresh_campaigns_are_not_refreshed(self):
+        self.assertFalse(self.claim_campaign_refresh(timezone.now()))
+
+    def test_stale_campaigns_are_refreshed(self):
+        self.assertTrue(self.claim_campaign_refresh(timezone.now() - timedelta(hours=1)))
+
+    def test_a_queued_refresh_is_not_claimed_again(self):
+        self.assertFalse(
+            self.claim_campaign_refresh(timezone.now() - timedelta(hours=1), is_queued=0))
+
+    def test_campaigns_without_a_budget_have_a_blank_budget_name(self):
+        fields = Adapter._get_campaign_fields({
+            'title': 'Shoes',
+            'status': 'enabled',
+            'budget': None,
+            'budget_name': None,
+            'click_assisted_conversions': 3,
+        })
+
+        self.assertEqual(fields['budget_name'], '')
+
+
+class CampaignInstanceTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user(
+            email='owner@example.com', refresh_token='token', client_customer_id='123')
+        self.other_user = make_user(
+            email='other@example.com', refresh_token='other token', client_customer_id='123')
+        self.other_campaign = Campaign.objects.create(
+            owner=self.other_user, adwords_campaign_id='1', title='Shoes', is_managed=True)
+
+    @staticmethod
+    def make_campaign(**values):
+        campaign = {
+            'id': 1,
+            'title': 'Shoes',
+            'status': 'enabled',
+            'budget': 5000000,
+            'budget_name': 'Daily',
+            'click_assisted_conversions': 3,
+            'cost': 100,
+        }
+        campaign.update(values)
+        return campaign
+
+    def test_campaigns_are_kept_per_owner(self):
+        instance, = Adapter(self.user)._get_campaign_instances([self.make_campaign()])
+
+        self.assertEqual(instance.owner_id, self.user.pk)
+        self.assertNotEqual(instance.pk, self.other_campaign.pk)
+        self.assertEqual(instance.cost, 100)
+
+        self.other_campaign.refresh_from_db()
+        self.assertEqual(self.other_campaign.owner_id, self.other_user.pk)
+        self.assertEqual(self.other_campaign.status, '')
+
+    def test_changed_campaigns_are_updated(self):
+        adapter = Adapter(self.user)
+        adapter._get_campaign_instances([self.make_campaign()])
+
+        instance, = adapter._get_campaign_instances([self.make_campaign(title='Boots')])
+
+        instance.refresh_from_db()
+        self.assertEqual(instance.title, 'Boots')
+        self.assertEqual(self.user.campaigns.count(), 1)
+
+
+class KeywordSnapshotSyncTests(TestCase):
+
+    def setUp(self):
+        user = make_user(
+            email='owner@example.com', refresh_token='token', client_customer_id='123')
+        self.campaign = Campaign.objects.create(owner=user, adwords_campaign_id='1')
+
+    def make_snapshot(self, keyword_id, **values):
+        snapshot = {
+            'ad_group_id': 2,
+            'ad_group_name': 'Ad group',
+            'keyword_id': keyword_id,
+            'keyword': 'keyword {}'.format(keyword_id),
+            'status': 'enabled',
+            'max_cpc': 1000000,
+            'conversion_rate': Decimal(repr(13.33)),
+        }
+        snapshot.update(values)
+        return KeywordSnapshot(campaign=self.campaign, **snapshot)
+
+    def test_only_changes_are_written(self):
+        _save_keyword_snapshots(self.campaign, [self.make_snapshot(1), self.make_snapshot(2)])
+        unchanged = KeywordSnapshot.objects.get(keyword_id=1)
+
+        with self.assertNumQueries(3):
+            _save_keyword_snapshots(self.campaign, [
+                self.make_snapshot(1),
+                self.make_snapshot(3, max_cpc=2000000),
+            ])
+
+        self.assertEqual(
+            list(self.campaign.keyword_snapshots.order_by('keyword_id').values_list('keyword_id', flat=True)),
+            [1, 3],
+        )
+        self.assertEqual(KeywordSnapshot.objects.get(keyword_id=1).pk, unchanged.pk)
+
+    def test_changed_snapshots_are_updated(self):
+        _save_keyword_snapshots(self.campaign, [self.make_snapshot(1)])
+
+        _save_keyword_snapshots(self.campaign, [self.make_snapshot(1, max_cpc=2000000)])
+
+        snapshot, = self.campaign.keyword_snapshots.all()
+        self.assertEqual(snapshot.max_cpc, 2000000)
+
+
+class LatestKeywordEventTests(TestCase):
+
+    def setUp(self):
+        self.process_log = ModifierProcessLog.objects.create(
+            adwords_campaign_id='1', is_dry_run=False, parameters={})
+        self.now = timezone.now()
+
+    def add_event(self, adwords_keyword_id, created_at, new_max_cpc):
+        return KeywordEvent.objects.create(
+            modifier_process_log=self.process_log,
+            adwords_keyword_id=adwords_keyword_id,
+            action=KeywordEvent.ACTION_CHOICES.increased_cpc,
+            previous_max_cpc=100,
+            new_max_cpc=new_max_cpc,
+            created_at=created_at,
+        )
+
+    def test_the_latest_event_is_chosen_per_keyword(self):
+        self.add_event('1', self.now - timedelta(days=1), 200)
+        latest = self.add_event('1', self.now, 300)
+        self.add_event('2', self.now - timedelta(days=2), 400)
+        self.add_event('3', self.now, 500)
+
+        events = Adapter.get_latest_keyword_events([1, 2, 4])
+
+        self.assertEqual(set(events), {'1', '2'})
+        self.assertEqual(events['1'].pk, latest.pk)
+        self.assertEqual(events['2'].new_max_cpc, 400)
+
+    def test_events_made_at_the_same_time_are_told_apart_by_id(self):
+        self.add_event('1', self.now, 200)
+        last = self.add_event('1', self.now, 300)
+
+        self.assertEqual(Adapter.get_latest_keyword_events(['1'])['1'].pk, last.pk)
+
+    def test_no_keywords_makes_no_query(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(Adapter.get_latest_keyword_events([]), {})
+
+
+class FakeReportDownloader:
+
+    def __init__(self, data):
+        self.data = data
+        self.parameters = None
+
+    def DownloadReportAsStream(self, parameters, **kwargs):
+        self.parameters = parameters
+        return io.BufferedReader(io.BytesIO(gzip.compress(self.data)))
+
+
+class GzippedReportAdapter(Adapter):
+
+    def __init__(self, report_downloader):
+        self.report_downloader = report_downloader
+        self._user = SimpleNamespace(client_customer_id='123-456-7890')
+
+    def get_report_downloader(self):
+        return self.report_downloader
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.values = {}
+        self.expiries = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.expiries[key] = ex
+
+    def sadd(self, key, member):
+        self.values.setdefault(key, set()).add(member)
+
+    def expire(self, key, seconds):
+        self.expiries[key] = seconds
+
+    def smembers(self, key):
+        return set(self.values.get(key, ()))
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def hincrby(self, key, field, amount):
+        counts = self.values.setdefault(key, {})
+        counts[field.encode()] = counts.get(field.encode(), 0) + amount
+
+    def hincrbyfloat(self, key, field, amount):
+        self.hincrby(key, field, amount)
+
+    def zadd(self, key, score, member):
+        self.values.setdefault(key, {})[member] = score
+
+    def zrem(self, key, member):
+        self.values.get(key, {}).pop(member, None)
+
+    def zcount(self, key, min_score, max_score):
+        return sum(
+            1 for score in self.values.get(key, {}).values()
+            if min_score <= score and (max_score == '+inf' or score <= max_score)
+        )
+
+    def hgetall(self, key):
+        return dict(self.values.get(key, {}))
+
+
+@override_settings(ADWORDS_RATE_LIMIT_ENABLED=False)
+class ReportTestCase(SimpleTestCase):
+    """
+    Reports are cached in a `FakeRedis`, not the Redis in settings, and
+    downloaded without waiting on the scheduler's token buckets there.
+    """
+
+    def setUp(self):
+        self.connection = FakeRedis()
+        self.cache = ReportResultCache(max_bytes=1000, max_age=3600, connection=self.connection)
+        patcher = mock.patch('adwords.adapter.report_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class GetReportTests(ReportTestCase):
+
+    def test_gzipped_report_is_decompressed_and_parsed(self):
+        report_downloader = FakeReportDownloader(
+            'Campaign ID,Campaign\n1,Caf\u00e9 \u00a3\n\n2,"Quoted, name"\n'.encode())
+        adapter = GzippedReportAdapter(report_downloader)
+
+        report = adapter.get_report('Report', 'CAMPAIGN_PERFORMANCE_REPORT', 'ALL_TIME', {})
+
+        self.assertEqual(list(report), [['1', 'Caf\u00e9 \u00a3'], ['2', 'Quoted, name']])
+        self.assertEqual(report_downloader.parameters['downloadFormat'], 'GZIPPED_CSV')
+
+    def test_headers_can_be_kept(self):
+        adapter = GzippedReportAdapter(FakeReportDownloader(b'Cost\n100\n'))
+
+        report = adapter.get_report(
+            'Report', 'ACCOUNT_PERFORMANCE_REPORT', 'ALL_TIME', {}, skip_headers=False)
+
+        self.assertEqual(list(report), [['Cost'], ['100']])
+
+
+class SlowReportAdapter(Adapter):
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most_running = 0
+
+    def get_report(self, name, report_type, date_range_type, selector, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        try:
+            time.sleep(self.delays[name])
+            if name == 'broken':
+                raise ValueError(name)
+            return iter([[name, str(kwargs.get('include_zero_impressions'))]])
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class FetchReportsConcurrentlyTests(SimpleTestCase):
+
+    def test_results_arrive_as_they_finish(self):
+        adapter = SlowReportAdapter({'slow': 0.2, 'fast': 0})
+        requests = [
+            ReportRequest('a', adapter, 'slow', 'KEYWORDS_PERFORMANCE_REPORT', 'ALL_TIME', {}),
+            ReportRequest('b', adapter, 'fast', 'KEYWORDS_PERFORMANCE_REPORT', 'ALL_TIME', {},
+                          {'include_zero_impressions': False}),
+        ]
+
+        results = list(Adapter.fetch_reports_concurrently(requests, max_workers=2))
+
+        self.assertEqual([result.request.key for result in results], ['b', 'a'])
+        self.assertEqual(results[0].rows, [['fast', 'False']])
+
+    def test_concurrency_is_capped(self):
+        adapter = SlowReportAdapter({'report': 0.05})
+        requests = (
+            ReportRequest(i, adapter, 'report', 'ACCOUNT_PERFORMANCE_REPORT', 'ALL_TIME', {})
+            for i in range(10)
+        )
+
+        results = list(Adapter.fetch_reports_concurrently(requests, max_workers=3))
+
+        self.assertEqual(sorted(result.request.key for result in results), list(range(10)))
+        self.assertLessEqual(adapter.most_running, 3)
+        self.assertGreater(adapter.most_running, 1)
+
+    def test_errors_are_returned_with_their_request(self):
+        adapter = SlowReportAdapter({'broken': 0, 'report': 0})
+        requests = [
+            ReportRequest('broken', adapter, 'broken', 'ACCOUNT_PERFORMANCE_REPORT', 'ALL_TIME', {}),
+            ReportRequest('report', adapter, 'report', 'ACCOUNT_PERFORMANCE_REPORT', 'ALL_TIME', {}),
+        ]
+
+        results = {
+            result.request.key: result
+            for result in Adapter.fetch_reports_concurrently(requests, max_workers=1)
+        }
+
+        self.assertIsInstance(results['broken'].error, ValueError)
+        self.assertIsNone(results['broken'].rows)
+        self.assertEqual(results['report'].rows, [['report', 'None']])
+
+
+class InstrumentationTests(ReportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.instrumentation = Instrumentation(NullSink())
+        patcher = mock.patch('adwords.adapter.instrumentation', self.instrumentation)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_nothing_is_recorded_by_default(self):
+        self.assertFalse(self.instrumentation.enabled)
+        self.assertIsNone(self.instrumentation.start('report', 'ACCOUNT_PERFORMANCE_REPORT'))
+
+    def test_reports_are_measured_once_read(self):
+        data = b'Cost\n100\n200\n'
+        adapter = GzippedReportAdapter(FakeReportDownloader(data))
+
+        with self.instrumentation.collect() as collector:
+            report = adapter.get_report('Report', 'ACCOUNT_PERFORMANCE_REPORT', 'ALL_TIME', {})
+            self.assertEqual(collector.summary(), [])
+            list(report)
+
+        call, = collector.summary()
+        self.assertEqual(call['kind'], 'report')
+        self.assertEqual(call['name'], 'ACCOUNT_PERFORMANCE_REPORT')
+        self.assertEqual(call['rows'], 2)
+        self.assertEqual(call['bytes'], len(gzip.compress(data)))
+        self.assertFalse(self.instrumentation.enabled)
+
+    def test_calls_are_attributed_to_the_running_modifier(self):
+        with self.instrumentation.collect() as collector:
+            with self.instrumentation.modifier('Zero Clicks'):
+                with self.instrumentation.measure('mutate', 'AdGroupService', '123', operations=4):
+                    pass
+            with self.instrumentation.measure('service', 'AdGroupService'):
+                pass
+
+        summary = {(call['kind'], call['modifier']): call for call in collector.summary()}
+        self.assertEqual(summary['mutate', 'Zero Clicks']['operations'], 4)
+        self.assertIn(('service', None), summary)
+
+    def test_aggregator_totals_by_kind_name_and_modifier(self):
+        collector = AggregatorSink()
+        for seconds, rows in ((1.0, 10), (2.5, 5)):
+            call = CallRecord('report', 'KEYWORDS_PERFORMANCE_REPORT', modifier='Low Position')
+            call.seconds = seconds
+            call.rows = rows
+            collector.record(call)
+        collector.record(CallRecord('mutate', 'AdGroupCriterionService'))
+
+        totals = collector.summary()[0]
+        self.assertEqual(totals['calls'], 2)
+        self.assertEqual(totals['seconds'], 3.5)
+        self.assertEqual(totals['rows'], 15)
+        self.assertEqual(len(collector.summary()), 2)
+
+
+class ReportExpiryTests(SimpleTestCase):
+
+    def get_expiry(self, date_range_type, max_date, now):
+        selector = {'dateRange': {'min': '20170101', 'max': max_date}}
+        return get_report_expiry(
+            date_range_type, selector, now=timezone.make_aware(now, timezone.get_default_timezone()))
+
+    def test_past_ranges_never_expire(self):
+        self.assertIsNone(self.get_expiry('CUSTOM_DATE', '20171001', datetime(2017, 10, 3, 1)))
+        self.assertIsNone(self.get_expiry('CUSTOM_DATE', '20171002', datetime(2017, 10, 3, 3)))
+
+    def test_recent_ranges_expire_when_new_data_is_available(self):
+        self.assertEqual(
+            self.get_expiry('CUSTOM_DATE', '20171002', datetime(2017, 10, 3, 2, 30)), 30 * 60)
+        self.assertEqual(
+            self.get_expiry('CUSTOM_DATE', '20171003', datetime(2017, 10, 3, 9)), 18 * 60 * 60)
+        self.assertEqual(self.get_expiry('ALL_TIME', None, datetime(2017, 10, 3, 9)), 18 * 60 * 60)
+
+
+@override_settings(ADWORDS_REPORT_CACHE_ENABLED=True)
+class ReportResultCacheTests(ReportTestCase):
+
+    def get_report(self, report_downloader, selector):
+        adapter = GzippedReportAdapter(report_downloader)
+        return list(adapter.get_report('Report', 'ACCOUNT_PERFORMANCE_REPORT', 'ALL_TIME', selector))
+
+    def test_reports_are_downloaded_once(self):
+        report_downloader = FakeReportDownloader(b'Cost\n100\n')
+        report_downloader.DownloadReportAsStream = mock.Mock(
+            wraps=report_downloader.DownloadReportAsStream)
+
+        first = self.get_report(report_downloader, {'fields': ['Cost']})
+        second = self.get_report(report_downloader, {'fields': ('Cost', )})
+
+        self.assertEqual(first, [['100']])
+        self.assertEqual(second, first)
+        self.assertEqual(report_downloader.DownloadReportAsStream.call_count, 1)
+        self.assertEqual(self.cache.get_stats()['hits'], 1)
+        self.assertEqual(self.cache.get_stats()['misses'], 1)
+
+    def test_cached_reports_are_not_measured_as_downloads(self):
+        report_downloader = FakeReportDownloader(b'Cost\n100\n')
+        instrumentation = Instrumentation(NullSink())
+
+        with mock.patch('adwords.adapter.instrumentation', instrumentation), \
+                instrumentation.collect() as collector:
+            self.get_report(report_downloader, {'fields': ['Cost']})
+            self.get_report(report_downloader, {'fields': ['Cost']})
+
+        self.assertEqual(
+            sorted((call['kind'], call['calls']) for call in collector.summary()),
+            [('cache', 1), ('report', 1)],
+        )
+
+    def test_invalidation_drops_the_customers_reports(self):
+        report_downloader = FakeReportDownloader(b'Cost\n100\n')
+        self.get_report(report_downloader, {'fields': ['Cost']})
+
+        GzippedReportAdapter(report_downloader).invalidate_report_cache()
+
+        self.assertEqual(self.cache.get_stats()['stores'], 1)
+        self.get_report(report_downloader, {'fields': ['Cost']})
+        self.assertEqual(self.cache.get_stats()['misses'], 2)
+
+    def test_large_reports_are_not_cached(self):
+        cost = os.urandom(2000).hex()
+        report = self.get_report(FakeReportDownloader('Cost\n{}\n'.format(cost).encode()), {})
+
+        self.assertEqual(report, [[cost]])
+        self.assertEqual(self.cache.get_stats()['too_large'], 1)
+        self.assertEqual(self.cache.get_stats()['stores'], 0)
+
+    def test_entries_and_customer_keys_expire(self):
+        self.get_report(FakeReportDownloader(b'Cost\n100\n'), {'fields': ['Cost']})
+
+        customer_key = self.cache._get_customer_key('123-456-7890')
+        key, = self.connection.values[customer_key]
+        self.assertEqual(self.connection.expiries[key], 3600)
+        self.assertEqual(self.connection.expiries[customer_key], 3600)
+
+
+def make_soap_fault(error_type, extra=''):
+    body = (
+        '<soap:Envelope><soap:Body><soap:Fault><detail><ApiExceptionFault>'
+        '<errors><ApiError.Type>{error_type}</ApiError.Type>{extra}</errors>'
+        '</ApiExceptionFault></detail></soap:Fault></soap:Body></soap:Envelope>'
+    ).format(error_type=error_type, extra=extra)
+    return HTTPError('https://adwords.google.com', 500, 'Server Error', {}, io.BytesIO(body.encode()))
+
+
+class FakeBucket:
+
+    def __init__(self, waits=()):
+        self.waits = list(waits)
+        self.blocked_for = None
+
+    def take(self):
+        return self.waits.pop(0) if self.waits else 0
+
+    def block(self, seconds):
+        self.blocked_for = seconds
+
+
+class ClassifyErrorTests(SimpleTestCase):
+
+    def test_rate_exceeded_is_retried_after_the_given_delay(self):
+        retryable = classify_error(make_soap_fault(
+            'RateExceededError',
+            '<rateScope>DEVELOPER</rateScope><retryAfterSeconds>30</retryAfterSeconds>',
+        ))
+
+        self.assertEqual(retryable.retry_after, 30)
+        self.assertTrue(retryable.is_rate_exceeded)
+        self.assertTrue(retryable.is_developer_scope)
+
+    def test_other_api_errors_are_not_retried(self):
+        self.assertIsNone(classify_error(make_soap_fault('AuthenticationError')))
+
+    def test_fault_body_can_still_be_read(self):
+        error = make_soap_fault('AuthenticationError')
+        classify_error(error)
+
+        self.assertIn(b'AuthenticationError', error.fp.read())
+
+    def test_server_errors_are_retried(self):
+        error = HTTPError('https://adwords.google.com', 503, 'Unavailable', {}, io.BytesIO(b''))
+
+        self.assertIsNone(classify_error(error).retry_after)
+
+    def test_report_errors_are_recognised(self):
+        error = SimpleNamespace(
+            code=400, content='<type>RateExceededError.RATE_EXCEEDED</type>')
+
+        self.assertTrue(classify_error(error).is_rate_exceeded)
+
+    def test_other_exceptions_are_not_retried(self):
+        self.assertIsNone(classify_error(ValueError('retryAfterSeconds 3')))
+
+
+@override_settings(ADWORDS_RATE_LIMIT_ENABLED=False)
+class CallSchedulerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.sleeps = []
+        self.connection = FakeRedis()
+        self.scheduler = CallScheduler(
+            developer_rate=10,
+            developer_capacity=10,
+            customer_rate=1,
+            customer_capacity=1,
+            max_retries=2,
+            base_delay=1,
+            max_delay=60,
+            connection=self.connection,
+            sleep=self.sleeps.append,
+        )
+
+    def test_transient_errors_are_retried_with_backoff(self):
+        func = mock.Mock(side_effect=[make_soap_fault('InternalApiError'), 'result'])
+
+        self.assertEqual(self.scheduler.call('123', func, 'selector'), 'result')
+        func.assert_called_with('selector')
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertTrue(0.5 <= self.sleeps[0] <= 1)
+
+    def test_retry_after_is_honoured(self):
+        func = mock.Mock(side_effect=[
+            make_soap_fault('RateExceededError', '<retryAfterSeconds>30</retryAfterSeconds>'),
+            'result',
+        ])
+
+        self.scheduler.call('123', func)
+
+        self.assertEqual(self.sleeps, [30])
+
+    def test_errors_are_raised_once_retries_run_out(self):
+        func = mock.Mock(side_effect=make_soap_fault('InternalApiError'))
+
+        with self.assertRaises(HTTPError):
+            self.scheduler.call('123', func)
+        self.assertEqual(func.call_count, 3)
+
+    def test_other_errors_are_raised_at_once(self):
+        func = mock.Mock(side_effect=make_soap_fault('AuthenticationError'))
+
+        with self.assertRaises(HTTPError):
+            self.scheduler.call('123', func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_backoff_is_capped(self):
+        self.assertLessEqual(self.scheduler.get_backoff(20), 60)
+        self.assertEqual(self.scheduler.get_backoff(0, retry_after=5), 5)
+
+    @override_settings(ADWORDS_RATE_LIMIT_ENABLED=True)
+    def test_calls_wait_for_tokens(self):
+        developer, customer = FakeBucket([0.5]), FakeBucket([0.25, 0.25])
+        self.scheduler._get_buckets = mock.Mock(return_value=[developer, customer])
+
+        self.scheduler.call('123', lambda: None)
+
+        self.assertEqual(self.sleeps, [0.5, 0.25, 0.25])
+        stats = self.scheduler.get_stats()
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['throttled_seconds'], 1.0)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    @override_settings(ADWORDS_RATE_LIMIT_ENABLED=True)
+    def test_rate_limits_block_their_bucket(self):
+        developer, customer = FakeBucket(), FakeBucket()
+        self.scheduler._get_buckets = mock.Mock(return_value=[developer, customer])
+        func = mock.Mock(side_effect=[
+            make_soap_fault('RateExceededError', '<retryAfterSeconds>30</retryAfterSeconds>'),
+            'result',
+        ])
+
+        self.scheduler.call('123', func)
+
+        self.assertIsNone(developer.blocked_for)
+        self.assertEqual(customer.blocked_for, 30)
+        self.assertEqual(self.scheduler.get_stats()['rate_exceeded'], 1)
+
+    @override_settings(ADWORDS_RATE_LIMIT_ENABLED=True)
+    def test_waiting_calls_are_queued(self):
+        depths = []
+        self.scheduler._sleep = lambda wait: depths.append(self.scheduler.get_stats()['queue_depth'])
+        self.scheduler._get_buckets = mock.Mock(return_value=[FakeBucket([0.5])])
+        # One left by a worker that died.
+        self.connection.zadd(
+            self.scheduler.queue_key, time.time() - self.scheduler.queue_lease - 1, 'dead')
+
+        self.scheduler.call('123', lambda: None)
+
+        self.assertEqual(depths, [1])
+        self.assertEqual(self.scheduler.get_stats()['queue_depth'], 0)
+
+    @override_settings(ADWORDS_RATE_LIMIT_ENABLED=True)
+    def test_stats_are_best_effort(self):
+        self.scheduler._get_buckets = mock.Mock(return_value=[FakeBucket()])
+        self.connection.hincrby = mock.Mock(side_effect=redis.ConnectionError('refused'))
+
+        with mock.patch('adwords.scheduler.logger') as logger:
+            self.assertEqual(self.scheduler.call('123', lambda: 'result'), 'result')
+            self.scheduler.call('123', lambda: 'result')
+
+        logger.warning.assert_called_once_with('Could not count AdWords calls: refused')
+
+
+class KeywordColumnsTests(SimpleTestCase):
+    report = [
+        [
+            '1', 'Group', '10', '100', 'shoes', '1.5', '20', '250000', '3', '12.35%',
+            '5000000', '400', '5.00%', '1666666', 'enabled', '12.345678',
+        ],
+        [
+            '1', 'Group', '10', '101', 'boots', '3.2', '0', ' --', '0', '0.00%',
+            '0', '12', '0.00%', '0', 'paused', '0',
+        ],
+    ]
+
+    def test_rows_match_get_keywords(self):
+        columns = KeywordColumns.from_report(self.report)
+
+        self.assertEqual(list(columns.rows())[:1], list(Adapter.parse_keywords(self.report[:1])))
+        self.assertEqual(columns.max_cpc[1], MISSING)
+        self.assertIsNone(list(columns.rows())[1]['max_cpc'])
+
+    def test_from_rows_round_trips(self):
+        rows = list(Adapter.parse_keywords(self.report[:1]))
+
+        self.assertEqual(list(KeywordColumns.from_rows(rows).rows()), rows)
+
+    def test_status_is_categorical(self):
+        columns = KeywordColumns.from_report(self.report)
+
+        self.assertEqual(columns.status_categories, ['enabled', 'paused'])
+        self.assertEqual(list(columns.status), [0, 1])
+        self.assertIsNone(columns.status_code('removed'))
+
+    def test_filtering_and_aggregation(self):
+        columns = KeywordColumns.from_report(self.report)
+        paused = columns.where(code == columns.status_code('paused') for code in columns.status)
+
+        self.assertEqual(len(paused), 1)
+        self.assertEqual(list(paused.id), [101])
+        self.assertEqual(columns.sum('impressions'), 412)
+        self.assertEqual(columns.mean('average_position'), 2.35)
+
+    def test_micro_amount_matches_decimal_conversion(self):
+        for value in ('0', '12', '12.345678', '0.1234567', '-1.5', '.5'):
+            self.assertEqual(_micro_amount(value), int(Decimal(value) * 10 ** 6))
+
+
+class LocalMetricsTests(SimpleTestCase):
+
+    @override_settings(ADWORDS_METRICS_SYNC_INITIAL_DAYS=30)
+    def test_first_sync_range(self):
+        self.assertEqual(
+            get_sync_range(None, date(2017, 9, 1)),
+            (date(2017, 8, 2), date(2017, 8, 31)),
+        )
+
+    def test_sync_range_continues_from_last_sync(self):
+        self.assertEqual(
+            get_sync_range(date(2017, 8, 20), date(2017, 9, 1)),
+            (date(2017, 8, 21), date(2017, 8, 31)),
+        )
+
+    def test_nothing_to_sync_once_synced_through_yesterday(self):
+        self.assertIsNone(get_sync_range(date(2017, 8, 31), date(2017, 9, 1)))
+
+
+@override_settings(ADWORDS_METRICS_SYNC_INITIAL_DAYS=30)
+class MetricsBackendTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user(
+            email='owner@example.com', refresh_token='token', client_customer_id='123')
+        self.adapter = Adapter(self.user)
+
+    def split(self, date_from, date_to):
+        return self.adapter.split_synced_date_range(
+            self.adapter.format_date_range(date_from, date_to))
+
+    def test_synced_ranges_are_read_locally(self):
+        MetricsSync.objects.create(client_customer_id='123', synced_through=date(2017, 8, 31))
+
+        self.assertEqual(self.split(date(2017, 8, 2), date(2017, 8, 31)), [
+            (BACKEND_LOCAL, {'min': '20170802', 'max': '20170831'}),
+        ])
+
+    def test_only_days_past_the_sync_are_downloaded(self):
+        MetricsSync.objects.create(client_customer_id='123', synced_through=date(2017, 8, 31))
+
+        self.assertEqual(self.split(date(2017, 8, 25), date(2017, 9, 3)), [
+            (BACKEND_LOCAL, {'min': '20170825', 'max': '20170831'}),
+            (BACKEND_API, {'min': '20170901', 'max': '20170903'}),
+        ])
+        self.assertEqual(self.split(date(2017, 9, 1), date(2017, 9, 3)), [
+            (BACKEND_API, {'min': '20170901', 'max': '20170903'}),
+        ])
+
+    def test_ranges_before_the_sync_are_downloaded(self):
+        MetricsSync.objects.create(client_customer_id='123', synced_through=date(2017, 8, 31))
+
+        self.assertEqual(self.split(date(2017, 8, 1), date(2017, 8, 20)), [
+            (BACKEND_API, {'min': '20170801', 'max': '20170820'}),
+        ])
+        self.assertEqual(self.adapter.split_synced_date_range(ALL_TIME), [(BACKEND_API, ALL_TIME)])
+
+    def test_unsynced_customers_are_downloaded(self):
+        MetricsSync.objects.create(client_customer_id='123')
+
+        self.assertEqual(self.split(date(2017, 8, 2), date(2017, 8, 31)), [
+            (BACKEND_API, {'min': '20170802', 'max': '20170831'}),
+        ])
+
+    def test_synced_metrics_are_merged(self):
+        MetricsSync.objects.create(client_customer_id='123', synced_through=date(2017, 8, 31))
+        DailyCampaignStats.objects.create(
+            client_customer_id='123',
+            adwords_campaign_id=1,
+            date=date(2017, 8, 31),
+            impressions=100,
+            clicks=10,
+            cost=1000000,
+            conversions=Decimal('2'),
+            click_assisted_conversions=2,
+        )
+
+        with mock.patch.object(Adapter, 'get_report') as get_report:
+            get_report.return_value = [['1', '2017-09-01', '500000']]
+            metrics = self.adapter.get_campaign_metrics(
+                self.adapter.format_date_range(date(2017, 8, 31), date(2017, 9, 1)),
+                cast_dates=False,
+                backend=BACKEND_SYNCED,
+            )
+
+        self.assertEqual(sorted(metrics), ['2017-08-31', '2017-09-01'])
+        self.assertEqual(metrics['2017-08-31']['cost'], 1000000)
+        self.assertEqual(metrics['2017-09-01']['conversions'], Decimal('1'))
+        _, _, _, selector = get_report.call_args[0]
+        self.assertEqual(selector['dateRange'], {'min': '20170901', 'max': '20170901'})
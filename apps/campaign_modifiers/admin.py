@@ -1,6 +1,11 @@
+from django.conf.urls import url
 from django.contrib import admin
+from django.db.models import Avg, Count, Max, Sum
+from django.template.response import TemplateResponse
 
-from .models import ModifierLog, ModifierProcessLog, KeywordActionLog, KeywordEvent
+from .models import (
+    ModifierLog, ModifierProcessLog, KeywordActionLog, KeywordEvent, ScheduledRunLog,
+)
 
 
 class ModifierLogInline(admin.TabularInline):
@@ -49,12 +54,109 @@ class ModifierProcessLogAdmin(admin.ModelAdmin):
         ModifierLogInline,
         KeywordEventInline,
     )
+    change_list_template = 'admin/campaign_modifiers/modifierprocesslog/change_list.html'
+
+    # Process logs the profile covers unless `?runs=` says otherwise,
+    # and rows shown in each of its tables.
+    profile_runs = 100
+    profile_rows = 20
+
+    def get_urls(self):
+        return [
+            url(
+                r'^profile/$',
+                self.admin_site.admin_view(self.profile_view),
+                name='campaign_modifiers_modifierprocesslog_profile',
+            ),
+        ] + super().get_urls()
+
+    def get_profile(self, runs):
+        """
+        Return the slowest modifiers and campaigns over the last `runs`
+        completed process logs, by total time taken.
+        """
+        process_log_ids = list(
+            ModifierProcessLog.objects
+            .filter(completed_at__isnull=False)
+            .order_by('-started_at')
+            .values_list('id', flat=True)[:runs]
+        )
+        modifier_logs = ModifierLog.objects.filter(
+            modifier_process_log__in=process_log_ids,
+            completed_at__isnull=False,
+        )
+        totals = {
+            'total_seconds': Sum('duration_seconds'),
+            'api_calls': Sum('api_calls'),
+            'api_seconds': Sum('api_seconds'),
+            'db_queries': Sum('db_queries'),
+            'db_seconds': Sum('db_seconds'),
+            'report_bytes': Sum('report_bytes'),
+            'keywords_evaluated': Sum('keywords_evaluated'),
+            'keywords_mutated': Sum('keywords_mutated'),
+        }
+
+        slowest_modifiers = modifier_logs \
+            .values('modifier_name') \
+            .annotate(
+                runs=Count('id'),
+                average_seconds=Avg('duration_seconds'),
+                max_seconds=Max('duration_seconds'),
+                **totals
+            ) \
+            .order_by('-total_seconds')[:self.profile_rows]
+
+        slowest_campaigns = modifier_logs \
+            .values('modifier_process_log__adwords_campaign_id') \
+            .annotate(runs=Count('modifier_process_log', distinct=True), **totals) \
+            .order_by('-total_seconds')[:self.profile_rows]
+
+        return slowest_modifiers, slowest_campaigns
+
+    def profile_view(self, request):
+        try:
+            runs = max(int(request.GET.get('runs', self.profile_runs)), 1)
+        except ValueError:
+            runs = self.profile_runs
+
+        slowest_modifiers, slowest_campaigns = self.get_profile(runs)
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title='Slowest modifiers and campaigns',
+            runs=runs,
+            slowest_modifiers=slowest_modifiers,
+            slowest_campaigns=slowest_campaigns,
+        )
+        return TemplateResponse(
+            request, 'admin/campaign_modifiers/modifierprocesslog/profile.html', context)
 
 
 @admin.register(ModifierLog)
 class ModifierLogAdmin(admin.ModelAdmin):
-    list_display = ('modifier_name', 'campaign_id', 'started_at', 'completed_at', )
-    readonly_fields = ('modifier_process_log', 'modifier_name', 'started_at', 'completed_at', )
+    list_display = (
+        'modifier_name',
+        'campaign_id',
+        'started_at',
+        'completed_at',
+        'duration_seconds',
+        'api_seconds',
+        'db_seconds',
+    )
+    readonly_fields = (
+        'modifier_process_log',
+        'modifier_name',
+        'started_at',
+        'completed_at',
+        'duration_seconds',
+        'keywords_evaluated',
+        'keywords_mutated',
+        'api_calls',
+        'api_seconds',
+        'report_bytes',
+        'db_queries',
+        'db_seconds',
+    )
     date_hierarchy = 'started_at'
     ordering = ('-started_at', )
     inlines = (
@@ -63,3 +165,19 @@ class ModifierLogAdmin(admin.ModelAdmin):
 
     def campaign_id(self, obj):
         return obj.modifier_process_log.adwords_campaign_id
+
+
+@admin.register(ScheduledRunLog)
+class ScheduledRunLogAdmin(admin.ModelAdmin):
+    list_display = (
+        'started_at', 'completed_at', 'duration', 'status', 'campaign_count', 'failed_count', )
+    readonly_fields = (
+        'started_at',
+        'completed_at',
+        'status',
+        'campaign_count',
+        'failed_count',
+        'campaign_runs',
+    )
+    date_hierarchy = 'started_at'
+    ordering = ('-started_at', )
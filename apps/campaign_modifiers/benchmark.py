@@ -0,0 +1,333 @@
+"""
+Synthetic accounts and a local AdWords backend, for timing the
+modifiers end to end with `manage.py benchmark_modifiers`.
+
+Reports are read from gzipped CSV files written by
+`write_keywords_report` and `write_campaigns_report`, and mutations are
+recorded rather than sent, so everything but the API itself runs as it
+does in production: report parsing, the modifiers, the action logs and
+the database.
+"""
+import csv
+from decimal import Decimal
+import gzip
+import os
+import random
+import resource
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from adwords.adapter import Adapter
+from adwords.instrumentation import instrumentation
+from reports.models import Campaign
+
+from .models import ModifierProcessLog
+from .utils import ModifierProcess, QueryCounter
+
+
+KEYWORDS_PER_AD_GROUP = 20
+
+# Every this many ad groups has no enabled keywords, for
+# `PauseEmptyAdGroups` to find.
+EMPTY_AD_GROUP_EVERY = 50
+
+# The settings each benchmark campaign is run with.
+CAMPAIGN_SETTINGS = {
+    'is_managed': True,
+    'target_cpa': 20 * 10 ** 6,
+    'target_conversion_margin': Decimal('30.000'),
+    'max_cpc_limit': 10 * 10 ** 6,
+    'cycle_period_days': 30,
+}
+
+
+def write_keywords_report(path, adwords_campaign_id, keyword_count, seed=0):
+    """
+    Write a keywords report for one campaign of `keyword_count`
+    keywords to `path`, with the columns `Adapter.get_keyword_selector`
+    asks for.  The same `seed` always writes the same report.
+    """
+    rng = random.Random(seed)
+
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as report:
+        writer = csv.writer(report)
+        writer.writerow([
+            'Campaign ID', 'Ad group', 'Ad group ID', 'Keyword ID', 'Keyword',
+            'Avg. position', 'Clicks', 'Max. CPC', 'Click assisted conv.',
+            'Conv. rate', 'Cost', 'Impressions', 'CTR', 'Cost / conv.',
+            'Keyword state', 'Value / conv.',
+        ])
+
+        for index in range(keyword_count):
+            ad_group = index // KEYWORDS_PER_AD_GROUP
+            if ad_group % EMPTY_AD_GROUP_EVERY == 0 or rng.random() < 0.1:
+                status = 'paused'
+            else:
+                status = 'enabled'
+
+            impressions = rng.choice((0, rng.randint(1, 100), rng.randint(100, 20000)))
+            clicks = rng.randint(0, impressions // 10) if rng.random() < 0.7 else 0
+            conversions = rng.randint(0, clicks // 5)
+            max_cpc = rng.randrange(10 ** 5, 5 * 10 ** 6, 10 ** 4)
+            cost = clicks * rng.randrange(10 ** 4, max_cpc + 1, 10 ** 4)
+
+            writer.writerow([
+                adwords_campaign_id,
+                'Ad group {}'.format(ad_group),
+                10 ** 9 + ad_group,
+                10 ** 10 + index,
+                'keyword {}'.format(index),
+                '{:.1f}'.format(rng.uniform(1, 8)) if impressions else '0.0',
+                clicks,
+                max_cpc,
+                rng.randint(0, 3),
+                '{:.2f}%'.format(100 * conversions / clicks if clicks else 0),
+                cost,
+                impressions,
+                '{:.2f}%'.format(100 * clicks / impressions if impressions else 0),
+                cost // conversions if conversions else 0,
+                status,
+                '{:.2f}'.format(rng.uniform(0, 200)) if conversions else '0',
+            ])
+
+
+def write_campaigns_report(path, adwords_campaign_id):
+    """
+    Write a campaigns report holding just `adwords_campaign_id` to
+    `path`, with the columns `Adapter.get_campaigns` asks for.
+    """
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as report:
+        writer = csv.writer(report)
+        writer.writerow(['Campaign ID', 'Campaign', 'Campaign state', 'Budget ID', 'Click assisted conv.'])
+        writer.writerow([adwords_campaign_id, 'Benchmark campaign', 'enabled', 1, 250])
+
+
+def get_benchmark_campaign(adwords_campaign_id, conversion_type):
+    """
+    Return the managed campaign, and its owner, to run the benchmark
+    account `adwords_campaign_id` as, saving them if they aren't yet.
+    """
+    owner, _ = get_user_model().objects.get_or_create(
+        email='benchmark@example.com',
+        defaults={'refresh_token': 'benchmark', 'client_customer_id': 'benchmark'},
+    )
+    campaign, _ = Campaign.objects.update_or_create(
+        owner=owner,
+        adwords_campaign_id=adwords_campaign_id,
+        defaults=dict(CAMPAIGN_SETTINGS, conversion_type=conversion_type),
+    )
+
+    return campaign
+
+
+class MutationRecorder:
+    """
+    Stands in for the AdWords client and its services, keeping the
+    operations sent to `mutate` rather than sending them.
+    """
+
+    def __init__(self, client_customer_id):
+        self.client_customer_id = client_customer_id
+        self.requests = 0
+        self.operations = 0
+
+    def mutate(self, operations):
+        self.requests += 1
+        self.operations += len(operations)
+
+        return None
+
+
+class LocalAdapter(Adapter):
+    """
+    An `Adapter` reading its reports from the files in `reports`, a
+    dict of report type to path, and recording its mutations in
+    `mutations`.  Reports are read afresh on each request, as they
+    would be downloaded, and never cached.
+    """
+    should_mutate = True
+
+    def __init__(self, user, reports):
+        super().__init__(user)
+        self.reports = reports
+        self.mutations = MutationRecorder(user.client_customer_id)
+
+    def call_api(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    def get_adwords_client(self, partial_failure=False):
+        return self.mutations
+
+    def get_adwords_service(self, service_name, partial_failure=False):
+        return self.mutations
+
+    def _download_report(self, parameters, include_zero_impressions):
+        return open(self.reports[parameters['reportType']], 'rb')
+
+    def _get_cached_report(self, parameters, include_zero_impressions):
+        return self._download_report(parameters, include_zero_impressions), False
+
+    def invalidate_report_cache(self):
+        pass
+
+
+def get_peak_rss():
+    """
+    Return the most memory, in MB, the process has held at once.
+    """
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    if sys.platform == 'darwin':
+        peak_rss /= 1024
+
+    return round(peak_rss / 1024, 1)
+
+
+class MeasuredModifier:
+    """
+    Wraps a modifier to note the peak memory use once it has run, in
+    `peak_rss` by modifier name.
+    """
+
+    def __init__(self, modifier, peak_rss):
+        self._modifier = modifier
+        self._peak_rss = peak_rss
+
+    @property
+    def name(self):
+        return self._modifier.name
+
+    def run(self, *args, **kwargs):
+        try:
+            return self._modifier.run(*args, **kwargs)
+        finally:
+            self._peak_rss[self.name] = get_peak_rss()
+
+
+def run_benchmark(campaign, modifiers, adapter):
+    """
+    Run `modifiers` over `campaign` with `ModifierProcess` as the
+    scheduled run does, and return what the whole run and each
+    modifier (stage) took:  wall time, peak memory, database queries,
+    API calls and keywords evaluated and mutated.  Peak memory is for
+    the process so far, so it only grows from stage to stage.
+
+    Logs left by an earlier run for the campaign are deleted first, so
+    that every run starts from the same database.
+    """
+    adwords_campaign_id = campaign.adwords_campaign_id
+    ModifierProcessLog.objects.filter(adwords_campaign_id=adwords_campaign_id).delete()
+
+    peak_rss = {}
+    queries = QueryCounter()
+    start = time.monotonic()
+    with connection.execute_wrapper(queries), instrumentation.collect() as api_calls:
+        ModifierProcess().run(
+            [MeasuredModifier(modifier, peak_rss) for modifier in modifiers],
+            adapter,
+            adwords_campaign_id,
+            is_dry_run=False,
+            target_cpa=campaign.target_cpa,
+            target_conversion_margin=campaign.target_conversion_margin,
+            max_cpc_limit=campaign.max_cpc_limit,
+            cycle_period=campaign.cycle_period_days,
+        )
+    wall_seconds = time.monotonic() - start
+
+    process_log = ModifierProcessLog.objects.get(adwords_campaign_id=adwords_campaign_id)
+    stages = [
+        {
+            'name': modifier_log.modifier_name,
+            'wall_seconds': round(modifier_log.duration_seconds, 3),
+            'peak_rss_mb': peak_rss.get(modifier_log.modifier_name),
+            'db_queries': modifier_log.db_queries,
+            'db_seconds': round(modifier_log.db_seconds, 3),
+            'api_calls': modifier_log.api_calls,
+            'api_seconds': round(modifier_log.api_seconds, 3),
+            'keywords_evaluated': modifier_log.keywords_evaluated,
+            'keywords_mutated': modifier_log.keywords_mutated,
+        }
+        for modifier_log in process_log.modifier_logs.order_by('pk')
+    ]
+
+    return {
+        'wall_seconds': round(wall_seconds, 3),
+        'peak_rss_mb': get_peak_rss(),
+        'db_queries': queries.count,
+        'db_seconds': round(queries.seconds, 3),
+        'api_calls': sum(
+            call['calls'] for call in api_calls.summary() if call['kind'] != 'cache'),
+        'mutate_requests': adapter.mutations.requests,
+        'mutate_operations': adapter.mutations.operations,
+        'stages': stages,
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Return a message for each way `results` is worse than `baseline`,
+    both lists of benchmark results keyed by `chain` and `keywords`.
+    Query and API call counts should not change from run to run, so
+    any increase is a regression; wall time and memory may grow by the
+    fraction `tolerance` first.  Benchmarks missing from either side
+    are ignored.
+    """
+    baseline = {(result['chain'], result['keywords']): result for result in baseline}
+
+    regressions = []
+    for result in results:
+        try:
+            expected = baseline[(result['chain'], result['keywords'])]
+        except KeyError:
+            continue
+
+        label = '{chain} chain, {keywords} keywords'.format(**result)
+        for metric in ('wall_seconds', 'peak_rss_mb'):
+            if result[metric] > expected[metric] * (1 + tolerance):
+                regressions.append('{label}: {metric} rose from {expected} to {actual}'.format(
+                    label=label, metric=metric, expected=expected[metric], actual=result[metric]))
+
+        expected_stages = {stage['name']: stage for stage in expected['stages']}
+        counted = [(label, result, expected)] + [
+            ('{}, {}'.format(label, stage['name']), stage, expected_stages[stage['name']])
+            for stage in result['stages']
+            if stage['name'] in expected_stages
+        ]
+        for stage_label, actual, expected_stage in counted:
+            for metric in ('db_queries', 'api_calls'):
+                if actual[metric] > expected_stage[metric]:
+                    regressions.append('{label}: {metric} rose from {expected} to {actual}'.format(
+                        label=stage_label,
+                        metric=metric,
+                        expected=expected_stage[metric],
+                        actual=actual[metric],
+                    ))
+
+    return regressions
+
+
+def get_fixture_paths(fixtures_dir, keyword_count):
+    """
+    Return the keywords and campaigns report paths for an account of
+    `keyword_count` keywords, writing the reports if they aren't there.
+    Each size of account has a campaign id of its own.
+    """
+    adwords_campaign_id = keyword_count
+    paths = {
+        'KEYWORDS_PERFORMANCE_REPORT': os.path.join(
+            fixtures_dir, 'keywords-{}.csv.gz'.format(keyword_count)),
+        'CAMPAIGN_PERFORMANCE_REPORT': os.path.join(
+            fixtures_dir, 'campaigns-{}.csv.gz'.format(keyword_count)),
+    }
+
+    os.makedirs(fixtures_dir, exist_ok=True)
+    if not os.path.exists(paths['KEYWORDS_PERFORMANCE_REPORT']):
+        write_keywords_report(
+            paths['KEYWORDS_PERFORMANCE_REPORT'], adwords_campaign_id, keyword_count)
+    if not os.path.exists(paths['CAMPAIGN_PERFORMANCE_REPORT']):
+        write_campaigns_report(paths['CAMPAIGN_PERFORMANCE_REPORT'], adwords_campaign_id)
+
+    return adwords_campaign_id, paths
@@ -0,0 +1,364 @@
+"""
+Bid decisions for the modifiers, made with array operations over a
+campaign's `KeywordColumns` rather than one keyword at a time.
+
+Each decision function matches the arithmetic the modifiers used to do
+per keyword, including Python's round-half-to-even.  Where a value is
+computed in floating point but the original used `Decimal`, keywords
+that land close enough to a rounding or comparison boundary for the
+two to disagree are recomputed exactly.
+"""
+import decimal
+import math
+
+import numpy as np
+
+from adwords.columnar import MISSING
+
+
+NO_ACTION = 0
+INCREASED_CPC = 1
+DECREASED_CPC = 2
+PAUSED = 3
+
+BID_STEP = 10 ** 4
+
+# Relative distance from a boundary within which a floating point
+# result is recomputed exactly.
+TOLERANCE = 1e-9
+
+
+class Decisions:
+    """
+    What a modifier decided for each keyword it considered:
+
+        * `indexes` - The keyword's row in the `KeywordColumns`.
+        * `actions` - One of `NO_ACTION`, `INCREASED_CPC`,
+        `DECREASED_CPC` or `PAUSED`.
+        * `mutate` - Whether the keyword should be sent to the API.
+        * `new_max_cpc` - The new bid in micros, or `MISSING` if none
+        was calculated.
+
+    `context` holds the campaign-wide values the decisions were based
+    on.  Iterating yields `(index, action, mutate, new_max_cpc)` as
+    plain Python values.
+    """
+
+    def __init__(self, indexes, actions, mutate, new_max_cpc, context=None):
+        self.indexes = indexes
+        self.actions = actions
+        self.mutate = mutate
+        self.new_max_cpc = new_max_cpc
+        self.context = context or {}
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __iter__(self):
+        return zip(
+            self.indexes.tolist(),
+            self.actions.tolist(),
+            self.mutate.tolist(),
+            self.new_max_cpc.tolist(),
+        )
+
+    @classmethod
+    def empty(cls, context=None):
+        return cls(
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int8),
+            np.empty(0, dtype=bool),
+            np.empty(0, dtype=np.int64),
+            context,
+        )
+
+
+def column(columns, name):
+    """
+    Return column `name` of `columns` as a NumPy array, without copying.
+    """
+    values = getattr(columns, name)
+    dtype = np.int64 if values.typecode == 'q' else np.float64
+    if not len(values):
+        return np.empty(0, dtype=dtype)
+
+    return np.frombuffer(values, dtype=dtype)
+
+
+def round_bid(values):
+    """
+    Round integer micro amounts to the nearest `BID_STEP`, half to
+    even, as `round(value, -4)` does for an `int`.
+    """
+    quotient, remainder = np.divmod(values, BID_STEP)
+    half = BID_STEP // 2
+    round_up = (remainder > half) | ((remainder == half) & (quotient % 2 == 1))
+
+    return (quotient + round_up) * BID_STEP
+
+
+def _near(values, boundaries):
+    scale = np.maximum(np.abs(boundaries), 1)
+    return np.abs(values - boundaries) <= TOLERANCE * scale
+
+
+def _bid_actions(mutate, new_max_cpc, max_cpc):
+    actions = np.full(len(mutate), NO_ACTION, dtype=np.int8)
+    actions[mutate & (new_max_cpc > max_cpc)] = INCREASED_CPC
+    actions[mutate & (new_max_cpc < max_cpc)] = DECREASED_CPC
+
+    return actions
+
+
+def _skipped(columns, indexes, is_skipped):
+    keyword_ids = column(columns, 'id')[indexes]
+
+    return np.asarray(is_skipped(keyword_ids), dtype=bool)
+
+
+def _exact_percentage(value):
+    return decimal.Decimal(repr(float(value)))
+
+
+def high_cost_per_acquisition(columns, target_cpa, is_skipped):
+    """
+    Cut the bid by 20% on keywords costing over 120% of `target_cpa`.
+    """
+    indexes = np.arange(len(columns))
+    max_cpc = column(columns, 'max_cpc')
+
+    mutate = (
+        ~_skipped(columns, indexes, is_skipped) &
+        (column(columns, 'cpa') > 1.2 * target_cpa) &
+        (max_cpc != MISSING)
+    )
+
+    new_max_cpc = np.full(len(indexes), MISSING, dtype=np.int64)
+    new_max_cpc[mutate] = round_bid(np.trunc(max_cpc[mutate] * 0.8).astype(np.int64))
+
+    return Decisions(indexes, _bid_actions(mutate, new_max_cpc, max_cpc), mutate, new_max_cpc)
+
+
+def low_cost_per_acquisition(columns, target_cpa, max_cpc_limit, is_skipped):
+    """
+    Raise the bid by 20%, up to `max_cpc_limit`, on keywords costing
+    under 80% of `target_cpa`.
+    """
+    indexes = np.arange(len(columns))
+    max_cpc = column(columns, 'max_cpc')
+
+    mutate = (
+        ~_skipped(columns, indexes, is_skipped) &
+        (column(columns, 'cpa') < 0.8 * target_cpa) &
+        (max_cpc != MISSING)
+    )
+
+    new_max_cpc = np.full(len(indexes), MISSING, dtype=np.int64)
+    new_max_cpc[mutate] = round_bid(np.minimum(
+        np.trunc(max_cpc[mutate] * 1.2).astype(np.int64),
+        max_cpc_limit,
+    ))
+
+    return Decisions(indexes, _bid_actions(mutate, new_max_cpc, max_cpc), mutate, new_max_cpc)
+
+
+def _round_to_bid(values, exact):
+    """
+    Round floating point micro amounts half to even onto `BID_STEP`,
+    recomputing those within `TOLERANCE` of a tie with `exact(i)`.
+    """
+    steps = values / BID_STEP
+    rounded = np.round(steps).astype(np.int64) * BID_STEP
+
+    for i in np.flatnonzero(_near(steps, np.floor(steps) + 0.5)).tolist():
+        rounded[i] = int(exact(i))
+
+    return rounded
+
+
+def _truncate_to_bid(values, exact):
+    """
+    Truncate floating point micro amounts to integers, then round them
+    onto `BID_STEP`, recomputing those within `TOLERANCE` of an integer
+    with `exact(i)`.
+    """
+    truncated = np.trunc(values).astype(np.int64)
+    rounded = round_bid(truncated)
+
+    for i in np.flatnonzero(_near(values, np.round(values))).tolist():
+        rounded[i] = int(exact(i))
+
+    return rounded
+
+
+def target_cost_per_acquisition(columns, target_cpa, max_cpc_limit, is_skipped):
+    """
+    Bid `target_cpa` times the conversion rate, up to `max_cpc_limit`,
+    on keywords with at least three click assisted conversions.
+    """
+    indexes = np.flatnonzero(column(columns, 'click_assisted_conversions') >= 3)
+    max_cpc = column(columns, 'max_cpc')[indexes]
+    conversion_rate = column(columns, 'conversion_rate')[indexes]
+
+    mutate = ~_skipped(columns, indexes, is_skipped) & (max_cpc != MISSING)
+
+    def exact(i):
+        value = min(target_cpa * _exact_percentage(conversion_rate[i]), max_cpc_limit)
+        return round(value, -4)
+
+    new_max_cpc = np.full(len(indexes), MISSING, dtype=np.int64)
+    new_max_cpc[mutate] = _round_to_bid(
+        np.minimum(target_cpa * conversion_rate[mutate], max_cpc_limit),
+        lambda i: exact(np.flatnonzero(mutate)[i]),
+    )
+
+    return Decisions(indexes, _bid_actions(mutate, new_max_cpc, max_cpc), mutate, new_max_cpc)
+
+
+def target_cost_per_acquisition_margin(
+        columns, target_conversion_margin, max_cpc_limit, is_skipped):
+    """
+    Bid the value per conversion times `target_conversion_margin`
+    percent times the conversion rate, up to `max_cpc_limit`, on
+    keywords with at least three click assisted conversions.
+    """
+    indexes = np.flatnonzero(column(columns, 'click_assisted_conversions') >= 3)
+    max_cpc = column(columns, 'max_cpc')[indexes]
+    conversion_rate = column(columns, 'conversion_rate')[indexes]
+    value_per_conversion = column(columns, 'value_per_conversion')[indexes]
+
+    mutate = (
+        ~_skipped(columns, indexes, is_skipped) &
+        (max_cpc != MISSING) &
+        (value_per_conversion != MISSING)
+    )
+
+    def exact(i):
+        value = min(
+            decimal.Decimal(int(value_per_conversion[i]) * (target_conversion_margin / 100)) *
+            _exact_percentage(conversion_rate[i]),
+            max_cpc_limit,
+        )
+        return round(int(value), -4)
+
+    margin = float(target_conversion_margin) / 100
+    new_max_cpc = np.full(len(indexes), MISSING, dtype=np.int64)
+    new_max_cpc[mutate] = _truncate_to_bid(
+        np.minimum(value_per_conversion[mutate] * margin * conversion_rate[mutate], max_cpc_limit),
+        lambda i: exact(np.flatnonzero(mutate)[i]),
+    )
+
+    return Decisions(indexes, _bid_actions(mutate, new_max_cpc, max_cpc), mutate, new_max_cpc)
+
+
+def _pause(indexes, pause):
+    actions = np.where(pause, PAUSED, NO_ACTION).astype(np.int8)
+    new_max_cpc = np.full(len(indexes), MISSING, dtype=np.int64)
+
+    return actions, pause, new_max_cpc
+
+
+def zero_clicks(columns, target_cpa, is_skipped):
+    """
+    Pause keywords that have cost over three times `target_cpa`.
+    """
+    indexes = np.flatnonzero(column(columns, 'cost') > target_cpa * 3)
+    pause = ~_skipped(columns, indexes, is_skipped)
+
+    return Decisions(indexes, *_pause(indexes, pause))
+
+
+def zero_clicks_margin(columns, is_skipped):
+    """
+    Pause keywords that have cost at least twice the average CPA.
+    """
+    if not len(columns):
+        return Decisions.empty()
+
+    cpa = column(columns, 'cpa')
+    average_cpa = int(cpa.sum()) / len(cpa)
+
+    indexes = np.flatnonzero(column(columns, 'cost') >= 2 * average_cpa)
+    pause = ~_skipped(columns, indexes, is_skipped)
+
+    return Decisions(indexes, *_pause(indexes, pause), context={'average_cpa': average_cpa})
+
+
+def low_position(columns, campaign_conversions, is_skipped):
+    """
+    Pause keywords far below the campaign's average position that have
+    too few click assisted conversions.
+    """
+    if not len(columns):
+        return Decisions.empty()
+
+    average_position = column(columns, 'average_position')
+    # Summed in order, exactly as `sum()` over the keywords would.
+    avg_average_position = sum(columns.average_position) / len(average_position)
+
+    # `required_conversions` is the minimum conversions a keyword
+    # must have if its position is over `maximum_position`.
+    required_conversions = math.ceil(campaign_conversions / 200)
+    maximum_position = max(
+        avg_average_position + 7,
+        avg_average_position * 3,
+    )
+
+    indexes = np.arange(len(columns))
+    pause = (
+        ~_skipped(columns, indexes, is_skipped) &
+        (average_position > maximum_position) &
+        (column(columns, 'click_assisted_conversions') < required_conversions)
+    )
+
+    context = {
+        'campaign_conversions': campaign_conversions,
+        'maximum_position': maximum_position,
+        'avg_average_position': avg_average_position,
+        'required_conversions': required_conversions,
+    }
+    return Decisions(indexes, *_pause(indexes, pause), context=context)
+
+
+def _below_fifth_of_average(values):
+    """
+    Return a mask of `values` below a fifth of their mean, comparing
+    those close to the threshold exactly, as `Decimal`s.
+    """
+    average = values.sum() / len(values)
+    required = average / 5
+    below = values < required
+
+    near = np.flatnonzero(_near(values, required))
+    if len(near):
+        exact_values = [_exact_percentage(value) for value in values.tolist()]
+        exact_required = sum(exact_values) / len(exact_values) / 5
+        for i in near.tolist():
+            below[i] = exact_values[i] < exact_required
+
+    return below, average, required
+
+
+def low_click_through_rate(columns, is_skipped):
+    """
+    Pause keywords whose click through rate and conversion rate are
+    both below a fifth of the campaign's average.
+    """
+    if not len(columns):
+        return Decisions.empty()
+
+    low_ctr, avg_ctr, required_ctr = _below_fifth_of_average(
+        column(columns, 'click_through_rate'))
+    low_conv_rate, avg_conv_rate, required_conv_rate = _below_fifth_of_average(
+        column(columns, 'conversion_rate'))
+
+    indexes = np.arange(len(columns))
+    pause = ~_skipped(columns, indexes, is_skipped) & low_ctr & low_conv_rate
+
+    context = {
+        'avg_ctr': float(avg_ctr),
+        'avg_conv_rate': float(avg_conv_rate),
+        'required_ctr': float(required_ctr),
+        'required_conv_rate': float(required_conv_rate),
+    }
+    return Decisions(indexes, *_pause(indexes, pause), context=context)
@@ -0,0 +1,103 @@
+from contextlib import contextmanager
+import logging
+import threading
+import time
+import uuid
+
+from website.utils import get_redis_connection
+
+
+# Drop slots older than the lease, then take one if any are free.
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local lease = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - lease)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('EXPIRE', KEYS[1], math.ceil(lease))
+    return 1
+end
+return 0
+"""
+
+# Move a slot's score up to now, unless it has already been dropped.
+RENEW_SCRIPT = """
+if redis.call('ZSCORE', KEYS[1], ARGV[2]) then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3])))
+    return 1
+end
+return 0
+"""
+
+
+class CustomerSemaphore:
+    """
+    Limits how many campaigns of one AdWords customer have their
+    modifiers run at once, across every worker.
+
+    Slots are kept in a Redis sorted set, scored by when they were
+    taken or last renewed, so a slot held by a worker that died is
+    freed once it is `lease` seconds old.
+    """
+    key_prefix = 'campaign_modifiers:running:'
+
+    def __init__(self, client_customer_id, limit, lease, connection=None):
+        self.key = '{prefix}{client_customer_id}'.format(
+            prefix=self.key_prefix, client_customer_id=client_customer_id)
+        self.limit = limit
+        self.lease = lease
+        self.connection = connection or get_redis_connection()
+        self.token = None
+
+    def acquire(self):
+        token = uuid.uuid4().hex
+        acquired = self.connection.eval(
+            ACQUIRE_SCRIPT, 1, self.key, time.time(), self.lease, self.limit, token)
+
+        if acquired:
+            self.token = token
+        return bool(acquired)
+
+    def release(self):
+        if self.token is None:
+            return
+
+        self.connection.zrem(self.key, self.token)
+        self.token = None
+
+    def renew(self):
+        """
+        Start the held slot's lease again, returning whether the slot
+        was still held.
+        """
+        if self.token is None:
+            return False
+
+        renewed = self.connection.eval(
+            RENEW_SCRIPT, 1, self.key, time.time(), self.token, self.lease)
+        return bool(renewed)
+
+    @contextmanager
+    def held(self):
+        """
+        Renew the acquired slot a third of the way through each lease
+        until the block exits, however long it runs, then release it.
+        """
+        stopped = threading.Event()
+
+        def keep_alive():
+            while not stopped.wait(self.lease / 3):
+                if not self.renew():
+                    logger = logging.getLogger('celery')
+                    logger.warning('Lost run slot {} before finishing'.format(self.key))
+                    return
+
+        thread = threading.Thread(target=keep_alive, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+            self.release()
@@ -0,0 +1,145 @@
+import json
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from reports.models import Campaign
+
+from ...benchmark import (
+    LocalAdapter,
+    compare_to_baseline,
+    get_benchmark_campaign,
+    get_fixture_paths,
+    run_benchmark,
+)
+from ...tasks import get_campaign_modifiers
+
+
+CHAINS = {
+    'cpa': Campaign.CONVERSION_TYPE_CPA,
+    'margin': Campaign.CONVERSION_TYPE_MARGIN,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the CPA and margin modifier chains over synthetic accounts, against a test'
+        ' database and a local AdWords backend, and report what each stage took.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1000,10000,100000,1000000',
+            help='Comma separated keyword counts of the accounts to benchmark.',
+        )
+        parser.add_argument(
+            '--chains',
+            default=','.join(sorted(CHAINS)),
+            help='Comma separated modifier chains to run: cpa, margin.',
+        )
+        parser.add_argument(
+            '--fixtures-dir',
+            help='Keep the generated reports here and reuse them, rather than in a'
+                 ' temporary directory.',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Fail if the results are worse than those saved in this JSON file.',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            help='Save the results to this JSON file.',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help='How much wall time and memory may grow over the baseline, as a'
+                 ' fraction.',
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Keep the test database between benchmarks.',
+        )
+        parser.add_argument(
+            '--noinput', '--no-input',
+            action='store_false',
+            dest='interactive',
+            help='Replace an existing test database without asking.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be a list of keyword counts.')
+
+        chains = options['chains'].split(',')
+        unknown_chains = set(chains) - set(CHAINS)
+        if unknown_chains:
+            raise CommandError('Unknown chains: {}'.format(', '.join(sorted(unknown_chains))))
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        fixtures_dir = options['fixtures_dir'] or tempfile.mkdtemp()
+        old_database_name = connection.creation.create_test_db(
+            verbosity=options['verbosity'],
+            autoclobber=not options['interactive'],
+            keepdb=options['keepdb'],
+        )
+        try:
+            results = self.run_benchmarks(sizes, chains, fixtures_dir)
+        finally:
+            connection.creation.destroy_test_db(
+                old_database_name, options['verbosity'], options['keepdb'])
+            if not options['fixtures_dir']:
+                shutil.rmtree(fixtures_dir)
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+        if baseline is not None:
+            regressions = compare_to_baseline(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressed against the baseline:\n' + '\n'.join(regressions))
+
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def run_benchmarks(self, sizes, chains, fixtures_dir):
+        results = []
+        for keyword_count in sizes:
+            self.stdout.write('Preparing an account of {} keywords...'.format(keyword_count))
+            adwords_campaign_id, reports = get_fixture_paths(fixtures_dir, keyword_count)
+
+            for chain in chains:
+                campaign = get_benchmark_campaign(adwords_campaign_id, CHAINS[chain])
+                adapter = LocalAdapter(campaign.owner, reports)
+
+                result = run_benchmark(campaign, get_campaign_modifiers(campaign), adapter)
+                result.update({'chain': chain, 'keywords': keyword_count})
+                results.append(result)
+
+                self.write_result(result)
+
+        return results
+
+    def write_result(self, result):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            '{chain} chain, {keywords} keywords: {wall_seconds}s, {peak_rss_mb} MB peak,'
+            ' {db_queries} queries, {api_calls} API calls, {mutate_operations} mutate'
+            ' operations'.format(**result)))
+
+        for stage in result['stages']:
+            self.stdout.write(
+                '  {name}: {wall_seconds}s, {peak_rss_mb} MB peak, {db_queries} queries'
+                ' ({db_seconds}s), {api_calls} API calls ({api_seconds}s),'
+                ' {keywords_evaluated} keywords evaluated, {keywords_mutated}'
+                ' mutated'.format(**stage))
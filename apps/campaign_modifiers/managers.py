@@ -1,3 +1,4 @@
+from django.db.models import Count, Q
 from django.db.models.manager import BaseManager, QuerySet
 
 
@@ -6,6 +7,15 @@ class KeywordActionLogQuerySet(QuerySet):
     def get_modified(self):
         return self.exclude(action=self.model.ACTION_CHOICES.no_action)
 
+    def count_actions(self):
+        """
+        Return the number of each action, by action, in one query.
+        """
+        return self.aggregate(**{
+            action: Count('pk', filter=Q(action=action))
+            for action, _ in self.model.ACTION_CHOICES
+        })
+
 
 class KeywordActionLogManager(BaseManager.from_queryset(KeywordActionLogQuerySet)):
     pass
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.24 on 2026-10-18 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign_modifiers', '0008_add_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledRunLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('complete', 'Complete')], default='running', max_length=50)),
+                ('campaign_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('campaign_runs', jsonfield.fields.JSONField(default=list, help_text='How long each campaign took, and whether its modifiers ran successfully.')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.24 on 2026-10-18 16:06
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign_modifiers', '0009_scheduledrunlog'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='keywordevent',
+            index=models.Index(fields=['adwords_keyword_id', 'created_at'], name='campaign_mo_adwords_8cf5fb_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.24 on 2026-10-18 16:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign_modifiers', '0010_keywordevent_keyword_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modifierlog',
+            name='api_calls',
+            field=models.PositiveIntegerField(default=0, help_text='Reports downloaded and mutate calls made.'),
+        ),
+        migrations.AddField(
+            model_name='modifierlog',
+            name='api_seconds',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modifierlog',
+            name='db_queries',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modifierlog',
+            name='db_seconds',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modifierlog',
+            name='duration_seconds',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modifierlog',
+            name='keywords_evaluated',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modifierlog',
+            name='keywords_mutated',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modifierlog',
+            name='report_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.24 on 2026-10-18 16:16
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign_modifiers', '0011_modifierlog_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keywordactionlog',
+            name='adwords_ad_group_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -1,11 +1,19 @@
+from collections import Counter
+
+from django.conf import settings
 from django.db import models
-from django.utils.timezone import now
+from django.db.models import F
+from django.utils.functional import cached_property
+from django.utils.timezone import localdate, now
 
 from jsonfield import JSONField
 
 from model_utils import Choices
 
+from reports.models import DailyActionCount, ScriptRun
+
 from .managers import KeywordActionLogManager
+from .writers import BulkCreateBuffer
 
 
 class ModifierProcessLog(models.Model):
@@ -34,9 +42,12 @@ class ModifierProcessLog(models.Model):
         self.status = self.STATUS_CHOICES.running
         self.started_at = now()
         self.save()
+        self.save_script_run(status=ScriptRun.STATUS_CHOICES.running)
 
     def set_complete(self):
+        self.flush_keyword_action_logs()
         self.de_normalise_logs()
+        self.summarise()
 
         self.status = self.STATUS_CHOICES.complete
         self.completed_at = now()
@@ -47,47 +58,122 @@ class ModifierProcessLog(models.Model):
         self.completed_at = now()
         self.error = error
         self.save()
+        self.save_script_run(status=ScriptRun.STATUS_CHOICES.failed)
 
     def start_modifier_log(self, modifier_name):
         return self.modifier_logs.create(modifier_name=modifier_name)
 
+    @cached_property
+    def keyword_action_log_writer(self):
+        return BulkCreateBuffer(KeywordActionLog, settings.KEYWORD_ACTION_LOG_BATCH_SIZE)
+
+    def flush_keyword_action_logs(self):
+        """
+        Save the keyword action logs the run's modifiers have buffered.
+        """
+        self.keyword_action_log_writer.flush()
+
     def de_normalise_logs(self):
         keyword_actions = KeywordActionLog.objects \
             .filter(modifier_log__modifier_process_log=self) \
-            .order_by('adwords_keyword_id', 'created_at')
-
-        keyword_event_data = {}
-        for keyword_action in keyword_actions:
-            if keyword_event_data.get('adwords_keyword_id') != keyword_action.adwords_keyword_id:
-                if keyword_event_data:
+            .order_by('adwords_keyword_id', 'created_at') \
+            .values_list(
+                'adwords_keyword_id',
+                'action',
+                'previous_max_cpc',
+                'new_max_cpc',
+                'created_at',
+            )
+
+        batch_size = settings.KEYWORD_ACTION_LOG_BATCH_SIZE
+        keyword_events = BulkCreateBuffer(KeywordEvent, batch_size)
+        action_counts = Counter()
+
+        keyword_event = None
+        for (
+                adwords_keyword_id,
+                action,
+                previous_max_cpc,
+                new_max_cpc,
+                created_at,
+        ) in keyword_actions.iterator(chunk_size=batch_size):
+            if keyword_event is None or keyword_event.adwords_keyword_id != adwords_keyword_id:
+                if keyword_event is not None:
                     # Save new event.
-                    self.keyword_events.create(**keyword_event_data)
+                    keyword_events.add(keyword_event)
+                    action_counts[localdate(keyword_event.created_at), keyword_event.action] += 1
 
                 # Initialise event.
-                keyword_event_data = {
-                    'adwords_keyword_id': keyword_action.adwords_keyword_id,
-                    'action': keyword_action.action,
-                    'previous_max_cpc': keyword_action.previous_max_cpc,
-                    'new_max_cpc': keyword_action.new_max_cpc,
-                }
-
-            if keyword_action.action != keyword_action.ACTION_CHOICES.no_action:
+                keyword_event = KeywordEvent(
+                    modifier_process_log=self,
+                    adwords_keyword_id=adwords_keyword_id,
+                    action=action,
+                    previous_max_cpc=previous_max_cpc,
+                    new_max_cpc=new_max_cpc,
+                )
+
+            if action != KeywordActionLog.ACTION_CHOICES.no_action:
                 # If an action happened it takes precedence over the
                 # previous one.
-                keyword_event_data['action'] = keyword_action.action
-                keyword_event_data['new_max_cpc'] = keyword_action.new_max_cpc
-            keyword_event_data['created_at'] = keyword_action.created_at
+                keyword_event.action = action
+                keyword_event.new_max_cpc = new_max_cpc
+            keyword_event.created_at = created_at
+
+        if keyword_event is not None:
+            keyword_events.add(keyword_event)
+            action_counts[localdate(keyword_event.created_at), keyword_event.action] += 1
+        keyword_events.flush()
+
+        DailyActionCount.add(self.adwords_campaign_id, action_counts)
+
+    def save_script_run(self, **values):
+        """
+        Save the run's `ScriptRun`, for the campaign's runs table, with
+        `values`.
+        """
+        values.update({
+            'adwords_campaign_id': self.adwords_campaign_id,
+            'started_at': self.started_at,
+            'cycle_period': self.parameters.get('cycle_period'),
+        })
+        ScriptRun.objects.update_or_create(modifier_process_log=self, defaults=values)
+
+    def summarise(self):
+        """
+        Count what the run did to its keywords into its `ScriptRun`,
+        so the campaign's runs table needn't count them every time it
+        is shown.
+        """
+        actions = self.keyword_events.count_actions()
+
+        self.save_script_run(
+            status=ScriptRun.STATUS_CHOICES.complete,
+            increased_bids=actions[KeywordEvent.ACTION_CHOICES.increased_cpc],
+            decreased_bids=actions[KeywordEvent.ACTION_CHOICES.decreased_cpc],
+            unchanged_bids=actions[KeywordEvent.ACTION_CHOICES.no_action],
+            keywords_paused=actions[KeywordEvent.ACTION_CHOICES.paused],
+        )
 
-        if keyword_event_data:
-            self.keyword_events.create(**keyword_event_data)
+    @cached_property
+    def modified_keyword_ids(self):
+        """
+        The ids, as strings, of keywords this run has modified.  Loaded
+        from the database once, for runs being resumed, then kept up to
+        date by `mark_keyword_modified` as actions are logged.
+        """
+        return set(
+            KeywordActionLog.objects
+            .get_modified()
+            .filter(modifier_log__modifier_process_log=self)
+            .values_list('adwords_keyword_id', flat=True)
+            .distinct()
+        )
+
+    def mark_keyword_modified(self, adwords_keyword_id):
+        self.modified_keyword_ids.add(str(adwords_keyword_id))
 
     def was_keyword_modified(self, adwords_keyword_id):
-        count = KeywordActionLog.objects \
-            .get_modified() \
-            .filter(modifier_log__modifier_process_log=self) \
-            .filter(adwords_keyword_id=adwords_keyword_id) \
-            .count()
-        return count > 0
+        return str(adwords_keyword_id) in self.modified_keyword_ids
 
 
 class ModifierLog(models.Model):
@@ -100,6 +186,17 @@ class ModifierLog(models.Model):
     started_at = models.DateTimeField(default=now)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    # Profile of the run, filled in by `ModifierProcess.run_modifier`.
+    duration_seconds = models.FloatField(default=0)
+    keywords_evaluated = models.PositiveIntegerField(default=0)
+    keywords_mutated = models.PositiveIntegerField(default=0)
+    api_calls = models.PositiveIntegerField(
+        default=0, help_text='Reports downloaded and mutate calls made.')
+    api_seconds = models.FloatField(default=0)
+    report_bytes = models.BigIntegerField(default=0)
+    db_queries = models.PositiveIntegerField(default=0)
+    db_seconds = models.FloatField(default=0)
+
     def __str__(self):
         return 'Log for {}'.format(self.modifier_name)
 
@@ -108,43 +205,111 @@ class ModifierLog(models.Model):
         self.save()
 
     def set_complete(self):
+        self.modifier_process_log.flush_keyword_action_logs()
+
         self.completed_at = now()
+        self.duration_seconds = (self.completed_at - self.started_at).total_seconds()
         self.save()
 
+    def set_profile(self, api_calls, db_queries, db_seconds):
+        """
+        Record the run's API usage, from the summary of an
+        `AggregatorSink` that collected its calls, and database usage.
+        """
+        for call in api_calls:
+            # Reports read from the report cache didn't reach the API.
+            if call['kind'] in ('report', 'mutate'):
+                self.api_calls += call['calls']
+                self.api_seconds += call['seconds']
+                self.report_bytes += call['bytes']
+
+        self.db_queries = db_queries
+        self.db_seconds = db_seconds
+
+    def discard_failed_mutations(self, failures):
+        """
+        Record the keywords whose mutations the API rejected,
+        `KeywordMutationFailure`s, as left alone: their saved actions
+        become `no_action`, and they no longer count as modified.
+        """
+        # Keyword ids are only unique within their ad group.
+        failed = {(str(failure.ad_group_id), str(failure.keyword_id)) for failure in failures}
+        if not failed:
+            return
+
+        modified = KeywordActionLog.objects \
+            .get_modified() \
+            .filter(
+                modifier_log=self,
+                adwords_keyword_id__in={keyword_id for _ad_group_id, keyword_id in failed},
+            ) \
+            .values_list('pk', 'adwords_ad_group_id', 'adwords_keyword_id')
+        discarded = {
+            pk: keyword_id
+            for pk, ad_group_id, keyword_id in modified
+            if (ad_group_id, keyword_id) in failed
+        }
+        if not discarded:
+            return
+
+        KeywordActionLog.objects \
+            .filter(pk__in=discarded) \
+            .update(
+                action=KeywordActionLog.ACTION_CHOICES.no_action,
+                new_max_cpc=F('previous_max_cpc'),
+            )
+
+        self.keywords_mutated -= len(discarded)
+        self.modifier_process_log.modified_keyword_ids.difference_update(discarded.values())
+
+    def _count_keyword(self, keyword_id, mutated=True):
+        self.keywords_evaluated += 1
+        if mutated:
+            self.keywords_mutated += 1
+            self.modifier_process_log.mark_keyword_modified(keyword_id)
+
     def log_increased_keyword_cpc(
-            self, keyword_id, previous_max_cpc, new_max_cpc, modifier_data=None):
-        return self.keyword_action_logs.field.rel.related_model.log_increased_keyword_cpc(
+            self, keyword_id, previous_max_cpc, new_max_cpc, modifier_data=None, ad_group_id=''):
+        self._count_keyword(keyword_id)
+        return KeywordActionLog.log_increased_keyword_cpc(
             self,
             keyword_id,
             previous_max_cpc,
             new_max_cpc,
             modifier_data,
+            ad_group_id=ad_group_id,
         )
 
     def log_decreased_keyword_cpc(
-            self, keyword_id, previous_max_cpc, new_max_cpc, modifier_data=None):
-        return self.keyword_action_logs.field.rel.related_model.log_decreased_keyword_cpc(
+            self, keyword_id, previous_max_cpc, new_max_cpc, modifier_data=None, ad_group_id=''):
+        self._count_keyword(keyword_id)
+        return KeywordActionLog.log_decreased_keyword_cpc(
             self,
             keyword_id,
             previous_max_cpc,
             new_max_cpc,
             modifier_data,
+            ad_group_id=ad_group_id,
         )
 
-    def log_ignored_keyword(self, keyword_id, max_cpc, modifier_data=None):
-        return self.keyword_action_logs.field.rel.related_model.log_ignored_keyword(
+    def log_ignored_keyword(self, keyword_id, max_cpc, modifier_data=None, ad_group_id=''):
+        self._count_keyword(keyword_id, mutated=False)
+        return KeywordActionLog.log_ignored_keyword(
             self,
             keyword_id,
             max_cpc,
             modifier_data,
+            ad_group_id=ad_group_id,
         )
 
-    def log_paused_keyword(self, keyword_id, max_cpc, modifier_data=None):
-        return self.keyword_action_logs.field.rel.related_model.log_paused_keyword(
+    def log_paused_keyword(self, keyword_id, max_cpc, modifier_data=None, ad_group_id=''):
+        self._count_keyword(keyword_id)
+        return KeywordActionLog.log_paused_keyword(
             self,
             keyword_id,
             max_cpc,
             modifier_data=modifier_data,
+            ad_group_id=ad_group_id,
         )
 
 
@@ -181,14 +346,26 @@ class KeywordActionLog(KeywordActionLogBase):
         related_name='keyword_action_logs',
         on_delete=models.CASCADE,
     )
+    # Keyword ids are only unique within their ad group.  Blank for
+    # actions logged before it was recorded.
+    adwords_ad_group_id = models.CharField(max_length=255, blank=True)
 
     objects = KeywordActionLogManager()
 
+    @classmethod
+    def _log(cls, log, **values):
+        # Saved in bulk by the process log's writer, not here.
+        keyword_action = cls(modifier_log=log, **values)
+        log.modifier_process_log.keyword_action_log_writer.add(keyword_action)
+        return keyword_action
+
     @classmethod
     def log_increased_keyword_cpc(
-            cls, log, keyword_id, previous_max_cpc, new_max_cpc, modifier_data=None):
-        return cls.objects.create(
-            modifier_log=log,
+            cls, log, keyword_id, previous_max_cpc, new_max_cpc, modifier_data=None,
+            ad_group_id=''):
+        return cls._log(
+            log,
+            adwords_ad_group_id=ad_group_id,
             adwords_keyword_id=keyword_id,
             action=KeywordActionLog.ACTION_CHOICES.increased_cpc,
             previous_max_cpc=previous_max_cpc,
@@ -198,9 +375,11 @@ class KeywordActionLog(KeywordActionLogBase):
 
     @classmethod
     def log_decreased_keyword_cpc(
-            cls, log, keyword_id, previous_max_cpc, new_max_cpc, modifier_data=None):
-        return cls.objects.create(
-            modifier_log=log,
+            cls, log, keyword_id, previous_max_cpc, new_max_cpc, modifier_data=None,
+            ad_group_id=''):
+        return cls._log(
+            log,
+            adwords_ad_group_id=ad_group_id,
             adwords_keyword_id=keyword_id,
             action=KeywordActionLog.ACTION_CHOICES.decreased_cpc,
             previous_max_cpc=previous_max_cpc,
@@ -209,9 +388,10 @@ class KeywordActionLog(KeywordActionLogBase):
         )
 
     @classmethod
-    def log_ignored_keyword(cls, log, keyword_id, max_cpc, modifier_data=None):
-        return cls.objects.create(
-            modifier_log=log,
+    def log_ignored_keyword(cls, log, keyword_id, max_cpc, modifier_data=None, ad_group_id=''):
+        return cls._log(
+            log,
+            adwords_ad_group_id=ad_group_id,
             adwords_keyword_id=keyword_id,
             action=KeywordActionLog.ACTION_CHOICES.no_action,
             previous_max_cpc=max_cpc,
@@ -220,9 +400,10 @@ class KeywordActionLog(KeywordActionLogBase):
         )
 
     @classmethod
-    def log_paused_keyword(cls, log, keyword_id, max_cpc, modifier_data=None):
-        return cls.objects.create(
-            modifier_log=log,
+    def log_paused_keyword(cls, log, keyword_id, max_cpc, modifier_data=None, ad_group_id=''):
+        return cls._log(
+            log,
+            adwords_ad_group_id=ad_group_id,
             adwords_keyword_id=keyword_id,
             action=KeywordActionLog.ACTION_CHOICES.paused,
             previous_max_cpc=max_cpc,
@@ -242,3 +423,55 @@ class KeywordEvent(KeywordActionLogBase):
         related_name='keyword_events',
         on_delete=models.CASCADE,
     )
+
+    objects = KeywordActionLogManager()
+
+    class Meta(KeywordActionLogBase.Meta):
+        indexes = [
+            models.Index(fields=['adwords_keyword_id', 'created_at']),
+        ]
+
+
+class ScheduledRunLog(models.Model):
+    """
+    One run of the scheduled `run_scripts` task, across every managed
+    campaign, and how long each campaign took.
+    """
+    STATUS_CHOICES = Choices(
+        ('running', 'Running'),
+        ('complete', 'Complete'),
+    )
+
+    started_at = models.DateTimeField(default=now)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(
+        max_length=50,
+        choices=STATUS_CHOICES,
+        default=STATUS_CHOICES.running,
+    )
+    campaign_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    campaign_runs = JSONField(
+        default=list,
+        help_text='How long each campaign took, and whether its modifiers ran successfully.',
+    )
+
+    def __str__(self):
+        return 'Scheduled run at {}'.format(self.started_at)
+
+    @property
+    def duration(self):
+        if self.completed_at is None:
+            return None
+
+        return self.completed_at - self.started_at
+
+    def set_complete(self, campaign_runs):
+        self.campaign_runs = sorted(
+            campaign_runs, key=lambda campaign_run: campaign_run['duration'], reverse=True)
+        self.failed_count = sum(
+            1 for campaign_run in campaign_runs if campaign_run['status'] == 'failed')
+
+        self.status = self.STATUS_CHOICES.complete
+        self.completed_at = now()
+        self.save()
@@ -1,3 +1,4 @@
+from .. import engine
 from ..utils import ModifierBase
 
 
@@ -14,39 +15,16 @@ class TargetCostPerAcquisition(ModifierBase):
             log=None,
             **kwargs):
         date_range = self.get_date_range_from_now(cycle_period)
-        keywords = api_adapter.get_keywords_for_campaign(
-            adwords_campaign_id, enabled_only=True, date_range=date_range)
-
-        keywords = (keyword for keyword in keywords
-                    if keyword['click_assisted_conversions'] >= 3)
-
-        for keyword in keywords:
-            keyword_id = keyword['id']
-            max_cpc = keyword['max_cpc']
-
-            modifier_data = {
-                'cycle_period': cycle_period,
-                'target_cpa': target_cpa,
-                'max_cpc_limit': max_cpc_limit,
-                'max_cpc': max_cpc,
-                'conversion_rate': keyword['conversion_rate'],
-            }
-
-            should_skip_keyword = self.should_skip_keyword(keyword_id, log.modifier_process_log)
-            if not should_skip_keyword:
-                new_max_cpc = round(
-                    min(target_cpa * keyword['conversion_rate'], max_cpc_limit), -4)
-
-                modifier_data['new_max_cpc'] = new_max_cpc
-
-                api_adapter.set_keyword_max_cpc(keyword['ad_group_id'], keyword_id, new_max_cpc)
-
-            if log is not None:
-                if should_skip_keyword or new_max_cpc == max_cpc:
-                    log.log_ignored_keyword(keyword_id, max_cpc, modifier_data=modifier_data)
-                elif new_max_cpc > max_cpc:
-                    log.log_increased_keyword_cpc(
-                        keyword_id, max_cpc, new_max_cpc, modifier_data=modifier_data)
-                elif new_max_cpc < max_cpc:
-                    log.log_decreased_keyword_cpc(
-                        keyword_id, max_cpc, new_max_cpc, modifier_data=modifier_data)
+        columns = api_adapter.get_keyword_columns_for_campaign(
+            adwords_campaign_id, date_range=date_range)
+
+        decisions = engine.target_cost_per_acquisition(
+            columns, target_cpa, max_cpc_limit, self.get_skip_filter(log.modifier_process_log))
+
+        self.apply_decisions(
+            api_adapter, columns, decisions, log,
+            keyword_data=('conversion_rate', ),
+            cycle_period=cycle_period,
+            target_cpa=target_cpa,
+            max_cpc_limit=max_cpc_limit,
+        )
@@ -1,13 +1,18 @@
 import logging
+import time
 
-from celery.task import task
+from django.conf import settings
+from django.utils.timezone import now
 
+from celery import chord
+from celery.task import task
 
-@task(name='campaign_modifiers.run_scripts')
-def run_scripts():
-    from adwords.adapter import Adapter
-    from accounts.models import User
 
+def get_campaign_modifiers(campaign):
+    """
+    Return the modifiers to run, in order, for `campaign`'s conversion
+    type, or `None` if the type isn't known.
+    """
     from .modifiers.hcpa import HighCostPerAcquisitionModifier
     from .modifiers.lcpa import LowCostPerAcquisitionModifier
     from .modifiers.lctr import LowClickThroughRate
@@ -17,58 +22,154 @@ def run_scripts():
     from .modifiers.tcpa_margin import TargetCostPerAcquisitionMargin
     from .modifiers.zc import ZeroClicks
     from .modifiers.zc_margin import ZeroClicksMargin
+
+    if campaign.conversion_type == campaign.CONVERSION_TYPE_CPA:
+        return (
+            PauseEmptyAdGroups(),
+            LowPosition(),
+            ZeroClicks(),
+            LowClickThroughRate(),
+            TargetCostPerAcquisition(),
+            LowCostPerAcquisitionModifier(),
+            HighCostPerAcquisitionModifier(),
+        )
+    elif campaign.conversion_type == campaign.CONVERSION_TYPE_MARGIN:
+        return (
+            PauseEmptyAdGroups(),
+            LowPosition(),
+            ZeroClicksMargin(),
+            LowClickThroughRate(),
+            TargetCostPerAcquisitionMargin(),
+        )
+
+    return None
+
+
+def run_modifiers(campaign):
+    """
+    Run the modifiers for `campaign`, returning `'complete'`, `'failed'`
+    or `'skipped'`.
+    """
+    from adwords.adapter import Adapter
+
     from .utils import ModifierProcess
 
+    user = campaign.owner
+
+    modifiers_in_order = get_campaign_modifiers(campaign)
+    if modifiers_in_order is None:
+        logger = logging.getLogger('celery')
+        message = (
+            'Error while running modifiers on campaign id'
+            ' {campaign_id} for user id {user_id} - unknown'
+            ' `conversion_type`'
+        ).format(campaign_id=campaign.id, user_id=user.id)
+        logger.error(message)
+
+        return 'skipped'
+
+    try:
+        ModifierProcess().run(
+            modifiers_in_order,
+            Adapter(user),
+            campaign.adwords_campaign_id,
+            is_dry_run=user.is_adwords_dry_run,
+            target_cpa=campaign.target_cpa,
+            target_conversion_margin=campaign.target_conversion_margin,
+            max_cpc_limit=campaign.max_cpc_limit,
+            cycle_period=campaign.cycle_period_days,
+        )
+    except:  # Don't let one user bring down everyone's scripts.
+        logger = logging.getLogger('celery')
+        message = (
+            'Error while running modifiers on campaign id'
+            ' {campaign_id} for user id {user_id}'
+        ).format(campaign_id=campaign.id, user_id=user.id)
+        logger.exception(message)
+
+        return 'failed'
+
+    return 'complete'
+
+
+@task(name='campaign_modifiers.run_scripts')
+def run_scripts():
+    """
+    Queue `run_campaign_modifiers` for every managed campaign of every
+    paying user, then `complete_scheduled_run` once they have all
+    finished.
+    """
+    from accounts.models import User
+
+    from .models import ScheduledRunLog
+
+    campaign_ids = []
     for user in User.objects.all():
         if not user.has_payment_details:
             continue  # Skip unpaid users.
 
-        api_adapter = Adapter(user)
-
-        for campaign in user.campaigns.filter(is_managed=True):
-            if campaign.conversion_type == campaign.CONVERSION_TYPE_CPA:
-                modifiers_in_order = (
-                    PauseEmptyAdGroups(),
-                    LowPosition(),
-                    ZeroClicks(),
-                    LowClickThroughRate(),
-                    TargetCostPerAcquisition(),
-                    LowCostPerAcquisitionModifier(),
-                    HighCostPerAcquisitionModifier(),
-                )
-            elif campaign.conversion_type == campaign.CONVERSION_TYPE_MARGIN:
-                modifiers_in_order = (
-                    PauseEmptyAdGroups(),
-                    LowPosition(),
-                    ZeroClicksMargin(),
-                    LowClickThroughRate(),
-                    TargetCostPerAcquisitionMargin(),
-                )
-            else:
-                logger = logging.getLogger('celery')
-                message = (
-                    'Error while running modifiers on campaign id'
-                    ' {campaign_id} for user id {user_id} - unknown'
-                    ' `conversion_type`'
-                ).format(campaign_id=campaign.id, user_id=user.id)
-                logger.error(message)
-
-                continue
-
-            try:
-                ModifierProcess().run(
-                    modifiers_in_order,
-                    api_adapter,
-                    campaign.adwords_campaign_id,
-                    is_dry_run=user.is_adwords_dry_run,
-                    target_cpa=campaign.target_cpa,
-                    max_cpc_limit=campaign.max_cpc_limit,
-                    cycle_period=campaign.cycle_period_days,
-                )
-            except:  # Don't let one user bring down everyone's scripts.
-                logger = logging.getLogger('celery')
-                message = (
-                    'Error while running modifiers on campaign id'
-                    ' {campaign_id} for user id {user_id}'
-                ).format(campaign_id=campaign.id, user_id=user.id)
-                logger.exception(message)
+        campaign_ids.extend(
+            user.campaigns.filter(is_managed=True).values_list('id', flat=True))
+
+    scheduled_run = ScheduledRunLog.objects.create(campaign_count=len(campaign_ids))
+    if not campaign_ids:
+        scheduled_run.set_complete([])
+        return
+
+    chord(
+        run_campaign_modifiers.s(campaign_id) for campaign_id in campaign_ids
+    )(complete_scheduled_run.s(scheduled_run.id))
+
+
+@task(bind=True, name='campaign_modifiers.run_campaign_modifiers', max_retries=None)
+def run_campaign_modifiers(self, campaign_id):
+    """
+    Run the modifiers for one campaign, waiting while its AdWords
+    customer already has as many campaigns running as it is allowed.
+    Returns how long it took, for `complete_scheduled_run`.
+    """
+    from adwords.instrumentation import instrumentation
+    from reports.models import Campaign
+
+    from .locks import CustomerSemaphore
+
+    campaign_run = {
+        'campaign_id': campaign_id,
+        'retries': self.request.retries,
+        'duration': 0,
+    }
+
+    try:
+        campaign = Campaign.objects.select_related('owner').get(pk=campaign_id)
+    except Campaign.DoesNotExist:
+        campaign_run['status'] = 'skipped'
+        return campaign_run
+
+    semaphore = CustomerSemaphore(
+        campaign.owner.client_customer_id,
+        limit=settings.CAMPAIGN_MODIFIERS_MAX_CONCURRENT_RUNS_PER_CUSTOMER,
+        lease=settings.CAMPAIGN_MODIFIERS_RUN_LEASE,
+    )
+    if not semaphore.acquire():
+        raise self.retry(countdown=settings.CAMPAIGN_MODIFIERS_RETRY_DELAY)
+
+    started_at = now()
+    start = time.monotonic()
+    with semaphore.held(), instrumentation.collect() as api_calls:
+        campaign_run['status'] = run_modifiers(campaign)
+
+    campaign_run.update({
+        'adwords_campaign_id': campaign.adwords_campaign_id,
+        'client_customer_id': campaign.owner.client_customer_id,
+        'started_at': started_at.isoformat(),
+        'duration': round(time.monotonic() - start, 3),
+        'api_calls': api_calls.summary(),
+    })
+    return campaign_run
+
+
+@task(name='campaign_modifiers.complete_scheduled_run')
+def complete_scheduled_run(campaign_runs, scheduled_run_id):
+    from .models import ScheduledRunLog
+
+    ScheduledRunLog.objects.get(pk=scheduled_run_id).set_complete(campaign_runs)
@@ -0,0 +1,752 @@
+from contextlib import contextmanager
+import datetime
+import decimal
+import math
+import os
+import random
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from celery.exceptions import Retry
+
+from adwords.adapter import Adapter
+from adwords.columnar import MISSING, KeywordColumns
+from adwords.mutations import KeywordMutationFailure
+from adwords.tests import make_keyword
+from reports.models import Campaign, DailyActionCount, ScriptRun
+
+from . import benchmark, engine
+from .locks import RENEW_SCRIPT, CustomerSemaphore
+from .models import (
+    KeywordActionLog,
+    KeywordEvent,
+    ModifierLog,
+    ModifierProcessLog,
+    ScheduledRunLog,
+)
+from .modifiers.zc import ZeroClicks
+from .tasks import get_campaign_modifiers, run_campaign_modifiers
+from .utils import QueryCounter, ReportCache
+from .writers import BulkCreateBuffer
+
+
+class FakeAdapter(Adapter):
+
+    def __init__(self, keywords, rejected_keyword_ids=()):
+        self.keywords = keywords
+        self.rejected_keyword_ids = rejected_keyword_ids
+        self.downloads = 0
+        self.mutations = []
+
+    def get_keywords_columnar(self, predicates=None, date_range=None):
+        self.downloads += 1
+        return KeywordColumns.from_rows(self.keywords)
+
+    def get_keyword_columns_for_campaign(self, adwords_campaign_id, date_range=None):
+        return self.get_keywords_columnar({'BaseCampaignId': adwords_campaign_id}, date_range)
+
+    def set_keyword_max_cpc(self, ad_group_id, keyword_id, max_cpc):
+        self.mutations.append(('max_cpc', ad_group_id, keyword_id, max_cpc))
+
+    def set_keyword_paused(self, ad_group_id, keyword_id):
+        self.mutations.append(('paused', ad_group_id, keyword_id))
+
+    @contextmanager
+    def keyword_mutations(self):
+        mutations = SimpleNamespace(failures=[])
+        yield mutations
+        mutations.failures.extend(
+            KeywordMutationFailure(ad_group_id, keyword_id, '', 'INVALID_KEYWORD')
+            for _kind, ad_group_id, keyword_id, *_values in self.mutations
+            if keyword_id in self.rejected_keyword_ids
+        )
+
+
+class ReportCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.adapter = FakeAdapter([
+            make_keyword(id=1, ad_group_id=10, max_cpc=100000),
+            make_keyword(id=2, ad_group_id=10, max_cpc=200000),
+        ])
+        self.cache = ReportCache(self.adapter)
+        self.date_range = {'min': '20170101', 'max': '20170401'}
+
+    def test_identical_requests_share_one_download(self):
+        first = self.cache.get_keywords_for_campaign(5, enabled_only=True, date_range=self.date_range)
+        second = self.cache.get_keywords_for_campaign(5, date_range=dict(self.date_range))
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.adapter.downloads, 1)
+
+        self.cache.get_keywords_for_campaign(5)
+        self.cache.get_keywords_for_campaign(6, date_range=self.date_range)
+
+        self.assertEqual(self.adapter.downloads, 3)
+
+    def test_keywords_are_read_only(self):
+        keyword, _ = self.cache.get_keywords_for_campaign(5)
+
+        with self.assertRaises(TypeError):
+            keyword['max_cpc'] = 0
+
+    def test_mutations_are_reflected_in_every_cached_set(self):
+        self.cache.get_keywords_for_campaign(5)
+        self.cache.get_keywords_for_campaign(5, date_range=self.date_range)
+
+        self.cache.set_keyword_max_cpc(10, 1, 120000)
+        self.cache.set_keyword_paused(10, 2)
+
+        for date_range in ('ALL_TIME', self.date_range):
+            first, second = self.cache.get_keywords_for_campaign(5, date_range=date_range)
+            self.assertEqual(first['max_cpc'], 120000)
+            self.assertEqual(second['status'], 'paused')
+
+            columns = self.cache.get_keyword_columns_for_campaign(5, date_range=date_range)
+            self.assertEqual(list(columns.max_cpc), [120000, 200000])
+            self.assertEqual(columns.status[1], columns.status_code('paused'))
+
+        self.assertEqual(self.adapter.downloads, 2)
+        self.assertEqual(len(self.adapter.mutations), 2)
+
+    def test_rejected_mutations_are_undone(self):
+        self.adapter.rejected_keyword_ids = (2, )
+        self.cache.get_keywords_for_campaign(5)
+
+        with self.cache.keyword_mutations():
+            self.cache.set_keyword_max_cpc(10, 1, 120000)
+            self.cache.set_keyword_max_cpc(10, 2, 220000)
+            self.cache.set_keyword_paused(10, 2)
+
+        first, second = self.cache.get_keywords_for_campaign(5)
+        self.assertEqual(first['max_cpc'], 120000)
+        self.assertEqual((second['max_cpc'], second['status']), (200000, 'enabled'))
+
+        columns = self.cache.get_keyword_columns_for_campaign(5)
+        self.assertEqual(list(columns.max_cpc), [120000, 200000])
+        self.assertEqual(columns.status[1], columns.status_code('enabled'))
+
+    def test_mutations_only_change_their_own_ad_group(self):
+        self.adapter.keywords.append(make_keyword(id=1, ad_group_id=20, max_cpc=300000))
+        columns = self.cache.get_keyword_columns_for_campaign(5)
+
+        self.cache.set_keyword_max_cpc(20, 1, 120000)
+
+        self.assertEqual(list(columns.max_cpc), [100000, 200000, 120000])
+
+
+def never_skip(keyword_ids):
+    return [False] * len(keyword_ids)
+
+
+class EngineTests(SimpleTestCase):
+    """
+    Compare the engine with the per keyword arithmetic the modifiers
+    used before it.
+    """
+
+    def setUp(self):
+        generator = random.Random(7)
+
+        def percentage():
+            return decimal.Decimal(generator.randrange(0, 10000)) / 100
+
+        self.keywords = [
+            make_keyword(
+                id=keyword_id,
+                max_cpc=generator.randrange(10000, 5000000),
+                cpa=generator.randrange(0, 5000000),
+                cost=generator.randrange(0, 20000000),
+                click_assisted_conversions=generator.randrange(0, 10),
+                average_position=generator.randrange(10, 200) / 10,
+                conversion_rate=percentage(),
+                click_through_rate=percentage(),
+                value_per_conversion=generator.randrange(0, 100000000),
+            )
+            for keyword_id in range(500)
+        ]
+        # Exact ties for the rounding in the target CPA modifiers.
+        self.keywords.extend([
+            make_keyword(id=1000, conversion_rate=decimal.Decimal('0.015')),
+            make_keyword(id=1001, conversion_rate=decimal.Decimal('0.025')),
+            make_keyword(id=1002, conversion_rate=decimal.Decimal('0.035')),
+            make_keyword(id=1003, value_per_conversion=50000000,
+                         conversion_rate=decimal.Decimal('0.03')),
+        ])
+        self.columns = KeywordColumns.from_rows(self.keywords)
+
+    def get_bids(self, decisions):
+        return {
+            self.columns.id[index]: new_max_cpc
+            for index, _action, mutate, new_max_cpc in decisions
+            if mutate
+        }
+
+    def get_paused(self, decisions):
+        return [
+            self.columns.id[index]
+            for index, action, _mutate, _new_max_cpc in decisions
+            if action == engine.PAUSED
+        ]
+
+    def test_round_bid_rounds_half_to_even(self):
+        values = [0, 4999, 5000, 5001, 15000, 25000, 1234567]
+        self.assertEqual(
+            engine.round_bid(engine.np.array(values)).tolist(),
+            [round(value, -4) for value in values],
+        )
+
+    def test_high_cost_per_acquisition(self):
+        target_cpa = 2000000
+        expected = {
+            keyword['id']: round(int(keyword['max_cpc'] * 0.8), -4)
+            for keyword in self.keywords if keyword['cpa'] > 1.2 * target_cpa
+        }
+
+        decisions = engine.high_cost_per_acquisition(self.columns, target_cpa, never_skip)
+
+        self.assertEqual(self.get_bids(decisions), expected)
+        self.assertEqual(len(decisions), len(self.keywords))
+
+    def test_low_cost_per_acquisition(self):
+        target_cpa, max_cpc_limit = 2000000, 3000000
+        expected = {
+            keyword['id']: round(min(int(keyword['max_cpc'] * 1.2), max_cpc_limit), -4)
+            for keyword in self.keywords if keyword['cpa'] < 0.8 * target_cpa
+        }
+
+        decisions = engine.low_cost_per_acquisition(
+            self.columns, target_cpa, max_cpc_limit, never_skip)
+
+        self.assertEqual(self.get_bids(decisions), expected)
+
+    def test_target_cost_per_acquisition(self):
+        target_cpa, max_cpc_limit = 1000000, 60000000
+        expected = {
+            keyword['id']: round(
+                min(target_cpa * keyword['conversion_rate'], max_cpc_limit), -4)
+            for keyword in self.keywords if keyword['click_assisted_conversions'] >= 3
+        }
+
+        decisions = engine.target_cost_per_acquisition(
+            self.columns, target_cpa, max_cpc_limit, never_skip)
+
+        self.assertEqual(self.get_bids(decisions), expected)
+        self.assertEqual(expected[1000], 20000)
+        self.assertEqual(expected[1001], 20000)
+        self.assertEqual(expected[1002], 40000)
+
+    def test_target_cost_per_acquisition_margin(self):
+        margin, max_cpc_limit = decimal.Decimal('33.3'), 60000000
+        expected = {
+            keyword['id']: round(int(min(
+                decimal.Decimal(keyword['value_per_conversion'] * (margin / 100)) *
+                keyword['conversion_rate'],
+                max_cpc_limit,
+            )), -4)
+            for keyword in self.keywords if keyword['click_assisted_conversions'] >= 3
+        }
+
+        decisions = engine.target_cost_per_acquisition_margin(
+            self.columns, margin, max_cpc_limit, never_skip)
+
+        self.assertEqual(self.get_bids(decisions), expected)
+
+    def test_zero_clicks(self):
+        target_cpa = 3000000
+        expected = [
+            keyword['id'] for keyword in self.keywords if keyword['cost'] > target_cpa * 3]
+
+        decisions = engine.zero_clicks(self.columns, target_cpa, never_skip)
+
+        self.assertEqual(self.get_paused(decisions), expected)
+        self.assertEqual(len(decisions), len(expected))
+
+    def test_zero_clicks_margin(self):
+        average_cpa = sum(keyword['cpa'] for keyword in self.keywords) / len(self.keywords)
+        expected = [
+            keyword['id'] for keyword in self.keywords if keyword['cost'] >= 2 * average_cpa]
+
+        decisions = engine.zero_clicks_margin(self.columns, never_skip)
+
+        self.assertEqual(self.get_paused(decisions), expected)
+        self.assertEqual(decisions.context['average_cpa'], average_cpa)
+
+    def test_low_position(self):
+        campaign_conversions = 1500
+        average = sum(keyword['average_position'] for keyword in self.keywords) / len(
+            self.keywords)
+        maximum_position = max(average + 7, average * 3)
+        expected = [
+            keyword['id'] for keyword in self.keywords
+            if keyword['average_position'] > maximum_position and
+            keyword['click_assisted_conversions'] < math.ceil(campaign_conversions / 200)
+        ]
+
+        decisions = engine.low_position(self.columns, campaign_conversions, never_skip)
+
+        self.assertEqual(self.get_paused(decisions), expected)
+        self.assertEqual(decisions.context['maximum_position'], maximum_position)
+
+    def test_low_click_through_rate(self):
+        # One keyword sits exactly on both thresholds and must not be paused.
+        keywords = [
+            make_keyword(id=1, click_through_rate=decimal.Decimal('0.1'),
+                         conversion_rate=decimal.Decimal('0.2')),
+            make_keyword(id=2, click_through_rate=decimal.Decimal('0.2'),
+                         conversion_rate=decimal.Decimal('0.4')),
+        ] + [
+            make_keyword(id=keyword_id, click_through_rate=decimal.Decimal('0.85'),
+                         conversion_rate=decimal.Decimal('1.7'))
+            for keyword_id in range(3, 11)
+        ]
+
+        for keywords in (keywords, self.keywords):
+            self.columns = KeywordColumns.from_rows(keywords)
+            required_ctr = sum(keyword['click_through_rate'] for keyword in keywords) / len(
+                keywords) / 5
+            required_conv_rate = sum(keyword['conversion_rate'] for keyword in keywords) / len(
+                keywords) / 5
+            expected = [
+                keyword['id'] for keyword in keywords
+                if keyword['click_through_rate'] < required_ctr and
+                keyword['conversion_rate'] < required_conv_rate
+            ]
+
+            decisions = engine.low_click_through_rate(self.columns, never_skip)
+
+            self.assertEqual(self.get_paused(decisions), expected)
+
+    def test_skipped_keywords_are_not_mutated(self):
+        decisions = engine.zero_clicks(
+            self.columns, 0, lambda keyword_ids: keyword_ids % 2 == 0)
+
+        self.assertTrue(all(keyword_id % 2 for keyword_id in self.get_paused(decisions)))
+
+    def test_missing_max_cpc_is_not_mutated(self):
+        columns = KeywordColumns.from_rows([make_keyword(max_cpc=None, cpa=10 ** 9)])
+
+        decisions = engine.high_cost_per_acquisition(columns, 1000000, never_skip)
+
+        self.assertEqual(list(decisions), [(0, engine.NO_ACTION, False, MISSING)])
+
+    def test_missing_value_per_conversion_is_not_mutated(self):
+        columns = KeywordColumns.from_rows([make_keyword(value_per_conversion=None)])
+
+        decisions = engine.target_cost_per_acquisition_margin(
+            columns, decimal.Decimal('30'), 10 ** 7, never_skip)
+
+        self.assertEqual(list(decisions), [(0, engine.NO_ACTION, False, MISSING)])
+
+    def test_empty_campaign(self):
+        columns = KeywordColumns()
+
+        for decisions in (
+                engine.zero_clicks_margin(columns, never_skip),
+                engine.low_position(columns, 100, never_skip),
+                engine.low_click_through_rate(columns, never_skip),
+                engine.target_cost_per_acquisition(columns, 1, 1, never_skip),
+        ):
+            self.assertEqual(len(decisions), 0)
+
+
+class ModifiedKeywordTests(SimpleTestCase):
+
+    def setUp(self):
+        self.process_log = ModifierProcessLog()
+        # Stands in for the one query a new run makes.
+        self.process_log.modified_keyword_ids = set()
+
+    def test_marked_keywords_were_modified(self):
+        self.process_log.mark_keyword_modified(5)
+
+        self.assertTrue(self.process_log.was_keyword_modified(5))
+        self.assertTrue(self.process_log.was_keyword_modified('5'))
+        self.assertFalse(self.process_log.was_keyword_modified(6))
+
+    def test_skip_filter_skips_marked_keywords(self):
+        columns = KeywordColumns.from_rows(
+            [make_keyword(id=keyword_id) for keyword_id in (4, 5, 6)])
+        is_skipped = ZeroClicks().get_skip_filter(self.process_log)
+
+        self.assertEqual(is_skipped(engine.column(columns, 'id')).tolist(), [False] * 3)
+
+        self.process_log.mark_keyword_modified(5)
+
+        self.assertEqual(
+            is_skipped(engine.column(columns, 'id')).tolist(), [False, True, False])
+        self.assertFalse(ZeroClicks().get_skip_filter(None)(engine.column(columns, 'id')).any())
+
+
+class RunSummaryTests(SimpleTestCase):
+
+    def test_summary_counts_each_action(self):
+        process_log = ModifierProcessLog(
+            pk=1, adwords_campaign_id='123', is_dry_run=False, parameters={'cycle_period': 30})
+        keyword_events = mock.Mock()
+        keyword_events.count_actions.return_value = {
+            'increased_cpc': 3,
+            'decreased_cpc': 2,
+            'no_action': 5,
+            'paused': 1,
+        }
+
+        with mock.patch.object(ModifierProcessLog, 'keyword_events', keyword_events), \
+                mock.patch.object(ScriptRun.objects, 'update_or_create') as update_or_create:
+            process_log.summarise()
+
+        update_or_create.assert_called_once_with(
+            modifier_process_log=process_log,
+            defaults={
+                'adwords_campaign_id': '123',
+                'started_at': process_log.started_at,
+                'cycle_period': 30,
+                'status': 'complete',
+                'increased_bids': 3,
+                'decreased_bids': 2,
+                'unchanged_bids': 5,
+                'keywords_paused': 1,
+            },
+        )
+
+
+class DailyActionCountTests(SimpleTestCase):
+
+    def test_events_are_counted_by_day_and_action(self):
+        process_log = ModifierProcessLog(pk=1, adwords_campaign_id='123')
+        day = timezone.make_aware(datetime.datetime(2017, 6, 1, 12))
+        next_day = day + datetime.timedelta(days=1)
+        keyword_actions = mock.Mock()
+        keyword_actions.order_by.return_value.values_list.return_value.iterator.return_value = [
+            ('1', KeywordActionLog.ACTION_CHOICES.increased_cpc, 100, 200, day),
+            ('1', KeywordActionLog.ACTION_CHOICES.no_action, 200, 200, day),
+            ('2', KeywordActionLog.ACTION_CHOICES.no_action, 100, 100, day),
+            ('3', KeywordActionLog.ACTION_CHOICES.paused, 100, 100, next_day),
+        ]
+
+        with mock.patch.object(KeywordActionLog.objects, 'filter', return_value=keyword_actions), \
+                mock.patch.object(KeywordEvent.objects, 'bulk_create'), \
+                mock.patch.object(DailyActionCount, 'add') as add:
+            process_log.de_normalise_logs()
+
+        add.assert_called_once_with('123', {
+            (day.date(), KeywordActionLog.ACTION_CHOICES.increased_cpc): 1,
+            (day.date(), KeywordActionLog.ACTION_CHOICES.no_action): 1,
+            (next_day.date(), KeywordActionLog.ACTION_CHOICES.paused): 1,
+        })
+
+
+class ModifierProfileTests(SimpleTestCase):
+
+    def setUp(self):
+        process_log = ModifierProcessLog()
+        process_log.modified_keyword_ids = set()
+        process_log.keyword_action_log_writer = mock.Mock()
+        self.modifier_log = ModifierLog(modifier_process_log=process_log)
+
+    def test_logged_keywords_are_counted(self):
+        self.modifier_log.log_paused_keyword(1, 100)
+        self.modifier_log.log_increased_keyword_cpc(2, 100, 200)
+        self.modifier_log.log_ignored_keyword(3, 100)
+
+        self.assertEqual(self.modifier_log.keywords_evaluated, 3)
+        self.assertEqual(self.modifier_log.keywords_mutated, 2)
+
+    def test_repeated_keyword_ids_are_modified_once(self):
+        # As the modifiers did one keyword at a time, a keyword id
+        # modified under one ad group is skipped under the next.
+        adapter = FakeAdapter([
+            make_keyword(id=5, ad_group_id=10, cost=10 ** 7),
+            make_keyword(id=5, ad_group_id=20, cost=10 ** 7),
+        ])
+        columns = adapter.get_keywords_columnar()
+        modifier = ZeroClicks()
+        decisions = engine.zero_clicks(
+            columns, 10 ** 6, modifier.get_skip_filter(self.modifier_log.modifier_process_log))
+
+        modifier.apply_decisions(adapter, columns, decisions, self.modifier_log)
+
+        self.assertEqual(adapter.mutations, [('paused', 10, 5)])
+        self.assertEqual(self.modifier_log.keywords_evaluated, 2)
+        self.assertEqual(self.modifier_log.keywords_mutated, 1)
+
+    def test_api_usage_is_totalled(self):
+        self.modifier_log.set_profile(
+            [
+                {'kind': 'report', 'calls': 1, 'seconds': 2.5, 'bytes': 1000},
+                {'kind': 'mutate', 'calls': 3, 'seconds': 1.0, 'bytes': 0},
+                {'kind': 'service', 'calls': 1, 'seconds': 4.0, 'bytes': 0},
+                {'kind': 'cache', 'calls': 2, 'seconds': 0.5, 'bytes': 3000},
+            ],
+            db_queries=7,
+            db_seconds=0.5,
+        )
+
+        self.assertEqual(self.modifier_log.api_calls, 4)
+        self.assertEqual(self.modifier_log.api_seconds, 3.5)
+        self.assertEqual(self.modifier_log.report_bytes, 1000)
+        self.assertEqual(self.modifier_log.db_queries, 7)
+
+    def test_query_counter_counts_failed_queries(self):
+        counter = QueryCounter()
+        counter(lambda *args: 'rows', 'SELECT 1', (), False, {})
+        with self.assertRaises(ValueError):
+            counter(mock.Mock(side_effect=ValueError), 'SELECT 1', (), False, {})
+
+        self.assertEqual(counter.count, 2)
+
+
+class BenchmarkTests(SimpleTestCase):
+
+    def test_synthetic_report_reads_as_keywords(self):
+        with tempfile.TemporaryDirectory() as fixtures_dir:
+            path = os.path.join(fixtures_dir, 'keywords.csv.gz')
+            benchmark.write_keywords_report(path, 123, 200)
+
+            user = SimpleNamespace(client_customer_id='123', is_adwords_dry_run=False)
+            adapter = benchmark.LocalAdapter(user, {'KEYWORDS_PERFORMANCE_REPORT': path})
+            keywords = list(adapter.get_keywords_columnar().rows())
+
+        self.assertEqual(len(keywords), 200)
+        self.assertEqual({keyword['campaign_id'] for keyword in keywords}, {123})
+        # The first ad group is one with no enabled keywords.
+        self.assertEqual(
+            {keyword['status'] for keyword in keywords[:benchmark.KEYWORDS_PER_AD_GROUP]},
+            {'paused'},
+        )
+
+    def test_mutations_are_recorded(self):
+        user = SimpleNamespace(client_customer_id='123', is_adwords_dry_run=False)
+        adapter = benchmark.LocalAdapter(user, {})
+
+        with adapter.keyword_mutations():
+            adapter.set_keyword_paused(1, 10)
+            adapter.set_keyword_max_cpc(1, 11, 500000)
+        adapter.set_ad_groups_paused([2])
+
+        self.assertEqual(adapter.mutations.requests, 2)
+        self.assertEqual(adapter.mutations.operations, 3)
+
+    def get_result(self, **values):
+        result = {
+            'chain': 'cpa',
+            'keywords': 1000,
+            'wall_seconds': 1.0,
+            'peak_rss_mb': 100.0,
+            'db_queries': 10,
+            'api_calls': 5,
+            'stages': [{'name': 'zc', 'db_queries': 2, 'api_calls': 1}],
+        }
+        result.update(values)
+        return result
+
+    def test_compare_to_baseline(self):
+        baseline = [self.get_result()]
+
+        self.assertEqual(benchmark.compare_to_baseline(
+            [self.get_result(wall_seconds=1.2, peak_rss_mb=110.0)], baseline, 0.25), [])
+        self.assertEqual(
+            benchmark.compare_to_baseline([self.get_result(keywords=10)], baseline, 0.25), [])
+
+        regressions = benchmark.compare_to_baseline(
+            [self.get_result(
+                wall_seconds=1.5,
+                stages=[{'name': 'zc', 'db_queries': 3, 'api_calls': 1}],
+            )],
+            baseline,
+            0.25,
+        )
+        self.assertEqual(regressions, [
+            'cpa chain, 1000 keywords: wall_seconds rose from 1.0 to 1.5',
+            'cpa chain, 1000 keywords, zc: db_queries rose from 2 to 3',
+        ])
+
+
+class DiscardFailedMutationsTests(TestCase):
+
+    def test_rejected_keywords_are_logged_as_left_alone(self):
+        process_log = ModifierProcessLog.objects.create(
+            adwords_campaign_id='1', is_dry_run=False, parameters={})
+        modifier_log = process_log.start_modifier_log('Zero clicks')
+        modifier_log.log_paused_keyword(5, 100, ad_group_id=10)
+        modifier_log.log_increased_keyword_cpc(6, 100, 200, ad_group_id=10)
+        modifier_log.log_decreased_keyword_cpc(7, 100, 50, ad_group_id=10)
+        process_log.flush_keyword_action_logs()
+
+        modifier_log.discard_failed_mutations([
+            KeywordMutationFailure(10, 5, '', 'INVALID_KEYWORD'),
+            KeywordMutationFailure(10, 6, '', 'INVALID_KEYWORD'),
+        ])
+
+        self.assertEqual(
+            dict(modifier_log.keyword_action_logs.values_list('adwords_keyword_id', 'action')),
+            {'5': 'no_action', '6': 'no_action', '7': 'decreased_cpc'},
+        )
+        self.assertEqual(modifier_log.keyword_action_logs.get(adwords_keyword_id='6').new_max_cpc, 100)
+        self.assertEqual(modifier_log.keywords_mutated, 1)
+        self.assertEqual(process_log.modified_keyword_ids, {'7'})
+
+    def test_rejections_in_other_ad_groups_are_left_alone(self):
+        process_log = ModifierProcessLog.objects.create(
+            adwords_campaign_id='1', is_dry_run=False, parameters={})
+        modifier_log = process_log.start_modifier_log('Zero clicks')
+        modifier_log.log_increased_keyword_cpc(5, 100, 200, ad_group_id=10)
+        process_log.flush_keyword_action_logs()
+
+        modifier_log.discard_failed_mutations([KeywordMutationFailure(11, 5, '', 'INVALID_KEYWORD')])
+
+        self.assertEqual(modifier_log.keyword_action_logs.get().action, 'increased_cpc')
+        self.assertEqual(modifier_log.keywords_mutated, 1)
+        self.assertEqual(process_log.modified_keyword_ids, {'5'})
+
+
+class ScriptRunStatusTests(TestCase):
+
+    def test_runs_are_listed_from_their_start(self):
+        process_log = ModifierProcessLog(
+            adwords_campaign_id='123', is_dry_run=False, parameters={'cycle_period': 30})
+
+        process_log.set_running()
+
+        script_run = ScriptRun.objects.get(modifier_process_log=process_log)
+        self.assertEqual(script_run.status, ScriptRun.STATUS_CHOICES.running)
+        self.assertEqual(script_run.cycle_period, 30)
+
+        process_log.set_failed('Traceback')
+
+        script_run.refresh_from_db()
+        self.assertEqual(script_run.status, ScriptRun.STATUS_CHOICES.failed)
+        self.assertEqual(script_run.increased_bids, 0)
+
+
+class BenchmarkRunTests(TestCase):
+
+    @mock.patch('accounts.tasks.alert_user_registered.apply_async')
+    def test_chains_run_against_the_database(self, alert_user_registered):
+        with tempfile.TemporaryDirectory() as fixtures_dir:
+            adwords_campaign_id, reports = benchmark.get_fixture_paths(fixtures_dir, 1000)
+
+            for conversion_type in (Campaign.CONVERSION_TYPE_CPA, Campaign.CONVERSION_TYPE_MARGIN):
+                campaign = benchmark.get_benchmark_campaign(adwords_campaign_id, conversion_type)
+                modifiers = get_campaign_modifiers(campaign)
+                adapter = benchmark.LocalAdapter(campaign.owner, reports)
+
+                result = benchmark.run_benchmark(campaign, modifiers, adapter)
+
+                self.assertEqual(len(result['stages']), len(modifiers))
+                self.assertGreater(result['mutate_operations'], 0)
+                self.assertEqual(
+                    sum(stage['keywords_mutated'] for stage in result['stages']),
+                    KeywordActionLog.objects.get_modified().count(),
+                )
+                self.assertTrue(ScriptRun.objects.filter(
+                    adwords_campaign_id=adwords_campaign_id).exists())
+
+
+class FakeManager:
+
+    def __init__(self):
+        self.batches = []
+
+    def bulk_create(self, instances, batch_size=None):
+        self.batches.append(list(instances))
+
+
+class BulkCreateBufferTests(SimpleTestCase):
+
+    def setUp(self):
+        self.model = SimpleNamespace(objects=FakeManager())
+        self.writer = BulkCreateBuffer(self.model, batch_size=3)
+
+    def test_writes_full_batches_as_they_fill(self):
+        for instance in range(7):
+            self.writer.add(instance)
+
+        self.assertEqual(self.model.objects.batches, [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(len(self.writer), 1)
+
+        self.writer.flush()
+        self.writer.flush()
+
+        self.assertEqual(self.model.objects.batches, [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(self.writer.write_count, 7)
+
+
+class ScheduledRunLogTests(SimpleTestCase):
+
+    def test_set_complete_orders_campaigns_slowest_first(self):
+        scheduled_run = ScheduledRunLog(campaign_count=3)
+
+        with mock.patch.object(ScheduledRunLog, 'save') as save:
+            scheduled_run.set_complete([
+                {'campaign_id': 1, 'status': 'complete', 'duration': 1.5},
+                {'campaign_id': 2, 'status': 'failed', 'duration': 9.25},
+                {'campaign_id': 3, 'status': 'skipped', 'duration': 0},
+            ])
+
+        save.assert_called_once_with()
+        self.assertEqual(scheduled_run.status, ScheduledRunLog.STATUS_CHOICES.complete)
+        self.assertEqual(
+            [campaign_run['campaign_id'] for campaign_run in scheduled_run.campaign_runs],
+            [2, 1, 3],
+        )
+        self.assertEqual(scheduled_run.failed_count, 1)
+        self.assertIsNotNone(scheduled_run.duration)
+
+
+class CustomerSemaphoreTests(SimpleTestCase):
+
+    def test_held_slot_is_renewed_until_released(self):
+        connection = mock.Mock()
+        connection.eval.return_value = 1
+        semaphore = CustomerSemaphore('123', limit=2, lease=0.03, connection=connection)
+        self.assertTrue(semaphore.acquire())
+        token = semaphore.token
+
+        with semaphore.held():
+            time.sleep(0.1)
+
+        renewals = [
+            call[0] for call in connection.eval.call_args_list if call[0][0] == RENEW_SCRIPT]
+        self.assertTrue(renewals)
+        self.assertTrue(all(renewal[4] == token for renewal in renewals))
+        connection.zrem.assert_called_once_with(semaphore.key, token)
+        self.assertFalse(semaphore.renew())
+
+
+class RunCampaignModifiersTests(SimpleTestCase):
+
+    def setUp(self):
+        owner = SimpleNamespace(client_customer_id='123')
+        self.campaign = SimpleNamespace(pk=1, adwords_campaign_id='10', owner=owner)
+
+    def test_campaign_is_run_holding_its_customer_slot(self):
+        with mock.patch.object(Campaign.objects, 'select_related') as select_related, \
+                mock.patch.object(CustomerSemaphore, 'acquire', return_value=True), \
+                mock.patch.object(CustomerSemaphore, 'held') as held, \
+                mock.patch('campaign_modifiers.tasks.run_modifiers', return_value='complete') as run:
+            select_related.return_value.get.return_value = self.campaign
+            campaign_run = run_campaign_modifiers(1)
+
+        held.assert_called_once_with()
+        run.assert_called_once_with(self.campaign)
+        self.assertEqual(campaign_run['status'], 'complete')
+        self.assertEqual(campaign_run['client_customer_id'], '123')
+
+    def test_busy_customer_is_retried(self):
+        with mock.patch.object(Campaign.objects, 'select_related') as select_related, \
+                mock.patch.object(CustomerSemaphore, 'acquire', return_value=False), \
+                mock.patch.object(run_campaign_modifiers, 'retry', side_effect=Retry) as retry, \
+                mock.patch('campaign_modifiers.tasks.run_modifiers') as run:
+            select_related.return_value.get.return_value = self.campaign
+            with self.assertRaises(Retry):
+                run_campaign_modifiers(1)
+
+        retry.assert_called_once_with(countdown=settings.CAMPAIGN_MODIFIERS_RETRY_DELAY)
+        run.assert_not_called()
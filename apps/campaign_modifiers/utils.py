@@ -1,7 +1,19 @@
 from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
 from datetime import date, datetime, time, timedelta, timezone
+from time import monotonic
 import traceback
+from types import MappingProxyType
 
+from django.db import connection
+
+import numpy as np
+
+from adwords.adapter import ALL_TIME
+from adwords.columnar import MISSING
+from adwords.instrumentation import instrumentation
+
+from . import engine
 from .models import ModifierProcessLog
 
 
@@ -34,12 +46,254 @@ class ModifierBase(metaclass=ABCMeta):
             'max': self.format_date(get_utc_now()),
         }
 
+    def get_skip_filter(self, modifier_process_log):
+        """
+        Return a function that takes an array of keyword ids and
+        returns an array of which of them should be skipped.
+        """
+        def is_skipped(keyword_ids):
+            if modifier_process_log is None or not modifier_process_log.modified_keyword_ids:
+                return np.zeros(len(keyword_ids), dtype=bool)
+
+            modified_keyword_ids = np.fromiter(
+                map(int, modifier_process_log.modified_keyword_ids),
+                dtype=np.int64,
+                count=len(modifier_process_log.modified_keyword_ids),
+            )
+            return np.isin(keyword_ids, modified_keyword_ids)
+
+        return is_skipped
+
+    def apply_decisions(
+            self, api_adapter, columns, decisions, log, keyword_data=(), **modifier_data):
+        """
+        Send the keyword mutations in `decisions` and log every keyword
+        considered.  Each keyword's `modifier_data` is `modifier_data`
+        and the decisions' context, plus its `max_cpc` and the columns
+        named in `keyword_data`.
+        """
+        modifier_data.update(decisions.context)
+        modifier_process_log = None if log is None else log.modifier_process_log
+
+        for index, action, mutate, new_max_cpc in decisions:
+            keyword_id = columns.id[index]
+            ad_group_id = columns.ad_group_id[index]
+
+            # Keyword ids repeat across ad groups, so one the skip
+            # filter let through may have been modified earlier in this
+            # loop, under another ad group.
+            if mutate and modifier_process_log is not None and \
+                    modifier_process_log.was_keyword_modified(keyword_id):
+                action, mutate = engine.NO_ACTION, False
+
+            max_cpc = columns.max_cpc[index]
+            if max_cpc == MISSING:
+                max_cpc = None
+
+            keyword_modifier_data = dict(modifier_data, max_cpc=max_cpc)
+            for name in keyword_data:
+                keyword_modifier_data[name] = getattr(columns, name)[index]
+
+            if mutate:
+                if action == engine.PAUSED:
+                    api_adapter.set_keyword_paused(ad_group_id, keyword_id)
+                else:
+                    keyword_modifier_data['new_max_cpc'] = new_max_cpc
+                    api_adapter.set_keyword_max_cpc(ad_group_id, keyword_id, new_max_cpc)
+
+            if log is None:
+                continue
+
+            log_values = {'modifier_data': keyword_modifier_data, 'ad_group_id': ad_group_id}
+            if action == engine.PAUSED:
+                log.log_paused_keyword(keyword_id, max_cpc, **log_values)
+            elif action == engine.INCREASED_CPC:
+                log.log_increased_keyword_cpc(keyword_id, max_cpc, new_max_cpc, **log_values)
+            elif action == engine.DECREASED_CPC:
+                log.log_decreased_keyword_cpc(keyword_id, max_cpc, new_max_cpc, **log_values)
+            else:
+                log.log_ignored_keyword(keyword_id, max_cpc, **log_values)
+
+
+class QueryCounter:
+    """
+    A database execute wrapper counting the queries made, and the time
+    they took, while it is installed.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += monotonic() - start
+
+
+class ReportCache:
+    """
+    Wraps an adapter for the length of a single `ModifierProcess` run,
+    so that modifiers asking for the same keywords report (same
+    report type, selector and date range) share one download.
+
+    Each report is held as `KeywordColumns`, handed to modifiers
+    either as is or as a tuple of read-only keyword rows; neither may
+    be changed by the modifier.  Keyword mutations made through the
+    cache are applied to the cached report, so modifiers later in the
+    run see the new `max_cpc` and status, and undone again if they were
+    batched by `keyword_mutations` and the API rejected them.  Anything
+    else is passed straight through to the wrapped adapter.
+    """
+    report_type = 'KEYWORDS_PERFORMANCE_REPORT'
+
+    def __init__(self, api_adapter):
+        self._api_adapter = api_adapter
+        self._keyword_sets = {}
+        # The values batched mutations replaced, by keyword, then
+        # keyword set, then column, until the batch has been sent.
+        self._original_values = None
+
+    def __getattr__(self, name):
+        return getattr(self._api_adapter, name)
+
+    def _get_key(self, predicates, date_range):
+        selector, date_range_type = self._api_adapter.get_keyword_selector(
+            predicates, date_range)
+        return (
+            self.report_type,
+            self._api_adapter.normalise_selector(selector),
+            date_range_type,
+        )
+
+    def _get_keyword_set(self, key, fetch):
+        try:
+            return self._keyword_sets[key]
+        except KeyError:
+            columns = fetch()
+            keyword_set = self._keyword_sets[key] = {
+                'columns': columns,
+                # Keyword ids are only unique within an ad group.
+                'index': {
+                    key: position
+                    for position, key in enumerate(zip(columns.ad_group_id, columns.id))
+                },
+                'rows': None,
+            }
+            return keyword_set
+
     @staticmethod
-    def should_skip_keyword(adwords_keyword_id, modifier_process_log):
-        if modifier_process_log is None:
-            return False
+    def _get_rows(keyword_set):
+        if keyword_set['rows'] is None:
+            keyword_set['rows'] = [
+                MappingProxyType(keyword) for keyword in keyword_set['columns'].rows()]
+
+        return tuple(keyword_set['rows'])
+
+    def _get_campaign_keyword_set(self, adwords_campaign_id, date_range):
+        return self._get_keyword_set(
+            self._get_key({'BaseCampaignId': adwords_campaign_id}, date_range),
+            lambda: self._api_adapter.get_keyword_columns_for_campaign(
+                adwords_campaign_id, date_range),
+        )
+
+    def get_keywords(self, predicates=None, enabled_only=False, date_range=ALL_TIME):
+        return self._get_rows(self._get_keyword_set(
+            self._get_key(predicates, date_range),
+            lambda: self._api_adapter.get_keywords_columnar(predicates, date_range),
+        ))
+
+    def get_keywords_for_campaign(
+            self, adwords_campaign_id, enabled_only=False, date_range=ALL_TIME):
+        return self._get_rows(self._get_campaign_keyword_set(adwords_campaign_id, date_range))
+
+    def get_keyword_columns_for_campaign(self, adwords_campaign_id, date_range=ALL_TIME):
+        return self._get_campaign_keyword_set(adwords_campaign_id, date_range)['columns']
+
+    @staticmethod
+    def _set_values(keyword_set, position, values):
+        """
+        Set the column `values` of the keyword at `position`, with
+        `status` as its code, and its row if the rows have been made.
+        """
+        columns = keyword_set['columns']
+        for name, value in values.items():
+            getattr(columns, name)[position] = value
+
+        rows = keyword_set['rows']
+        if rows is not None:
+            keyword = dict(rows[position])
+            for name, value in values.items():
+                if name == 'status':
+                    value = columns.status_categories[value]
+                elif value == MISSING:
+                    value = None
+                keyword[name] = value
+            rows[position] = MappingProxyType(keyword)
+
+    def _update_keyword(self, ad_group_id, keyword_id, **values):
+        key = (int(ad_group_id), int(keyword_id))
+        for set_key, keyword_set in self._keyword_sets.items():
+            try:
+                position = keyword_set['index'][key]
+            except KeyError:
+                continue
+
+            columns = keyword_set['columns']
+            column_values = dict(values)
+            if 'status' in values:
+                column_values['status'] = columns.encode_status(values['status'])
 
-        return modifier_process_log.was_keyword_modified(adwords_keyword_id)
+            if self._original_values is not None:
+                original_values = self._original_values \
+                    .setdefault(key, {}) \
+                    .setdefault(set_key, {})
+                for name in column_values:
+                    original_values.setdefault(name, getattr(columns, name)[position])
+
+            self._set_values(keyword_set, position, column_values)
+
+    def _revert_keywords(self, failures, original_values):
+        for failure in failures:
+            key = (int(failure.ad_group_id), int(failure.keyword_id))
+            for set_key, values in original_values.get(key, {}).items():
+                keyword_set = self._keyword_sets[set_key]
+                self._set_values(keyword_set, keyword_set['index'][key], values)
+
+    @contextmanager
+    def keyword_mutations(self):
+        """
+        As the adapter's `keyword_mutations`, then put the cached
+        keywords whose mutations the API rejected back as they were.
+        """
+        if self._original_values is not None:
+            with self._api_adapter.keyword_mutations() as mutations:
+                yield mutations
+            return
+
+        self._original_values = {}
+        try:
+            with self._api_adapter.keyword_mutations() as mutations:
+                yield mutations
+        finally:
+            original_values, self._original_values = self._original_values, None
+
+        self._revert_keywords(mutations.failures, original_values)
+
+    def set_keyword_max_cpc(self, ad_group_id, keyword_id, max_cpc):
+        result = self._api_adapter.set_keyword_max_cpc(ad_group_id, keyword_id, max_cpc)
+        self._update_keyword(ad_group_id, keyword_id, max_cpc=int(max_cpc))
+
+        return result
+
+    def set_keyword_paused(self, ad_group_id, keyword_id):
+        result = self._api_adapter.set_keyword_paused(ad_group_id, keyword_id)
+        self._update_keyword(ad_group_id, keyword_id, status='paused')
+
+        return result
 
 
 class ModifierProcess:
@@ -57,11 +311,15 @@ class ModifierProcess:
             raise self.DuplicateModifierProcessRunForCampaign(
                 'Campaign ID:  {campaign_id}'.format(campaign_id=campaign_id))
 
-        process_log = ModifierProcessLog.objects.create(
+        process_log = ModifierProcessLog(
             adwords_campaign_id=campaign_id,
             is_dry_run=is_dry_run,
             parameters=parameters,
         )
+        process_log.set_running()
+
+        # Modifiers share keyword reports for the rest of the run.
+        api_adapter = ReportCache(api_adapter)
 
         try:
             for modifier in modifiers:
@@ -76,6 +334,19 @@ class ModifierProcess:
     def run_modifier(self, modifier, api_adapter, process_log, campaign_id, **parameters):
         modifier_log = process_log.start_modifier_log(modifier.name)
 
-        modifier.run(api_adapter, campaign_id, log=modifier_log, **parameters)
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries), instrumentation.collect() as api_calls:
+            try:
+                # Keyword mutations are sent in batches once the modifier
+                # is done.
+                with instrumentation.modifier(modifier.name), \
+                        api_adapter.keyword_mutations() as mutations:
+                    modifier.run(api_adapter, campaign_id, log=modifier_log, **parameters)
+            finally:
+                # Keep the logs of whatever the modifier did before failing.
+                process_log.flush_keyword_action_logs()
+
+            modifier_log.discard_failed_mutations(mutations.failures)
 
+        modifier_log.set_profile(api_calls.summary(), queries.count, queries.seconds)
         modifier_log.set_complete()
@@ -0,0 +1,31 @@
+class BulkCreateBuffer:
+    """
+    Collects unsaved model instances and saves them with `bulk_create`
+    once `batch_size` are buffered, rather than with one INSERT each.
+    Anything still buffered is only saved by `flush`.
+    """
+
+    def __init__(self, model, batch_size):
+        self.model = model
+        self.batch_size = batch_size
+        self._instances = []
+        self.write_count = 0
+
+    def __len__(self):
+        return len(self._instances)
+
+    def add(self, instance):
+        self._instances.append(instance)
+        if len(self._instances) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        instances, self._instances = self._instances, []
+        if not instances:
+            return
+
+        # `batch_size` only bounds how many instances are buffered.
+        # `bulk_create` splits them into as many INSERTs as the database
+        # needs, which on SQLite is a few hundred rows each.
+        self.model.objects.bulk_create(instances)
+        self.write_count += len(instances)
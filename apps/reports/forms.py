@@ -103,3 +103,14 @@ class DateRangeForm(forms.Form):
             cleaned_data['should_aggregate'] = True
 
         return cleaned_data
+
+
+class KeywordFilterForm(forms.Form):
+    STATUS_CHOICES = (
+        ('', 'All keywords'),
+        ('enabled', 'Enabled'),
+        ('paused', 'Paused'),
+    )
+
+    q = forms.CharField(label='Keyword', max_length=255, required=False)
+    status = forms.ChoiceField(choices=STATUS_CHOICES, required=False)
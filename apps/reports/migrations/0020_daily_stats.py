@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.24 on 2026-10-18 11:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0019_auto_20170927_1349'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCampaignStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_customer_id', models.CharField(max_length=255)),
+                ('adwords_campaign_id', models.BigIntegerField()),
+                ('date', models.DateField()),
+                ('impressions', models.PositiveIntegerField()),
+                ('clicks', models.PositiveIntegerField()),
+                ('cost', models.BigIntegerField()),
+                ('conversions', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('click_assisted_conversions', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyKeywordStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_customer_id', models.CharField(max_length=255)),
+                ('adwords_campaign_id', models.BigIntegerField()),
+                ('ad_group_id', models.BigIntegerField()),
+                ('ad_group_name', models.CharField(max_length=255)),
+                ('keyword_id', models.BigIntegerField()),
+                ('keyword', models.CharField(max_length=255)),
+                ('status', models.CharField(max_length=50)),
+                ('max_cpc', models.BigIntegerField(null=True)),
+                ('date', models.DateField()),
+                ('impressions', models.PositiveIntegerField()),
+                ('clicks', models.PositiveIntegerField()),
+                ('cost', models.BigIntegerField()),
+                ('conversions', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('click_assisted_conversions', models.PositiveIntegerField()),
+                ('conversion_value', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('weighted_position', models.FloatField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MetricsSync',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_customer_id', models.CharField(max_length=255, unique=True)),
+                ('synced_through', models.DateField(blank=True, null=True)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailycampaignstats',
+            unique_together=set([('client_customer_id', 'adwords_campaign_id', 'date')]),
+        ),
+        migrations.AddIndex(
+            model_name='dailycampaignstats',
+            index=models.Index(fields=['client_customer_id', 'date'], name='reports_dai_client__d4c634_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailykeywordstats',
+            unique_together=set([('client_customer_id', 'ad_group_id', 'keyword_id', 'date')]),
+        ),
+        migrations.AddIndex(
+            model_name='dailykeywordstats',
+            index=models.Index(fields=['client_customer_id', 'adwords_campaign_id', 'date'], name='reports_dai_client__14bc1a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailykeywordstats',
+            index=models.Index(fields=['client_customer_id', 'date'], name='reports_dai_client__c0db29_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.24 on 2026-10-18 16:05
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+
+def merge_duplicate_campaigns(apps, schema_editor):
+    # Keep each owner's managed copy of a campaign if there is one, or
+    # else the oldest, and move anything pointing at the others to it.
+    Campaign = apps.get_model('reports', 'Campaign')
+    relations = [
+        relation for relation in Campaign._meta.related_objects
+        if relation.many_to_one or relation.one_to_one
+    ]
+
+    duplicates = Campaign.objects \
+        .values('adwords_campaign_id', 'owner') \
+        .annotate(copies=Count('pk')) \
+        .filter(copies__gt=1) \
+        .order_by()
+
+    for duplicate in duplicates.iterator():
+        campaign_ids = list(
+            Campaign.objects
+            .filter(
+                adwords_campaign_id=duplicate['adwords_campaign_id'],
+                owner=duplicate['owner'],
+            )
+            .order_by('-is_managed', 'pk')
+            .values_list('pk', flat=True)
+        )
+        kept_id, merged_ids = campaign_ids[0], campaign_ids[1:]
+
+        for relation in relations:
+            relation.related_model._base_manager \
+                .filter(**{relation.field.name + '__in': merged_ids}) \
+                .update(**{relation.field.name: kept_id})
+
+        Campaign.objects.filter(pk__in=merged_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('reports', '0020_daily_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_campaigns, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='campaign',
+            unique_together=set([('adwords_campaign_id', 'owner')]),
+        ),
+    ]
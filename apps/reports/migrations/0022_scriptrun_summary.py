@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.24 on 2026-10-18 16:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def delete_script_runs(apps, schema_editor):
+    # Nothing has written these; they couldn't be tied to a run.
+    ScriptRun = apps.get_model('reports', 'ScriptRun')
+    ScriptRun.objects.all().delete()
+
+
+def summarise_runs(apps, schema_editor):
+    ModifierProcessLog = apps.get_model('campaign_modifiers', 'ModifierProcessLog')
+    ScriptRun = apps.get_model('reports', 'ScriptRun')
+
+    def count(action):
+        return Count('keyword_events', filter=Q(keyword_events__action=action))
+
+    runs = ModifierProcessLog.objects \
+        .filter(status='complete') \
+        .annotate(
+            increased_bids=count('increased_cpc'),
+            decreased_bids=count('decreased_cpc'),
+            unchanged_bids=count('no_action'),
+            keywords_paused=count('paused'),
+        )
+
+    ScriptRun.objects.bulk_create(
+        (
+            ScriptRun(
+                modifier_process_log_id=run.pk,
+                adwords_campaign_id=run.adwords_campaign_id,
+                started_at=run.started_at,
+                cycle_period=run.parameters.get('cycle_period'),
+                increased_bids=run.increased_bids,
+                decreased_bids=run.decreased_bids,
+                unchanged_bids=run.unchanged_bids,
+                keywords_paused=run.keywords_paused,
+            )
+            for run in runs.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign_modifiers', '0011_modifierlog_profile'),
+        ('reports', '0021_campaign_unique_adwords_campaign_id_owner'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_script_runs, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='scriptrun',
+            name='adwords_campaign_id',
+            field=models.CharField(default=None, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='scriptrun',
+            name='cycle_period',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scriptrun',
+            name='modifier_process_log',
+            field=models.OneToOneField(default=None, on_delete=django.db.models.deletion.CASCADE, related_name='script_run', to='campaign_modifiers.ModifierProcessLog'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='scriptrun',
+            name='started_at',
+            field=models.DateTimeField(default=None),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='scriptrun',
+            index=models.Index(fields=['adwords_campaign_id', 'started_at'], name='reports_scr_adwords_e5e313_idx'),
+        ),
+        migrations.RunPython(summarise_runs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.24 on 2026-10-18 16:24
+from __future__ import unicode_literals
+
+from collections import Counter, defaultdict
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.timezone import localdate, now
+
+
+# The dashboard looks back at most this far.
+BACKFILL_DAYS = 28
+
+
+def count_recent_actions(apps, schema_editor):
+    Campaign = apps.get_model('reports', 'Campaign')
+    DailyActionCount = apps.get_model('reports', 'DailyActionCount')
+    KeywordEvent = apps.get_model('campaign_modifiers', 'KeywordEvent')
+
+    campaigns = defaultdict(list)
+    for campaign_id, owner_id, adwords_campaign_id in Campaign.objects.values_list(
+            'pk', 'owner_id', 'adwords_campaign_id'):
+        campaigns[adwords_campaign_id].append((campaign_id, owner_id))
+
+    events = KeywordEvent.objects \
+        .filter(created_at__gte=now() - datetime.timedelta(days=BACKFILL_DAYS)) \
+        .values_list('modifier_process_log__adwords_campaign_id', 'action', 'created_at')
+
+    counts = Counter()
+    for adwords_campaign_id, action, created_at in events.iterator():
+        counts[adwords_campaign_id, localdate(created_at), action] += 1
+
+    DailyActionCount.objects.bulk_create(
+        (
+            DailyActionCount(
+                campaign_id=campaign_id,
+                owner_id=owner_id,
+                date=date,
+                action=action,
+                count=count,
+            )
+            for (adwords_campaign_id, date, action), count in counts.items()
+            for campaign_id, owner_id in campaigns.get(adwords_campaign_id, ())
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('campaign_modifiers', '0011_modifierlog_profile'),
+        ('reports', '0022_scriptrun_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActionCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('action', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_action_counts', to='reports.Campaign')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dailyactioncount',
+            index=models.Index(fields=['owner', 'date'], name='reports_dai_owner_i_319b3d_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyactioncount',
+            unique_together=set([('campaign', 'date', 'action')]),
+        ),
+        migrations.RunPython(count_recent_actions, migrations.RunPython.noop),
+    ]
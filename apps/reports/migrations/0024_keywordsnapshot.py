@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.24 on 2026-10-18 17:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0023_dailyactioncount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='keywords_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='KeywordSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ad_group_id', models.BigIntegerField()),
+                ('ad_group_name', models.CharField(max_length=255)),
+                ('keyword_id', models.BigIntegerField()),
+                ('keyword', models.CharField(max_length=255)),
+                ('status', models.CharField(max_length=50)),
+                ('max_cpc', models.BigIntegerField(null=True)),
+                ('previous_max_cpc', models.BigIntegerField(null=True)),
+                ('max_cpc_modified_at', models.DateTimeField(null=True)),
+                ('conversion_rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keyword_snapshots', to='reports.Campaign')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='keywordsnapshot',
+            index=models.Index(fields=['campaign', 'keyword', 'id'], name='reports_key_campaig_02d2b1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='keywordsnapshot',
+            index=models.Index(fields=['campaign', 'ad_group_name', 'id'], name='reports_key_campaig_2a0476_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='keywordsnapshot',
+            index=models.Index(fields=['campaign', 'max_cpc', 'id'], name='reports_key_campaig_77eeec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='keywordsnapshot',
+            index=models.Index(fields=['campaign', 'previous_max_cpc', 'id'], name='reports_key_campaig_cc5356_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='keywordsnapshot',
+            index=models.Index(fields=['campaign', 'max_cpc_modified_at', 'id'], name='reports_key_campaig_1e0223_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='keywordsnapshot',
+            index=models.Index(fields=['campaign', 'conversion_rate', 'id'], name='reports_key_campaig_c43fee_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='keywordsnapshot',
+            unique_together=set([('campaign', 'ad_group_id', 'keyword_id')]),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.24 on 2026-10-18 16:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def add_unfinished_runs(apps, schema_editor):
+    # Only completed runs were summarised until now.
+    ModifierProcessLog = apps.get_model('campaign_modifiers', 'ModifierProcessLog')
+    ScriptRun = apps.get_model('reports', 'ScriptRun')
+
+    ScriptRun.objects.update(status='complete')
+
+    runs = ModifierProcessLog.objects \
+        .exclude(status='complete') \
+        .filter(script_run__isnull=True)
+
+    ScriptRun.objects.bulk_create(
+        (
+            ScriptRun(
+                modifier_process_log_id=run.pk,
+                adwords_campaign_id=run.adwords_campaign_id,
+                started_at=run.started_at,
+                cycle_period=run.parameters.get('cycle_period'),
+                status=run.status,
+            )
+            for run in runs.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign_modifiers', '0012_keywordactionlog_adwords_ad_group_id'),
+        ('reports', '0025_campaign_directory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scriptrun',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('complete', 'Complete'), ('failed', 'Failed')], default='running', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='scriptrun',
+            name='decreased_bids',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='scriptrun',
+            name='increased_bids',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='scriptrun',
+            name='keywords_paused',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='scriptrun',
+            name='unchanged_bids',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(add_unfinished_runs, migrations.RunPython.noop),
+    ]
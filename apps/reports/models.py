@@ -1,5 +1,6 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 
 from model_utils import Choices
 
@@ -56,13 +57,237 @@ class Campaign(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='campaigns')
     adwords_campaign_id = models.CharField(max_length=255)
 
-    # Denormalised from the API
+    # Denormalised from the API, for the campaign list.  `status` is
+    # blank if the campaign wasn't in the last campaigns report.
     title = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=50, blank=True)
+    budget = models.BigIntegerField(null=True, blank=True)
+    budget_name = models.CharField(max_length=255, blank=True)
+    click_assisted_conversions = models.PositiveIntegerField(default=0)
+    # When `keyword_snapshots` were last synced.
+    keywords_synced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Leads with `adwords_campaign_id`, so it also serves lookups of
+        # the API's campaigns.
+        unique_together = ('adwords_campaign_id', 'owner')
 
 
 class ScriptRun(models.Model):
+    """
+    A modifier run, for the campaign's runs table.  Saved as the run
+    starts and fails by its `ModifierProcessLog`, and given what the
+    run did to the campaign's keywords once, by
+    `ModifierProcessLog.summarise`, as it completes.
+    """
+    STATUS_CHOICES = Choices(
+        ('running', 'Running'),
+        ('complete', 'Complete'),
+        ('failed', 'Failed'),
+    )
+
+    modifier_process_log = models.OneToOneField(
+        'campaign_modifiers.ModifierProcessLog',
+        related_name='script_run',
+        on_delete=models.CASCADE,
+    )
+    adwords_campaign_id = models.CharField(max_length=255)
+    started_at = models.DateTimeField()
+    cycle_period = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
-    increased_bids = models.PositiveIntegerField()
-    decreased_bids = models.PositiveIntegerField()
-    unchanged_bids = models.PositiveIntegerField()
-    keywords_paused = models.PositiveIntegerField()
+    status = models.CharField(
+        max_length=50,
+        choices=STATUS_CHOICES,
+        default=STATUS_CHOICES.running,
+    )
+    increased_bids = models.PositiveIntegerField(default=0)
+    decreased_bids = models.PositiveIntegerField(default=0)
+    unchanged_bids = models.PositiveIntegerField(default=0)
+    keywords_paused = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['adwords_campaign_id', 'started_at']),
+        ]
+
+    def __str__(self):
+        return 'Run summary for campaign {}'.format(self.adwords_campaign_id)
+
+
+class DailyActionCount(models.Model):
+    """
+    How many keyword events of one action a campaign's modifier runs
+    recorded on a day, for the dashboard's counters.  Added to by
+    `ModifierProcessLog.de_normalise_logs` as each run completes.
+    """
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    campaign = models.ForeignKey(
+        Campaign,
+        related_name='daily_action_counts',
+        on_delete=models.CASCADE,
+    )
+    date = models.DateField()
+    action = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('campaign', 'date', 'action')
+        indexes = [
+            models.Index(fields=['owner', 'date']),
+        ]
+
+    @classmethod
+    def add(cls, adwords_campaign_id, counts):
+        """
+        Add `counts`, a dict of `(date, action)` to a number of keyword
+        events, to every campaign with `adwords_campaign_id`.
+        """
+        campaigns = Campaign.objects \
+            .filter(adwords_campaign_id=adwords_campaign_id) \
+            .values_list('pk', 'owner_id')
+        campaigns = list(campaigns)
+        if not campaigns or not counts:
+            return
+
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                [
+                    cls(campaign_id=campaign_id, owner_id=owner_id, date=date, action=action)
+                    for campaign_id, owner_id in campaigns
+                    for date, action in counts
+                ],
+                ignore_conflicts=True,
+            )
+
+            campaign_ids = [campaign_id for campaign_id, _ in campaigns]
+            for (date, action), count in counts.items():
+                cls.objects \
+                    .filter(campaign_id__in=campaign_ids, date=date, action=action) \
+                    .update(count=F('count') + count)
+
+
+class KeywordSnapshot(models.Model):
+    """
+    One of a campaign's keywords as the keywords report last had it,
+    with the latest bid change Captivise made to it, copied by the
+    `reports.sync_keyword_snapshots` task for the campaign's keywords
+    table.  Money is in micros.
+
+    Each column the table sorts by is indexed after the campaign, and
+    then by id to page through ties.
+    """
+    campaign = models.ForeignKey(
+        Campaign,
+        related_name='keyword_snapshots',
+        on_delete=models.CASCADE,
+    )
+    ad_group_id = models.BigIntegerField()
+    ad_group_name = models.CharField(max_length=255)
+    keyword_id = models.BigIntegerField()
+    keyword = models.CharField(max_length=255)
+    status = models.CharField(max_length=50)
+    max_cpc = models.BigIntegerField(null=True)
+    previous_max_cpc = models.BigIntegerField(null=True)
+    max_cpc_modified_at = models.DateTimeField(null=True)
+    conversion_rate = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        unique_together = ('campaign', 'ad_group_id', 'keyword_id')
+        indexes = [
+            models.Index(fields=['campaign', 'keyword', 'id']),
+            models.Index(fields=['campaign', 'ad_group_name', 'id']),
+            models.Index(fields=['campaign', 'max_cpc', 'id']),
+            models.Index(fields=['campaign', 'previous_max_cpc', 'id']),
+            models.Index(fields=['campaign', 'max_cpc_modified_at', 'id']),
+            models.Index(fields=['campaign', 'conversion_rate', 'id']),
+        ]
+
+
+class CampaignSync(models.Model):
+    """
+    When a user's campaigns were last copied from AdWords by
+    `reports.sync.sync_campaigns`, and when a copy was last queued.
+    """
+    owner = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        related_name='campaign_sync',
+        on_delete=models.CASCADE,
+    )
+    synced_at = models.DateTimeField(null=True, blank=True)
+    queued_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return 'Campaigns for user {}'.format(self.owner_id)
+
+
+class DailyCampaignStats(models.Model):
+    """
+    One day of a campaign's performance, copied from AdWords by the
+    `reports.sync_metrics` task.  Money is in micros.
+    """
+    client_customer_id = models.CharField(max_length=255)
+    adwords_campaign_id = models.BigIntegerField()
+    date = models.DateField()
+    impressions = models.PositiveIntegerField()
+    clicks = models.PositiveIntegerField()
+    cost = models.BigIntegerField()
+    conversions = models.DecimalField(max_digits=20, decimal_places=2)
+    click_assisted_conversions = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('client_customer_id', 'adwords_campaign_id', 'date')
+        indexes = [
+            models.Index(fields=['client_customer_id', 'date']),
+        ]
+
+
+class DailyKeywordStats(models.Model):
+    """
+    One day of a keyword's performance, copied from AdWords by the
+    `reports.sync_metrics` task.  Money is in micros, except
+    `conversion_value`.  `weighted_position` is the average position
+    times impressions, so positions can be averaged over several days.
+
+    AdWords leaves out keywords with no impressions on a day.
+    """
+    client_customer_id = models.CharField(max_length=255)
+    adwords_campaign_id = models.BigIntegerField()
+    ad_group_id = models.BigIntegerField()
+    ad_group_name = models.CharField(max_length=255)
+    keyword_id = models.BigIntegerField()
+    keyword = models.CharField(max_length=255)
+    status = models.CharField(max_length=50)
+    max_cpc = models.BigIntegerField(null=True)
+    date = models.DateField()
+    impressions = models.PositiveIntegerField()
+    clicks = models.PositiveIntegerField()
+    cost = models.BigIntegerField()
+    conversions = models.DecimalField(max_digits=20, decimal_places=2)
+    click_assisted_conversions = models.PositiveIntegerField()
+    conversion_value = models.DecimalField(max_digits=20, decimal_places=2)
+    weighted_position = models.FloatField()
+
+    class Meta:
+        unique_together = ('client_customer_id', 'ad_group_id', 'keyword_id', 'date')
+        indexes = [
+            models.Index(fields=['client_customer_id', 'adwords_campaign_id', 'date']),
+            models.Index(fields=['client_customer_id', 'date']),
+        ]
+
+
+class MetricsSync(models.Model):
+    """
+    How far each AdWords customer's daily stats have been copied.
+    """
+    client_customer_id = models.CharField(max_length=255, unique=True)
+    synced_through = models.DateField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return 'Metrics for {}'.format(self.client_customer_id)
@@ -0,0 +1,261 @@
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from campaign_modifiers.writers import BulkCreateBuffer
+
+from .models import (
+    Campaign,
+    CampaignSync,
+    DailyCampaignStats,
+    DailyKeywordStats,
+    KeywordSnapshot,
+    MetricsSync,
+)
+
+
+def get_sync_range(synced_through, today):
+    """
+    Return the first and last days still to be copied, or `None` if
+    there are none.  Today's data is incomplete, so is never copied.
+    """
+    date_to = today - datetime.timedelta(days=1)
+    if synced_through is None:
+        date_from = today - datetime.timedelta(days=settings.ADWORDS_METRICS_SYNC_INITIAL_DAYS)
+    else:
+        date_from = synced_through + datetime.timedelta(days=1)
+
+    if date_from > date_to:
+        return None
+
+    return date_from, date_to
+
+
+def _replace_stats(model, client_customer_id, date_from, date_to, rows):
+    model.objects.filter(
+        client_customer_id=client_customer_id,
+        date__range=(date_from, date_to),
+    ).delete()
+
+    writer = BulkCreateBuffer(model, settings.METRICS_SYNC_BATCH_SIZE)
+    for row in rows:
+        writer.add(model(client_customer_id=client_customer_id, **row))
+    writer.flush()
+
+
+def sync_customer_metrics(user, today=None):
+    """
+    Copy `user`'s daily campaign and keyword stats for the days not yet
+    copied, up to yesterday.  Each sync replaces its whole date range,
+    so a failed one can simply be run again.
+    """
+    from adwords.adapter import Adapter
+
+    client_customer_id = user.client_customer_id
+    metrics_sync, _ = MetricsSync.objects.get_or_create(client_customer_id=client_customer_id)
+
+    sync_range = get_sync_range(metrics_sync.synced_through, today or timezone.localdate())
+    if sync_range is None:
+        return
+
+    date_from, date_to = sync_range
+    adapter = Adapter(user)
+
+    try:
+        with transaction.atomic():
+            _replace_stats(
+                DailyCampaignStats,
+                client_customer_id,
+                date_from,
+                date_to,
+                adapter.get_daily_campaign_stats(date_from, date_to),
+            )
+            _replace_stats(
+                DailyKeywordStats,
+                client_customer_id,
+                date_from,
+                date_to,
+                adapter.get_daily_keyword_stats(date_from, date_to),
+            )
+    except Exception as e:
+        metrics_sync.error = str(e)
+        metrics_sync.save(update_fields=['error'])
+        raise
+
+    metrics_sync.synced_through = date_to
+    metrics_sync.last_synced_at = timezone.now()
+    metrics_sync.error = ''
+    metrics_sync.save()
+
+
+def _get_keyword_snapshots(campaign, keywords, latest_events):
+    for keyword in keywords:
+        try:
+            event = latest_events[str(keyword['id'])]
+        except KeyError:
+            previous_max_cpc = None
+            max_cpc_modified_at = None
+        else:  # noexcept
+            previous_max_cpc = event.previous_max_cpc
+            max_cpc_modified_at = event.created_at
+
+        yield KeywordSnapshot(
+            campaign=campaign,
+            ad_group_id=keyword['ad_group_id'],
+            ad_group_name=keyword['ad_group_name'],
+            keyword_id=keyword['id'],
+            keyword=keyword['keyword'],
+            status=keyword['status'],
+            max_cpc=keyword['max_cpc'],
+            previous_max_cpc=previous_max_cpc,
+            max_cpc_modified_at=max_cpc_modified_at,
+            conversion_rate=keyword['conversion_rate'],
+        )
+
+
+# The `KeywordSnapshot` fields copied from the report and events.
+SNAPSHOT_FIELDS = (
+    'ad_group_name',
+    'keyword',
+    'status',
+    'max_cpc',
+    'previous_max_cpc',
+    'max_cpc_modified_at',
+    'conversion_rate',
+)
+
+
+def _get_snapshot_values(snapshot):
+    # As they'd be saved, so a report's floats and the database's
+    # decimals compare equal.
+    return tuple(
+        KeywordSnapshot._meta.get_field(name).get_db_prep_save(getattr(snapshot, name), connection)
+        for name in SNAPSHOT_FIELDS
+    )
+
+
+def _save_keyword_snapshots(campaign, snapshots):
+    """
+    Make `campaign`'s stored snapshots match `snapshots`, writing only
+    the ones that were added or changed and deleting the ones that are
+    gone.
+    """
+    existing = {
+        (snapshot.ad_group_id, snapshot.keyword_id): snapshot
+        for snapshot in campaign.keyword_snapshots.all()
+    }
+
+    writer = BulkCreateBuffer(KeywordSnapshot, settings.KEYWORD_SNAPSHOT_SYNC_BATCH_SIZE)
+    changed = []
+    for snapshot in snapshots:
+        current = existing.pop((int(snapshot.ad_group_id), int(snapshot.keyword_id)), None)
+        if current is None:
+            writer.add(snapshot)
+        elif _get_snapshot_values(snapshot) != _get_snapshot_values(current):
+            snapshot.pk = current.pk
+            changed.append(snapshot)
+    writer.flush()
+
+    KeywordSnapshot.objects.bulk_update(
+        changed, SNAPSHOT_FIELDS, batch_size=settings.KEYWORD_SNAPSHOT_SYNC_BATCH_SIZE)
+    if existing:
+        KeywordSnapshot.objects \
+            .filter(pk__in=[snapshot.pk for snapshot in existing.values()]) \
+            .delete()
+
+
+def sync_keyword_snapshots(user):
+    """
+    Bring the keyword snapshots of each of `user`'s campaigns up to
+    date with the keywords as they are now, from one keywords report
+    for all of them, along with the latest bid change made to each
+    keyword.  Only snapshots that changed are written, and each
+    campaign's in a transaction of their own, so its keywords table
+    never shows half a sync.
+    """
+    from adwords.adapter import Adapter
+
+    campaigns = list(user.campaigns.all())
+    if not campaigns:
+        return
+
+    adapter = Adapter(user)
+    keywords = adapter.get_keywords_for_campaigns(
+        campaign.adwords_campaign_id for campaign in campaigns)
+
+    for campaign in campaigns:
+        campaign_keywords = list(keywords[int(campaign.adwords_campaign_id)].rows())
+        latest_events = adapter.get_latest_keyword_events(
+            keyword['id'] for keyword in campaign_keywords)
+
+        with transaction.atomic():
+            _save_keyword_snapshots(
+                campaign, _get_keyword_snapshots(campaign, campaign_keywords, latest_events))
+
+            Campaign.objects \
+                .filter(pk=campaign.pk) \
+                .update(keywords_synced_at=timezone.now())
+
+
+def sync_campaigns(user):
+    """
+    Copy each of `user`'s campaigns, with its status, budget and click
+    assisted conversions, from the campaigns and budgets reports to its
+    `Campaign`.  Campaigns no longer in the report are left with a blank
+    status, so they drop out of the campaign list.
+    """
+    from adwords.adapter import Adapter
+
+    campaign_sync, _ = CampaignSync.objects.get_or_create(owner=user)
+
+    try:
+        campaigns = Adapter(user).save_campaigns()
+        Campaign.objects \
+            .filter(owner=user) \
+            .exclude(pk__in=[campaign.pk for campaign in campaigns]) \
+            .update(status='')
+    except Exception as e:
+        campaign_sync.error = str(e)
+        campaign_sync.save(update_fields=['error'])
+        raise
+
+    campaign_sync.synced_at = timezone.now()
+    campaign_sync.error = ''
+    campaign_sync.save(update_fields=['synced_at', 'error'])
+
+
+def get_campaign_sync(user):
+    """
+    Return `user`'s `CampaignSync`, copying their campaigns first if
+    they never have been, as there is nothing to show until they are.
+    """
+    campaign_sync, _ = CampaignSync.objects.get_or_create(owner=user)
+    if campaign_sync.synced_at is None:
+        sync_campaigns(user)
+        campaign_sync.refresh_from_db()
+
+    return campaign_sync
+
+
+def claim_campaign_refresh(campaign_sync):
+    """
+    Return whether the campaigns were copied more than
+    `CAMPAIGN_SYNC_MAX_AGE` seconds ago and no copy has been queued
+    since, noting that one is being queued now, so that of the requests
+    seeing stale campaigns only one queues a copy.  A copy queued too
+    long ago to still be running may be queued again.
+    """
+    now = timezone.now()
+    stale_before = now - datetime.timedelta(seconds=settings.CAMPAIGN_SYNC_MAX_AGE)
+    if campaign_sync.synced_at >= stale_before:
+        return False
+
+    is_claimed = CampaignSync.objects \
+        .filter(pk=campaign_sync.pk) \
+        .filter(Q(queued_at__isnull=True) | Q(queued_at__lt=stale_before)) \
+        .update(queued_at=now)
+
+    return bool(is_claimed)
@@ -119,10 +119,11 @@ class KeywordTable(tables.Table):
 
 
 class RunTable(tables.Table):
-    created_at = tables.DateTimeColumn(verbose_name='Date / Time')
+    created_at = tables.DateTimeColumn(verbose_name='Date / Time', accessor='started_at')
+    status = tables.Column(verbose_name='Status')
     cycle_period = CyclePeriodColumn(verbose_name='Cycle Period')
-    bid_decrease_count = tables.Column(verbose_name='Bids Decreased')
-    bid_increase_count = tables.Column(verbose_name='Bids Increased')
-    paused_count = tables.Column(verbose_name='Keywords Paused')
-    no_change_count = tables.Column(verbose_name='Bids Unchanged')
+    bid_decrease_count = tables.Column(verbose_name='Bids Decreased', accessor='decreased_bids')
+    bid_increase_count = tables.Column(verbose_name='Bids Increased', accessor='increased_bids')
+    paused_count = tables.Column(verbose_name='Keywords Paused', accessor='keywords_paused')
+    no_change_count = tables.Column(verbose_name='Bids Unchanged', accessor='unchanged_bids')
     total_keyword_count = tables.Column(verbose_name='Total Keywords')
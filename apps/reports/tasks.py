@@ -1,7 +1,89 @@
+import logging
+
 from celery import shared_task
+from celery.task import task
 
 
 @shared_task
 def print_demo():
     # Demo to show periodic tasks are setup correctly
     print('PRINT DEMO')
+
+
+def _queue_for_linked_users(customer_task):
+    """
+    Queue `customer_task` with the pk of every user with a linked
+    AdWords account.
+    """
+    from accounts.models import User
+
+    users = User.objects \
+        .filter(refresh_token__isnull=False) \
+        .exclude(client_customer_id='') \
+        .values_list('pk', flat=True)
+
+    for user_pk in users:
+        customer_task.delay(user_pk)
+
+
+def _sync_user(sync_user, user_pk, description):
+    """
+    Call `sync_user` with the user `user_pk`, logging any error rather
+    than failing the task.
+    """
+    from accounts.models import User
+
+    try:
+        sync_user(User.objects.get(pk=user_pk))
+    except Exception:
+        logger = logging.getLogger('celery')
+        logger.exception('Failed to sync {description} for user {pk}'.format(
+            description=description, pk=user_pk))
+
+
+@task(name='reports.sync_metrics')
+def sync_metrics():
+    """
+    Queue `sync_customer_metrics` for every user with a linked AdWords
+    account.
+    """
+    _queue_for_linked_users(sync_customer_metrics)
+
+
+@task(name='reports.sync_customer_metrics')
+def sync_customer_metrics(user_pk):
+    from . import sync
+
+    _sync_user(sync.sync_customer_metrics, user_pk, 'metrics')
+
+
+@task(name='reports.sync_keyword_snapshots')
+def sync_keyword_snapshots():
+    """
+    Queue `sync_customer_keyword_snapshots` for every user with a
+    linked AdWords account.
+    """
+    _queue_for_linked_users(sync_customer_keyword_snapshots)
+
+
+@task(name='reports.sync_customer_keyword_snapshots')
+def sync_customer_keyword_snapshots(user_pk):
+    from . import sync
+
+    _sync_user(sync.sync_keyword_snapshots, user_pk, 'keyword snapshots')
+
+
+@task(name='reports.sync_campaigns')
+def sync_campaigns():
+    """
+    Queue `sync_customer_campaigns` for every user with a linked
+    AdWords account.
+    """
+    _queue_for_linked_users(sync_customer_campaigns)
+
+
+@task(name='reports.sync_customer_campaigns')
+def sync_customer_campaigns(user_pk):
+    from . import sync
+
+    _sync_user(sync.sync_campaigns, user_pk, 'campaigns')
@@ -0,0 +1,83 @@
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from adwords.adapter import Adapter
+from adwords.tests import make_user
+from campaign_modifiers.models import ModifierProcessLog
+
+from .models import Campaign
+
+
+# The stylesheets are built from Sass, so aren't there to compress.
+@override_settings(COMPRESS_ENABLED=False)
+class CampaignViewTestCase(TestCase):
+
+    def setUp(self):
+        user = make_user(
+            email='owner@example.com',
+            refresh_token='token',
+            client_customer_id='123',
+            is_freerolled=True,
+        )
+        self.client.force_login(user)
+
+        self.campaign = Campaign.objects.create(owner=user, adwords_campaign_id='1')
+
+        patcher = mock.patch.object(Adapter, 'get_campaign_metrics', return_value={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class CampaignKeywordViewTests(CampaignViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for keyword_id in range(25):
+            self.campaign.keyword_snapshots.create(
+                ad_group_id=1,
+                ad_group_name='Ad group',
+                keyword_id=keyword_id,
+                keyword='keyword {:02}'.format(keyword_id),
+                status='enabled',
+                conversion_rate=Decimal('1.00'),
+            )
+
+    def get_page(self, data=None):
+        return self.client.get(reverse('reports_campaign_detail', args=(self.campaign.pk, )), data)
+
+    def test_pages_link_to_each_other(self):
+        response = self.get_page({'sort': 'keyword'})
+
+        self.assertContains(response, 'keyword 19')
+        self.assertNotContains(response, 'keyword 20')
+        next_cursor = response.context['next_cursor']
+        self.assertContains(response, urlencode({'after': next_cursor}))
+
+        response = self.get_page({'sort': 'keyword', 'after': next_cursor})
+
+        self.assertContains(response, 'keyword 24')
+        self.assertNotContains(response, 'keyword 19')
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertContains(response, urlencode({'before': response.context['previous_cursor']}))
+
+
+class CampaignRunsViewTests(CampaignViewTestCase):
+
+    def test_unfinished_runs_are_listed(self):
+        for status in ('running', 'failed'):
+            ModifierProcessLog.objects.create(
+                adwords_campaign_id='1',
+                is_dry_run=False,
+                parameters={'cycle_period': 30},
+            ).save_script_run(status=status)
+
+        response = self.client.get(
+            reverse('reports_campaign_detail_runs', args=(self.campaign.pk, )))
+
+        self.assertEqual(len(response.context['runs'].rows), 2)
+        self.assertContains(response, 'Running')
+        self.assertContains(response, 'Failed')
@@ -2,23 +2,28 @@ from datetime import datetime, timedelta, timezone
 import simplejson
 
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core import signing
 from django.core.exceptions import SuspiciousOperation
 from django.urls import reverse
 from django.views.generic import DetailView, TemplateView, UpdateView
-from django.db import connection
+from django.db.models import F, Sum
+from django.utils.timezone import localdate
 
 from accounts.views import PaidAccountRequiredMixin
-from adwords.adapter import Adapter
-from campaign_modifiers.models import KeywordEvent, ModifierProcessLog
+from adwords.adapter import BACKEND_SYNCED, Adapter
+from campaign_modifiers.models import KeywordEvent
+from website.utils import get_keyset_page
 from website.views import ActiveMenuItemMixin
 
-from .forms import CampaignForm, DateRangeForm
-from .models import Campaign
+from .forms import CampaignForm, DateRangeForm, KeywordFilterForm
+from .models import Campaign, DailyActionCount, KeywordSnapshot, ScriptRun
+from .sync import claim_campaign_refresh, get_campaign_sync
 from .tables import (
     CampaignTable,
     KeywordTable,
     RunTable,
 )
+from .tasks import sync_customer_campaigns
 
 
 class DashboardView(
@@ -62,7 +67,7 @@ class DashboardView(
         context['chart_range'] = self.request.GET.get('chart_range', 'last30Days')
 
         adapter = Adapter(self.request.user)
-        kwargs = {'cast_dates': False}
+        kwargs = {'cast_dates': False, 'backend': BACKEND_SYNCED}
         if context['chart_range'] != 'allTime':
             kwargs['date_range'] = adapter.format_date_range(date_from, date_to)
 
@@ -79,24 +84,21 @@ class DashboardView(
         event_date_range = self.request.GET.get('range', 'today').lower()
         date_range_lengths = {'today': 1, 'week': 7, 'month': 28}
 
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT campaign_modifiers_keywordevent.action, COUNT(*) FROM campaign_modifiers_keywordevent INNER JOIN campaign_modifiers_modifierprocesslog ON campaign_modifiers_keywordevent.modifier_process_log_id=campaign_modifiers_modifierprocesslog.id INNER JOIN reports_campaign ON campaign_modifiers_modifierprocesslog.adwords_campaign_id=reports_campaign.adwords_campaign_id WHERE reports_campaign.owner_id = %s AND campaign_modifiers_keywordevent.created_at BETWEEN NOW() - INTERVAL %s DAY AND NOW() GROUP BY captivise.campaign_modifiers_keywordevent.action;", [self.request.user.id, date_range_lengths[event_date_range]])
-            events = cursor.fetchall()
-
-        increased = 0
-        decreased = 0
-        unchanged = 0
-        paused = 0
-
-        for event in events:
-            if event[0] == "increased_cpc":
-                increased = event[1]
-            if event[0] == "decreased_cpc":
-                decreased = event[1]
-            if event[0] == "no_action":
-                unchanged = event[1]
-            if event[0] == "paused":
-                paused = event[1]
+        # Summed from each campaign's daily counts, so the query is a
+        # short range of the owner's rows however many events there are.
+        events = DailyActionCount.objects \
+            .filter(
+                owner=self.request.user,
+                date__gt=localdate() - timedelta(days=date_range_lengths[event_date_range]),
+            ) \
+            .values('action') \
+            .annotate(total=Sum('count'))
+        counts = {event['action']: event['total'] for event in events}
+
+        increased = counts.get(KeywordEvent.ACTION_CHOICES.increased_cpc, 0)
+        decreased = counts.get(KeywordEvent.ACTION_CHOICES.decreased_cpc, 0)
+        unchanged = counts.get(KeywordEvent.ACTION_CHOICES.no_action, 0)
+        paused = counts.get(KeywordEvent.ACTION_CHOICES.paused, 0)
 
         context.update({
             'increased_bid_count': increased,
@@ -132,9 +134,21 @@ class CampaignListView(
 
         context['has_adwords_account'] = True
 
-        adapter = Adapter(self.request.user)
+        # Shown from the campaigns last copied from AdWords, so
+        # filtering, sorting and paging are left to the database.  If
+        # the copy is stale it is shown anyway while a fresh one is made.
+        campaign_sync = get_campaign_sync(self.request.user)
+        if claim_campaign_refresh(campaign_sync):
+            sync_customer_campaigns.delay(self.request.user.pk)
+
+        campaigns = self.request.user.campaigns.exclude(status='')
+
+        filter_by = self.request.GET.get('filter', '').lower()
+        if filter_by == 'managed':
+            campaigns = campaigns.filter(is_managed=True)
+        elif filter_by == 'unmanaged':
+            campaigns = campaigns.filter(is_managed=False)
 
-        filter_by = self.request.GET.get('filter', None)
         order_by = self.request.GET.get('sort', 'title')
         try:
             page = int(self.request.GET.get('page', 1))
@@ -142,13 +156,12 @@ class CampaignListView(
             # raise a 400
             raise SuspiciousOperation('Bad request:  GET parameter `page` is not an integer')
 
-        data = adapter.get_mapped_campaigns(filter_by=filter_by)
-
-        table = CampaignTable(data, order_by=order_by)
+        table = CampaignTable(campaigns, order_by=order_by)
         table.paginate(page=page, per_page=20)
 
         context.update({
             'campaigns': table,
+            'campaigns_synced_at': campaign_sync.synced_at,
         })
 
         return context
@@ -221,7 +234,11 @@ class BaseCampaignDetailView(BaseCampaignView):
         context['chart_range'] = self.request.GET.get('chart_range', 'thisWeek')
 
         adapter = Adapter(self.request.user)
-        kwargs = {'cast_dates': False, 'campaign_id': self.object.adwords_campaign_id}
+        kwargs = {
+            'cast_dates': False,
+            'campaign_id': self.object.adwords_campaign_id,
+            'backend': BACKEND_SYNCED,
+        }
         if context['chart_range'] != 'allTime':
             kwargs['date_range'] = adapter.format_date_range(date_from, date_to)
 
@@ -241,6 +258,11 @@ class BaseCampaignDetailView(BaseCampaignView):
 
 class CampaignKeywordView(BaseCampaignDetailView):
     template_name = 'reports/campaign/keywords.html'
+    paginate_by = 20
+
+    # The page links carry signed cursors, so they can't be forged into
+    # arbitrary filters.
+    cursor_salt = 'reports.CampaignKeywordView'
 
     def get_active_menu(self):
         active = super().get_active_menu()
@@ -251,6 +273,31 @@ class CampaignKeywordView(BaseCampaignDetailView):
 
         return active
 
+    def get_cursor(self, key, order_by):
+        if key is None:
+            return None
+
+        value, pk = key
+        return signing.dumps(
+            [order_by, None if value is None else str(value), pk], salt=self.cursor_salt)
+
+    def get_key(self, cursor, order_by):
+        """
+        Return the key a cursor from `get_cursor` was made from, or
+        `None` if it was made for another sort order.
+        """
+        try:
+            cursor_order_by, value, pk = signing.loads(cursor, salt=self.cursor_salt)
+        except (signing.BadSignature, TypeError, ValueError):
+            # raise a 400
+            raise SuspiciousOperation('Bad request:  GET parameter `after` or `before` is invalid')
+
+        if cursor_order_by != order_by:
+            return None
+
+        field = KeywordSnapshot._meta.get_field(order_by.lstrip('-'))
+        return field.to_python(value), pk
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
@@ -259,22 +306,49 @@ class CampaignKeywordView(BaseCampaignDetailView):
 
         context['has_adwords_account'] = True
 
-        adapter = Adapter(self.request.user)
-
-        data = adapter.get_mapped_keywords(self.object)
+        # Read from the campaign's snapshot of its keywords, so a page
+        # is one indexed query rather than a report download.
+        keywords = self.object.keyword_snapshots.values(
+            'id',
+            'ad_group_name',
+            'keyword',
+            'status',
+            'max_cpc',
+            'previous_max_cpc',
+            'max_cpc_modified_at',
+            'conversion_rate',
+        )
+
+        filter_form = KeywordFilterForm(self.request.GET)
+        if filter_form.is_valid():
+            if filter_form.cleaned_data['q']:
+                keywords = keywords.filter(keyword__icontains=filter_form.cleaned_data['q'])
+            if filter_form.cleaned_data['status']:
+                keywords = keywords.filter(status=filter_form.cleaned_data['status'])
 
         order_by = self.request.GET.get('sort', 'keyword')
-        try:
-            page = int(self.request.GET.get('page', 1))
-        except ValueError:
-            # raise a 400
-            raise SuspiciousOperation('Bad request:  GET parameter `page` is not an integer')
+        if order_by.lstrip('-') not in KeywordTable.base_columns:
+            order_by = 'keyword'
 
-        table = KeywordTable(data, order_by=order_by)
-        table.paginate(page=page, per_page=20)
+        after = before = None
+        if self.request.GET.get('before'):
+            before = self.get_key(self.request.GET['before'], order_by)
+        elif self.request.GET.get('after'):
+            after = self.get_key(self.request.GET['after'], order_by)
+
+        rows, previous_key, next_key = get_keyset_page(
+            keywords, order_by, self.paginate_by, after=after, before=before)
+
+        # The rows are already sorted; the table only marks the column.
+        table = KeywordTable(rows, order_by=order_by)
 
         context.update({
             'keywords': table,
+            'filter_form': filter_form,
+            'order_by': order_by,
+            'is_first_page': after is None and before is None,
+            'previous_cursor': self.get_cursor(previous_key, order_by),
+            'next_cursor': self.get_cursor(next_key, order_by),
         })
 
         return context
@@ -295,35 +369,21 @@ class CampaignRunsView(BaseCampaignDetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        runs = ModifierProcessLog.objects \
+        # Each run's counts were saved as it completed, so sorting and
+        # paging are left to the database.
+        runs = ScriptRun.objects \
             .filter(adwords_campaign_id=self.object.adwords_campaign_id) \
-            .order_by('-started_at') \
-            .prefetch_related('keyword_events')
-
-        data = []
-        for run in runs:
-            increased = run.keyword_events.filter(
-                action=KeywordEvent.ACTION_CHOICES.increased_cpc).count()
-            decreased = run.keyword_events.filter(
-                action=KeywordEvent.ACTION_CHOICES.decreased_cpc).count()
-            unchanged = run.keyword_events.filter(
-                action=KeywordEvent.ACTION_CHOICES.no_action).count()
-            paused = run.keyword_events.filter(action=KeywordEvent.ACTION_CHOICES.paused).count()
-
-            data.append({
-                'created_at': run.started_at,
-                'cycle_period': run.parameters.get('cycle_period', None),
-                'bid_increase_count': increased,
-                'bid_decrease_count': decreased,
-                'no_change_count': unchanged,
-                'paused_count': paused,
-                'total_keyword_count': sum((increased, decreased, unchanged, paused)),
-            })
+            .annotate(total_keyword_count=(
+                F('increased_bids') +
+                F('decreased_bids') +
+                F('unchanged_bids') +
+                F('keywords_paused')
+            ))
 
         order_by = self.request.GET.get('sort', '-created_at')
         page = self.request.GET.get('page', 1)
 
-        table = RunTable(data, order_by=order_by)
+        table = RunTable(runs, order_by=order_by)
         table.paginate(page=page, per_page=20)
 
         context.update({
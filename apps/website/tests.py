@@ -1,8 +1,10 @@
 from datetime import date
+from unittest import mock
 
+from django.db.models import Q
 from django.test import SimpleTestCase
 
-from website.utils import months_difference
+from website.utils import get_keyset_page, months_difference
 
 
 class UtilsTests(SimpleTestCase):
@@ -16,3 +18,64 @@ class UtilsTests(SimpleTestCase):
         self.assertEqual(months_difference(dec17, jan18), 1)
         self.assertEqual(months_difference(jan18, dec17), -1)
         self.assertEqual(months_difference(dec17, nov17), -1)
+
+
+class KeysetPageTests(SimpleTestCase):
+    rows = [
+        {'id': 1, 'max_cpc': None},
+        {'id': 2, 'max_cpc': 100},
+        {'id': 3, 'max_cpc': 200},
+    ]
+
+    def get_queryset(self, rows):
+        queryset = mock.MagicMock()
+        queryset.filter.return_value = queryset
+        queryset.order_by.return_value.__getitem__.return_value = rows
+        return queryset
+
+    def test_first_page(self):
+        queryset = self.get_queryset(self.rows)
+
+        rows, previous_key, next_key = get_keyset_page(queryset, 'max_cpc', 2)
+
+        queryset.filter.assert_not_called()
+        queryset.order_by.assert_called_once_with('max_cpc', 'pk')
+        self.assertEqual(rows, self.rows[:2])
+        self.assertIsNone(previous_key)
+        self.assertEqual(next_key, (100, 2))
+
+    def test_last_page(self):
+        queryset = self.get_queryset(self.rows[1:])
+
+        rows, previous_key, next_key = get_keyset_page(
+            queryset, '-max_cpc', 2, after=(300, 4))
+
+        queryset.filter.assert_called_once_with(
+            Q(max_cpc__lt=300) | Q(max_cpc=300, pk__lt=4) | Q(max_cpc__isnull=True))
+        queryset.order_by.assert_called_once_with('-max_cpc', '-pk')
+        self.assertEqual(rows, self.rows[1:])
+        self.assertEqual(previous_key, (100, 2))
+        self.assertIsNone(next_key)
+
+    def test_previous_page_is_read_backwards(self):
+        # Descending from the row after 3, so the rows before it come
+        # back lowest first.
+        queryset = self.get_queryset(self.rows[:2])
+
+        rows, previous_key, next_key = get_keyset_page(
+            queryset, 'max_cpc', 2, before=(200, 3))
+
+        queryset.filter.assert_called_once_with(
+            Q(max_cpc__lt=200) | Q(max_cpc=200, pk__lt=3) | Q(max_cpc__isnull=True))
+        queryset.order_by.assert_called_once_with('-max_cpc', '-pk')
+        self.assertEqual(rows, self.rows[1::-1])
+        self.assertIsNone(previous_key)
+        self.assertEqual(next_key, (None, 1))
+
+    def test_nulls_sort_first(self):
+        queryset = self.get_queryset([])
+
+        get_keyset_page(queryset, 'max_cpc', 2, after=(None, 1))
+
+        queryset.filter.assert_called_once_with(
+            Q(max_cpc__isnull=True, pk__gt=1) | Q(max_cpc__isnull=False))
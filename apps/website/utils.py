@@ -1,15 +1,19 @@
 import decimal
+from functools import lru_cache
 import json
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
 
 from googleads import oauth2, adwords
 
+import redis
+
 from .models import SiteConfig
 
 
-def get_adwords_client(refresh_token, client_customer_id=None):
+def get_adwords_client(refresh_token, client_customer_id=None, partial_failure=False):
     client_id = settings.ADWORDS_CLIENT_ID
     client_secret = settings.ADWORDS_SECRET_KEY
     developer_token = settings.ADWORDS_DEVELOPER_TOKEN
@@ -22,9 +26,15 @@ def get_adwords_client(refresh_token, client_customer_id=None):
         oauth2_client,
         user_agent,
         client_customer_id=client_customer_id,
+        partial_failure=partial_failure,
     )
 
 
+@lru_cache(maxsize=None)
+def get_redis_connection():
+    return redis.StrictRedis.from_url(settings.REDIS_URL)
+
+
 # See https://stackoverflow.com/a/1960649/930517
 class JSONDecimalEncoder(json.JSONEncoder):
 
@@ -52,3 +62,62 @@ def get_new_user_alert_email():
 
 def months_difference(date_from, date_to):
     return ((date_to.year * 12) + date_to.month) - ((date_from.year * 12) + date_from.month)
+
+
+def _get_keyset_filter(field, value, pk, descending):
+    # Rows after `(value, pk)`, with NULLs sorting before every value.
+    if descending:
+        if value is None:
+            return Q(**{field + '__isnull': True, 'pk__lt': pk})
+        return (
+            Q(**{field + '__lt': value}) |
+            Q(**{field: value, 'pk__lt': pk}) |
+            Q(**{field + '__isnull': True})
+        )
+
+    if value is None:
+        return Q(**{field + '__isnull': True, 'pk__gt': pk}) | Q(**{field + '__isnull': False})
+    return Q(**{field + '__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+
+
+def get_keyset_page(queryset, order_by, per_page, after=None, before=None):
+    """
+    Return `(rows, previous_key, next_key)`: a page of `per_page` rows
+    of `queryset`, a `values()` queryset including `id`, ordered by the
+    field `order_by` (descending if it starts with `-`) and then by id.
+
+    A key is the `(value, id)` of the row at one end of a page, or
+    `None` if there is no page beyond it.  Pass `after` for the page
+    following a key or `before` for the page preceding it.  Each page
+    is then a range read from an index on the field and id, however far
+    into the rows it is, where an offset would have the database read
+    every row before it.  NULLs sort first, as MySQL sorts them.
+    """
+    descending = order_by.startswith('-')
+    field = order_by.lstrip('-')
+    ordering = [order_by, '-pk' if descending else 'pk']
+
+    if before is not None:
+        reverse_ordering = [field if descending else '-' + field, 'pk' if descending else '-pk']
+        rows = list(
+            queryset
+            .filter(_get_keyset_filter(field, *before, descending=not descending))
+            .order_by(*reverse_ordering)[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        has_next = True
+        rows = rows[:per_page][::-1]
+    else:
+        if after is not None:
+            queryset = queryset.filter(_get_keyset_filter(field, *after, descending=descending))
+        rows = list(queryset.order_by(*ordering)[:per_page + 1])
+        has_previous = after is not None
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+
+    if not rows:
+        return rows, None, None
+
+    previous_key = (rows[0][field], rows[0]['id']) if has_previous else None
+    next_key = (rows[-1][field], rows[-1]['id']) if has_next else None
+    return rows, previous_key, next_key
@@ -203,6 +203,10 @@ FORM_RENDERER = 'django.forms.renderers.TemplatesSetting'
 BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 
+# State shared between workers, such as how many campaigns of each
+# customer are being modified.
+REDIS_URL = 'redis://localhost:6379/1'
+
 # http://docs.celeryproject.org/en/latest/userguide/periodic-tasks.html
 CELERYBEAT_SCHEDULE = {
     'campaign_modifiers.run_scripts': {
@@ -216,7 +220,19 @@ CELERYBEAT_SCHEDULE = {
     'accounts.check_card_expiries': {
         'task': 'accounts.check_card_expiries',
         'schedule': crontab(hour=5, minute=0),
-    }
+    },
+    'reports.sync_metrics': {
+        'task': 'reports.sync_metrics',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    'reports.sync_keyword_snapshots': {
+        'task': 'reports.sync_keyword_snapshots',
+        'schedule': crontab(minute=20),
+    },
+    'reports.sync_campaigns': {
+        'task': 'reports.sync_campaigns',
+        'schedule': crontab(minute=10),
+    },
 }
 
 
@@ -252,5 +268,74 @@ STATICFILES_FINDERS = (
 JSONFIELD_ENCODER_CLASS = 'website.utils.JSONDecimalEncoder'
 
 
+# AdWords client registry
+# Number of clients, and services built from them, kept per process.
+ADWORDS_CLIENT_REGISTRY_MAX_CLIENTS = 64
+ADWORDS_CLIENT_REGISTRY_MAX_SERVICES = 256
+
+# Whether Adapter.get_campaigns downloads the budgets report alongside
+# the campaigns report, in another thread, rather than after it.
+ADWORDS_FETCH_BUDGETS_IN_PARALLEL = True
+
+# Keyword operations sent per AdGroupCriterionService.mutate call.
+ADWORDS_MUTATE_BATCH_SIZE = 5000
+
+# AdWords API rate limits, shared by every worker through Redis at
+# REDIS_URL.  Rates are calls a second; bursts are how many calls can
+# be made at once after a quiet spell.
+ADWORDS_RATE_LIMIT_ENABLED = True
+ADWORDS_RATE_LIMIT_DEVELOPER_RATE = 20
+ADWORDS_RATE_LIMIT_DEVELOPER_BURST = 40
+ADWORDS_RATE_LIMIT_CUSTOMER_RATE = 5
+ADWORDS_RATE_LIMIT_CUSTOMER_BURST = 10
+# Retries of calls that failed on a rate limit or server error, and the
+# bounds in seconds of the exponential backoff between them.
+ADWORDS_RETRY_MAX_ATTEMPTS = 5
+ADWORDS_RETRY_BASE_DELAY = 1
+ADWORDS_RETRY_MAX_DELAY = 60
+
+# Reports Adapter.fetch_reports_concurrently downloads at once, per
+# process.
+ADWORDS_REPORT_CONCURRENCY = 8
+
+# Where a record of each AdWords API call goes: NullSink, LoggingSink
+# or any class in adwords.instrumentation's style.  Scheduled runs also
+# total each campaign's calls in its ScheduledRunLog.
+ADWORDS_INSTRUMENTATION_SINK = 'adwords.instrumentation.NullSink'
+
+# AdWords report cache, kept in Redis at REDIS_URL.
+ADWORDS_REPORT_CACHE_ENABLED = True
+# Hour (local time) from which the previous day's data is available.
+ADWORDS_REPORT_DATA_AVAILABLE_HOUR = 3
+# Compressed reports larger than this aren't cached.
+ADWORDS_REPORT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+# Seconds a report is kept at most, even once its data is final.
+ADWORDS_REPORT_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Daily campaign and keyword stats copied into the database.
+# Days copied the first time a customer is synced.
+ADWORDS_METRICS_SYNC_INITIAL_DAYS = 365
+# Daily stats rows saved per INSERT.
+METRICS_SYNC_BATCH_SIZE = 2000
+# Keyword snapshots, for the campaign keywords tables, saved per INSERT.
+KEYWORD_SNAPSHOT_SYNC_BATCH_SIZE = 2000
+# Seconds after which the campaign list, copied from AdWords, is copied
+# again in the background when it is next viewed.
+CAMPAIGN_SYNC_MAX_AGE = 15 * 60
+
+
+# Campaign modifiers
+# Keyword action logs, and the events made from them, saved per INSERT.
+KEYWORD_ACTION_LOG_BATCH_SIZE = 1000
+
+# Campaigns of one AdWords customer modified at once, and the seconds a
+# campaign waits before trying again when its customer is at the limit.
+CAMPAIGN_MODIFIERS_MAX_CONCURRENT_RUNS_PER_CUSTOMER = 2
+CAMPAIGN_MODIFIERS_RETRY_DELAY = 60
+# Seconds after which a run that stopped renewing its slot is forgotten.
+# A running one renews it every third of this.
+CAMPAIGN_MODIFIERS_RUN_LEASE = 10 * 60
+
+
 # Payment settings
 ECOM6_PAYMENT_MODEL = ('billing', 'Payment')